@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import yaml
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeincus
+
+fakeincus.install()
+
+import deploy
+
+BENCHMARKS = ["deploy", "waitForIPAddresses", "setForwardsPorts", "removeForwardPort", "destroy", "main", "main-dhcp"]
+NETWORK = "bench"
+LISTEN_ADDRESS = "45.45.148.200"
+NETWORK_CONFIG = {"ipv4.address": "10.10.0.1/16", "ipv6.address": "none"}
+
+def options(**kwargs) -> argparse.Namespace:
+    # Defaults of deploy.py's command line.
+    values = {"verbose": False, "force": False, "keepInstancesOnFailure": False, "resume": False, "apply": False, "plan": False, "reprovision": False, "test": False, "waitTimeout": 300, "all": False, "jobs": 4, "cache": False, "cacheMaxSize": None, "cacheList": False, "metrics": None, "metricsPrometheus": None, "trace": None, "pool": 0, "poolMaxAge": 86400, "placement": None, "placementRemotes": None, "portRange": deploy.AUTO_PORT_RANGE, "uniquePorts": False, "result": None, "poolFill": False, "purge": False, "label": None, "purgeAll": False, "remote": None, "project": None, "nic": "eth0", "parallel": deploy.PARALLEL_INSTANCES, "challengePath": []}
+    values.update(kwargs)
+    return argparse.Namespace(**values)
+
+def reset(args):
+    backend = fakeincus.install(latency=args.latency, dhcpDelay=args.dhcpDelay, bootDelay=args.bootDelay, ansibleDelay=args.ansibleDelay)
+    project = backend.project()
+    project.networks._networks[NETWORK] = fakeincus.Network(project, NETWORK, "bridge", "", NETWORK_CONFIG)
+
+    # Every size starts from empty caches and allocations, what an earlier one indexed or reserved is not reused.
+    deploy.session = deploy.Session()
+    deploy.tracer = deploy.Tracer()
+    deploy.ledger = deploy.Ledger()
+    deploy.addressManager = deploy.AddressManager()
+    deploy.portAllocator = deploy.PortAllocator()
+    deploy.scheduler = deploy.Scheduler()
+    deploy.imageCache = deploy.ImageCache()
+    deploy.warmPool = deploy.WarmPool()
+    deploy.results = deploy.Results()
+    deploy.configCache.clear()
+    deploy.EventMonitor.monitors.clear()
+
+    return backend
+
+def measure(backend: fakeincus.Backend, name: str, count: int, function) -> dict:
+    backend.reset()
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        with deploy.tracer.span("benchmark") as span:
+            function()
+
+    return {"benchmark": name, "instances": count, "seconds": round(span["duration"], 4), "calls": backend.calls, "polls": span["polls"], "counts": dict(sorted(backend.counts.items()))}
+
+def runFunctions(args, count: int) -> list:
+    # Every function is called once per instance, one after the other, the way a single pipeline stage would.
+    backend = reset(args)
+    deployArgs = options(waitTimeout=args.waitTimeout)
+    project = deploy.session.project("local", "default")
+    network = deploy.session.network(project, NETWORK)
+    names = [f"bench-{i:04d}" for i in range(count)]
+    instances = []
+
+    results = []
+    selected = lambda name: name in args.benchmarks
+
+    def deployAll():
+        for name in names:
+            instances.append(deploy.deploy(project, deployArgs, name=name, nameSource="ubuntu/22.04", remoteSource="images", network=network))
+
+    def waitAll():
+        for instance in instances:
+            deploy.waitForIPAddresses(project, instance=instance, remote="local", timeout=args.waitTimeout)
+
+    def forwardAll():
+        for i, instance in enumerate(instances):
+            deploy.setForwardsPorts(project, deployArgs, instance=instance, network=NETWORK, listenAddress=LISTEN_ADDRESS, forwards=[deploy.Config.Network.Forward(source=20000 + i, destination=80)])
+
+    def removeAll():
+        for instance in instances:
+            deploy.removeForwardPort(project, deployArgs, instance=instance)
+
+    def destroyAll():
+        for instance in instances:
+            deploy.destroy(project, deployArgs, instance=instance)
+
+    # Later functions need the instances of the earlier ones, skipped benchmarks still run but are not reported.
+    for name, function in [("deploy", deployAll), ("waitForIPAddresses", waitAll), ("setForwardsPorts", forwardAll), ("removeForwardPort", removeAll), ("destroy", destroyAll)]:
+        if(not any(selected(later) for later in BENCHMARKS[BENCHMARKS.index(name):BENCHMARKS.index("main")])):
+            break
+
+        result = measure(backend, name, count, function)
+        if(selected(name)):
+            results.append(result)
+
+    return results
+
+def writeChallenge(directory: str, count: int, *, staticIp: bool=True) -> str:
+    path = os.path.join(directory, f"bench-{count}{'' if staticIp else '-dhcp'}")
+    os.makedirs(path, exist_ok=True)
+
+    config = []
+    for i in range(count):
+        config.append({
+            "name": f"bench-{i:04d}",
+            "remote": "local",
+            "project": "default",
+            "launch": {"image": {"remote": "images", "name": "ubuntu/22.04"}},
+            "network": {
+                "name": NETWORK,
+                "_type": "bridge",
+                "action": "update",
+                "config": NETWORK_CONFIG,
+                "listen_address": LISTEN_ADDRESS,
+                "static_ip": staticIp,
+                "forwards": [{"source": 20000 + i, "destination": 80}],
+                "acls": [{"name": "bench-allow-http", "egress": [{"action": "allow", "protocol": "tcp", "destination_port": 80, "state": "enabled"}]}],
+            },
+        })
+
+    with open(os.path.join(path, deploy.CONFIGURATION_FILE_NAME), "w") as f:
+        yaml.safe_dump({"config": config}, f)
+
+    with open(os.path.join(path, deploy.INVENTORY_FILE_NAME), "w") as f:
+        yaml.safe_dump({"all": {"hosts": {f"bench-{i:04d}": None for i in range(count)}, "vars": {"ansible_connection": "community.general.incus"}}}, f)
+
+    with open(os.path.join(path, deploy.CHALLENGE_FILE_NAME), "w") as f:
+        yaml.safe_dump([{"hosts": "all", "tasks": []}], f)
+
+    return path
+
+def runMain(args, count: int, directory: str, *, staticIp: bool=True) -> dict:
+    # deploy.py run as a script with --test: the pipeline of every instance, the playbook and the teardown. Without
+    # static_ip, every instance waits for its DHCP lease.
+    backend = reset(args)
+    path = writeChallenge(directory, count, staticIp=staticIp)
+    namespace = {"__name__": "__main__", "__file__": deploy.__file__}
+
+    with open(deploy.__file__) as f:
+        code = compile(f.read(), deploy.__file__, "exec")
+
+    argv = sys.argv
+    sys.argv = [deploy.__file__, path, "--test", "--no-daemon", "--wait-timeout", str(args.waitTimeout), "--ledger", os.path.join(directory, f"ledger-{count}{'' if staticIp else '-dhcp'}.sqlite")]
+    backend.reset()
+    start = time.monotonic()
+    status = 0
+
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            exec(code, namespace)
+    except SystemExit as error:
+        status = error.code or 0
+    finally:
+        sys.argv = argv
+
+    seconds = time.monotonic() - start
+
+    if(status != 0):
+        print(f"The deployment of {count} instance(s) failed with status {status}.")
+        sys.exit(1)
+
+    # Instances run on their own thread, their polls are only counted on their own spans.
+    polls = sum(span["polls"] for span in namespace["tracer"].spans if span["parent_id"] is None or span["name"] == "instance")
+
+    return {"benchmark": "main" if staticIp else "main-dhcp", "instances": count, "seconds": round(seconds, 4), "calls": backend.calls, "polls": polls, "counts": dict(sorted(backend.counts.items()))}
+
+def printResults(results: list):
+    print(f"{'benchmark':<20} {'instances':>9} {'seconds':>10} {'calls':>8} {'polls':>8}")
+    for result in results:
+        print(f"{result['benchmark']:<20} {result['instances']:>9} {result['seconds']:>10.3f} {result['calls']:>8} {result['polls']:>8}")
+
+def compareBaseline(args, results: list) -> list:
+    with open(args.baseline) as f:
+        baseline = {(result["benchmark"], result["instances"]): result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        key = (result["benchmark"], result["instances"])
+        if(not key in baseline):
+            continue
+
+        metrics = [("calls", args.tolerance), ("polls", args.tolerance)]
+        if(args.timeTolerance is not None):
+            metrics.append(("seconds", args.timeTolerance))
+
+        for metric, tolerance in metrics:
+            if(result[metric] > baseline[key][metric] * (1 + tolerance)):
+                regressions.append(f"{result['benchmark']} ({result['instances']} instance(s)): {metric} went from {baseline[key][metric]} to {result[metric]}")
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the orchestration overhead of deploy.py against an in-process fake incus.")
+    parser.add_argument("--sizes", help="Comma separated numbers of instances. Default 1,10,100,1000.", default="1,10,100,1000", type=lambda value: [int(size) for size in value.split(",")])
+    parser.add_argument("--benchmarks", help=f"Comma separated benchmarks to run among {','.join(BENCHMARKS)}. Default all.", default=BENCHMARKS, type=lambda value: value.split(","))
+    parser.add_argument("--latency", help="Seconds added to every incus call. Default 0.", default=0.0, type=float)
+    parser.add_argument("--dhcp-delay", dest='dhcpDelay', help="Seconds before a started instance gets its IP address. Default 0.05.", default=0.05, type=float)
+    parser.add_argument("--boot-delay", dest='bootDelay', help="Seconds before the agent of a started instance is ready. Default 0.05.", default=0.05, type=float)
+    parser.add_argument("--ansible-delay", dest='ansibleDelay', help="Seconds a playbook run takes. Default 0.", default=0.0, type=float)
+    parser.add_argument("--wait-timeout", dest='waitTimeout', help="Maximum time in seconds to wait for an instance. Default 300.", default=300, type=float)
+    parser.add_argument("--json", help="Write the results to this file, it can be used as a --baseline later.", type=str)
+    parser.add_argument("--baseline", help="Exit with status 1 when calls or polls grew more than --tolerance compared to this file.", type=str)
+    parser.add_argument("--tolerance", help="Allowed growth of calls and polls compared to --baseline. Default 0.1 (10%%).", default=0.1, type=float)
+    parser.add_argument("--time-tolerance", dest='timeTolerance', help="Also fail when the wall time grew more than this compared to --baseline (e.g. 0.5). Not checked by default.", type=float)
+
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if not name in BENCHMARKS]
+    if(unknown):
+        print(f"Unknown benchmark(s): {', '.join(unknown)}")
+        sys.exit(1)
+
+    results = []
+    directory = tempfile.mkdtemp(prefix="incus-track-deployment-benchmark-")
+
+    try:
+        for size in args.sizes:
+            results += runFunctions(args, size)
+
+            if("main" in args.benchmarks):
+                results.append(runMain(args, size, directory))
+
+            if("main-dhcp" in args.benchmarks):
+                results.append(runMain(args, size, directory, staticIp=False))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    printResults(results)
+
+    if(args.json):
+        with open(args.json, "w") as f:
+            json.dump({"parameters": {"latency": args.latency, "dhcpDelay": args.dhcpDelay, "bootDelay": args.bootDelay, "ansibleDelay": args.ansibleDelay}, "results": results}, f, indent=2)
+
+    if(args.baseline):
+        regressions = compareBaseline(args, results)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+        if(regressions):
+            sys.exit(1)
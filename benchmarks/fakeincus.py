@@ -0,0 +1,728 @@
+#!/usr/bin/env python3
+import io
+import sys
+import json
+import time
+import types
+import hashlib
+import itertools
+import threading
+import subprocess
+import urllib.parse
+
+from ipaddress import ip_network
+
+# In-process stand-in for pyincus, ansible_runner and the `incus` command line. Every operation is counted and
+# may be delayed to simulate the round trip to incus, instances get their DHCP lease and finish booting after
+# a configurable delay. install() must be called before deploy.py is imported.
+
+backend = None
+
+class Backend(object):
+    def __init__(self, *, latency: float=0.0, dhcpDelay: float=0.0, bootDelay: float=0.0, ansibleDelay: float=0.0, publishDelay: float=0.0):
+        self.latency = latency
+        self.dhcpDelay = dhcpDelay
+        self.bootDelay = bootDelay
+        self.ansibleDelay = ansibleDelay
+        self.publishDelay = publishDelay
+        self.lock = threading.RLock()
+        self.remotes = {}
+        self.counts = {}
+        self.runs = []
+
+    def call(self, name: str):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+        if(self.latency):
+            time.sleep(self.latency)
+
+    @property
+    def calls(self) -> int:
+        with self.lock:
+            return sum(self.counts.values())
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+            self.runs = []
+
+    def project(self, remote: str="local", project: str="default") -> "Project":
+        return self.remotes[remote].projects._projects[project]
+
+class InstanceException(Exception):
+    pass
+
+class InstanceIsNotRunningException(InstanceException):
+    pass
+
+class InstanceIsAlreadyStoppedException(InstanceException):
+    pass
+
+class InstanceIsPausedException(InstanceException):
+    pass
+
+class InstanceExecFailedException(InstanceException):
+    pass
+
+class InstanceNotFoundException(InstanceException):
+    pass
+
+class NotFound(Exception):
+    pass
+
+class Conflict(Exception):
+    pass
+
+def isFalse(value) -> bool:
+    return value is False or (isinstance(value, str) and value.lower() in ["false", "no", "0"])
+
+def isNone(value) -> bool:
+    return value is None or (isinstance(value, str) and value.lower() in ["none", ""])
+
+class Model(object):
+    def validateObjectFormat(self, *args):
+        pass
+
+class Instance(Model):
+    def __init__(self, project: "Project"=None, name: str=None, *, image: str=None, config: dict=None, devices: dict=None, vm: bool=False):
+        self.project = project
+        self.name = name
+        self.image = image
+        self._config = dict(config or {})
+        self._devices = {key: dict(value) for key, value in (devices or {}).items()}
+        self.type = "virtual-machine" if vm else "container"
+        self._status = "Stopped"
+        self.startedAt = None
+        self.address = None
+        self.snapshots = set()
+
+    def validateImageName(self, name: str):
+        pass
+
+    def boot(self):
+        self._status = "Running"
+        self.startedAt = time.time()
+
+    def network(self) -> "Network":
+        return self.project.networks._networks.get(self.expanded().get("eth0", {}).get("network"))
+
+    def expanded(self) -> dict:
+        devices = {"eth0": {"name": "eth0", "type": "nic", "network": "incusbr0"}, "root": {"type": "disk", "path": "/", "pool": "default"}}
+        devices.update({key: dict(value) for key, value in self._devices.items()})
+        return devices
+
+    def currentState(self) -> dict:
+        addresses = [{"family": "inet6", "scope": "link", "address": "fe80::1"}]
+
+        if(self._status == "Running" and time.time() - self.startedAt >= backend.dhcpDelay):
+            network = self.network()
+            if(self.address is None and network):
+                self.address = self.expanded()["eth0"].get("ipv4.address") or network.lease()
+
+            if(self.address):
+                addresses.insert(0, {"family": "inet", "scope": "global", "address": self.address})
+
+        ready = self._status == "Running" and time.time() - self.startedAt >= backend.bootDelay
+        return {"status": self._status, "processes": 10 if ready else -1, "network": {"eth0": {"addresses": addresses}}}
+
+    @property
+    def status(self) -> str:
+        backend.call("instance.status")
+        return self._status
+
+    @property
+    def state(self) -> dict:
+        backend.call("instance.state")
+        return self.currentState()
+
+    @property
+    def config(self) -> dict:
+        backend.call("instance.config")
+        return dict(self._config)
+
+    @config.setter
+    def config(self, value: dict):
+        backend.call("instance.config.set")
+        self._config = dict(value)
+
+    @property
+    def devices(self) -> dict:
+        backend.call("instance.devices")
+        return {key: dict(value) for key, value in self._devices.items()}
+
+    @devices.setter
+    def devices(self, value: dict):
+        backend.call("instance.devices.set")
+
+        # A new network means a new lease, a pinned address replaces the current one.
+        if(value.get("eth0", {}).get("network") != self._devices.get("eth0", {}).get("network")):
+            self.release()
+
+        self._devices = {key: dict(device) for key, device in value.items()}
+        if(self._devices.get("eth0", {}).get("ipv4.address")):
+            self.address = self._devices["eth0"]["ipv4.address"]
+
+            # A pinned address is never leased to another instance.
+            if(self.network()):
+                self.network().leased.add(self.address)
+
+    @property
+    def expandedDevices(self) -> dict:
+        backend.call("instance.expandedDevices")
+        return self.expanded()
+
+    def release(self):
+        network = self.network()
+        if(network and self.address):
+            network.release(self.address)
+
+        self.address = None
+
+    def start(self):
+        backend.call("instance.start")
+        if(self._status == "Running"):
+            raise InstanceException("The instance is already running")
+
+        self.boot()
+
+    def stop(self, force: bool=False):
+        backend.call("instance.stop")
+        if(self._status == "Stopped"):
+            raise InstanceIsAlreadyStoppedException("The instance is already stopped")
+
+        self._status = "Stopped"
+
+    def pause(self):
+        backend.call("instance.pause")
+        if(self._status != "Running"):
+            raise InstanceIsNotRunningException("The instance isn't running")
+
+        self._status = "Frozen"
+
+    def restart(self):
+        backend.call("instance.restart")
+        self.boot()
+
+    def exec(self, command: str):
+        backend.call("instance.exec")
+        if(self._status != "Running"):
+            raise InstanceIsNotRunningException("The instance isn't running")
+
+        if(time.time() - self.startedAt < backend.bootDelay):
+            raise InstanceExecFailedException("The agent isn't started")
+
+        return ""
+
+    def delete(self):
+        backend.call("instance.delete")
+        if(self._status == "Running"):
+            raise InstanceException("The instance is running")
+
+        self.project.instances.remove(self)
+
+class Instances(object):
+    def __init__(self, project: "Project"):
+        self.project = project
+        self._instances = {}
+
+    def add(self, instance: Instance) -> Instance:
+        with backend.lock:
+            if(instance.name in self._instances):
+                raise InstanceException(f"Instance already exists: {instance.name}")
+
+            self._instances[instance.name] = instance
+
+        return instance
+
+    def remove(self, instance: Instance):
+        with backend.lock:
+            self._instances.pop(instance.name, None)
+            instance.release()
+
+    def exists(self, name: str) -> bool:
+        backend.call("instances.exists")
+        return name in self._instances
+
+    def get(self, name: str) -> Instance:
+        backend.call("instances.get")
+        if(not name in self._instances):
+            raise InstanceNotFoundException(f"Instance not found: {name}")
+
+        return self._instances[name]
+
+    def list(self) -> list:
+        backend.call("instances.list")
+        return list(self._instances.values())
+
+    def launch(self, image: str, name: str, remoteSource: str=None, config: dict=None, network: str=None, vm: bool=False):
+        backend.call("instances.launch")
+        devices = {"eth0": {"name": "eth0", "type": "nic", "network": network}} if network else {}
+        instance = self.add(Instance(self.project, name, image=image, config=config, devices=devices, vm=vm))
+        instance.boot()
+        return instance
+
+    def copy(self, source: str, name: str, remoteSource: str=None, projectSource: str=None, config: dict=None, device: dict=None, instanceOnly: bool=False):
+        backend.call("instances.copy")
+        source, _, snapshot = source.partition("/")
+        source = backend.project(remoteSource or self.project.remote.name, projectSource or self.project.name).instances._instances[source]
+        if(snapshot and not snapshot in source.snapshots):
+            raise Exception(f"Snapshot not found: {snapshot}")
+
+        return self.add(Instance(self.project, name, image=source.image, config={**source._config, **(config or {})}, devices={**source._devices, **(device or {})}, vm=source.type == "virtual-machine"))
+
+class NetworkForward(Model):
+    possibleProtocols = ["tcp", "udp"]
+
+    def __init__(self, network: "Network"=None, listenAddress: str=None):
+        self.network = network
+        self.listenAddress = listenAddress
+        self.ports = []
+
+    def validatePortList(self, ports):
+        pass
+
+class Network(Model):
+    def __init__(self, project: "Project", name: str, _type: str="bridge", description: str="", config: dict=None):
+        self.project = project
+        self.name = name
+        self.type = _type
+        self._description = description or ""
+        self._config = {"ipv4.address": "10.0.0.1/16", "ipv6.address": "none", **(config or {})}
+        self.forwards = {}
+        self.leased = set()
+        self.subnet = ip_network(self._config["ipv4.address"], strict=False)
+
+    def lease(self) -> str:
+        with backend.lock:
+            for host in itertools.islice(self.subnet.hosts(), 1, None):
+                if(not str(host) in self.leased):
+                    self.leased.add(str(host))
+                    return str(host)
+
+    def release(self, address: str):
+        with backend.lock:
+            self.leased.discard(address)
+
+    @property
+    def description(self) -> str:
+        backend.call("network.description")
+        return self._description
+
+    @description.setter
+    def description(self, value: str):
+        backend.call("network.description.set")
+        self._description = value or ""
+
+    @property
+    def config(self) -> dict:
+        backend.call("network.config")
+        return dict(self._config)
+
+    @config.setter
+    def config(self, value: dict):
+        backend.call("network.config.set")
+        self._config = dict(value)
+
+class Networks(object):
+    def __init__(self, project: "Project"):
+        self.project = project
+        self._networks = {}
+
+    def exists(self, name: str) -> bool:
+        backend.call("networks.exists")
+        return name in self._networks
+
+    def get(self, name: str) -> Network:
+        backend.call("networks.get")
+        return self._networks[name]
+
+    def list(self) -> list:
+        backend.call("networks.list")
+        return list(self._networks.values())
+
+    def create(self, name: str, _type: str=None, description: str=None, config: dict=None) -> Network:
+        backend.call("networks.create")
+        network = self._networks[name] = Network(self.project, name, _type, description, config)
+        return network
+
+class NetworkACL(Model):
+    def __init__(self, project: "Project"=None, name: str=None, description: str=None, egress: list=None, ingress: list=None):
+        self.project = project
+        self.name = name
+        self.description = description
+        self.egress = egress or []
+        self.ingress = ingress or []
+
+    def validateGress(self, gress: list):
+        pass
+
+    def usedBy(self) -> list:
+        used = []
+        for instance in self.project.instances._instances.values():
+            if(any(self.name in device.get("security.acls", "").split(",") for device in instance._devices.values())):
+                used.append(f"/1.0/instances/{instance.name}?project={self.project.name}")
+
+        for network in self.project.networks._networks.values():
+            if(self.name in network._config.get("security.acls", "").split(",")):
+                used.append(f"/1.0/networks/{network.name}?project={self.project.name}")
+
+        return used
+
+class ACLs(object):
+    def __init__(self, project: "Project"):
+        self.project = project
+        self._acls = {}
+
+    def exists(self, name: str) -> bool:
+        backend.call("acls.exists")
+        return name in self._acls
+
+    def get(self, name: str) -> NetworkACL:
+        backend.call("acls.get")
+        return self._acls[name]
+
+    def list(self) -> list:
+        backend.call("acls.list")
+        return list(self._acls.values())
+
+    def create(self, name: str, description: str=None, egress: list=None, ingress: list=None) -> NetworkACL:
+        backend.call("acls.create")
+        acl = self._acls[name] = NetworkACL(self.project, name, description, egress, ingress)
+        return acl
+
+class Project(object):
+    def __init__(self, remote: "Remote", name: str):
+        self.remote = remote
+        self.name = name
+        self.instances = Instances(self)
+        self.networks = Networks(self)
+        self.acls = ACLs(self)
+        self.images = []
+
+class Projects(object):
+    def __init__(self, remote: "Remote"):
+        self.remote = remote
+        self._projects = {}
+
+    def exists(self, name: str) -> bool:
+        backend.call("projects.exists")
+        return name in self._projects
+
+    def get(self, name: str) -> Project:
+        backend.call("projects.get")
+        return self._projects[name]
+
+class Remote(object):
+    def __init__(self, name: str, threads: int=8, memory: int=16 * 2**30):
+        self.name = name
+        self.projects = Projects(self)
+        self.threads = threads
+        self.memory = memory
+
+class Remotes(object):
+    def exists(self, name: str) -> bool:
+        backend.call("remotes.exists")
+        return name in backend.remotes
+
+    def get(self, name: str) -> Remote:
+        backend.call("remotes.get")
+        return backend.remotes[name]
+
+def rest(remote: str, method: str, path: str, data):
+    # The subset of the REST API deploy.py uses through `incus query`.
+    backend.call(f"query.{method}")
+    url = urllib.parse.urlparse(path)
+    query = urllib.parse.parse_qs(url.query)
+    recursion = int(query.get("recursion", ["0"])[0])
+    parts = [urllib.parse.unquote(part) for part in url.path.strip("/").split("/")][1:]
+
+    if(parts == ["resources"]):
+        instances = sum([len(project.instances._instances) for project in backend.remotes[remote].projects._projects.values()])
+        return {"cpu": {"total": backend.remotes[remote].threads}, "memory": {"total": backend.remotes[remote].memory, "used": 2**30 + instances * 2**29}}
+
+    if(parts == ["projects"] and method == "GET"):
+        return [f"/1.0/projects/{name}" for name in backend.remotes[remote].projects._projects]
+
+    if(parts == ["instances"] and query.get("all-projects") == ["true"]):
+        return [f"/1.0/instances/{name}?project={project.name}" for project in backend.remotes[remote].projects._projects.values() for name in project.instances._instances]
+
+    try:
+        project = backend.project(remote, query.get("project", ["default"])[0])
+    except KeyError:
+        raise NotFound("Project not found")
+
+    if(parts[0] == "networks" and len(parts) >= 3 and parts[2] == "forwards"):
+        network = project.networks._networks.get(parts[1])
+        if(network is None):
+            raise NotFound("Network not found")
+
+        if(len(parts) == 3):
+            if(method == "GET"):
+                return [{"listen_address": forward.listenAddress, "ports": forward.ports} if recursion else f"/1.0/networks/{network.name}/forwards/{forward.listenAddress}" for forward in network.forwards.values()]
+            if(method == "POST"):
+                if(data["listen_address"] in network.forwards):
+                    raise Conflict("Network forward already exists")
+
+                forward = network.forwards[data["listen_address"]] = NetworkForward(network, data["listen_address"])
+                forward.ports = list(data.get("ports") or [])
+                return None
+        else:
+            if(not parts[3] in network.forwards):
+                raise NotFound("Network forward not found")
+
+            forward = network.forwards[parts[3]]
+            if(method == "GET"):
+                return {"listen_address": forward.listenAddress, "ports": forward.ports, "config": {}, "description": ""}
+            if(method in ["PATCH", "PUT"]):
+                forward.ports = list(data.get("ports") or [])
+                return None
+            if(method == "DELETE"):
+                network.forwards.pop(parts[3])
+                return None
+
+    if(parts[0] == "networks" and len(parts) == 3 and parts[2] == "leases" and method == "GET"):
+        network = project.networks._networks.get(parts[1])
+        if(network is None):
+            raise NotFound("Network not found")
+
+        # An instance gets its lease once its DHCP delay is over, whether or not its state was checked.
+        instances = [instance for instance in list(project.instances._instances.values()) if instance.network() is network]
+        for instance in instances:
+            instance.currentState()
+
+        return [{"hostname": instance.name, "address": instance.address, "type": "static" if instance._devices.get("eth0", {}).get("ipv4.address") else "dynamic"} for instance in instances if instance.address]
+
+    if(parts[0] == "networks" and len(parts) == 2 and method == "GET"):
+        network = project.networks._networks.get(parts[1])
+        if(network is None):
+            raise NotFound("Network not found")
+
+        return {"name": network.name, "type": network.type, "config": dict(network._config), "description": network._description}
+
+    if(parts[0] == "network-acls"):
+        acls = project.acls._acls
+        if(len(parts) == 1 and method == "GET"):
+            return [{"name": acl.name, "used_by": acl.usedBy()} if recursion else f"/1.0/network-acls/{acl.name}" for acl in acls.values()]
+
+        if(len(parts) == 2):
+            if(not parts[1] in acls):
+                raise NotFound("Network ACL not found")
+            if(method == "GET"):
+                return {"name": parts[1], "used_by": acls[parts[1]].usedBy()}
+            if(method == "DELETE"):
+                acls.pop(parts[1])
+                return None
+
+    if(parts[0] == "images"):
+        if(len(parts) == 3 and parts[1] == "aliases" and method == "GET"):
+            for image in project.images:
+                if(parts[2] in [alias["name"] for alias in image.get("aliases") or []]):
+                    return {"name": parts[2], "target": image["fingerprint"]}
+
+            raise NotFound("Image alias not found")
+        if(len(parts) == 1 and method == "GET"):
+            return [image if recursion else f"/1.0/images/{image['fingerprint']}" for image in project.images]
+        if(len(parts) == 2 and method == "DELETE"):
+            project.images[:] = [image for image in project.images if image["fingerprint"] != parts[1]]
+            return None
+
+    if(parts[0] == "instances"):
+        instances = project.instances._instances
+
+        if(len(parts) == 1 and method == "GET"):
+            if(not recursion):
+                return [f"/1.0/instances/{name}" for name in instances]
+
+            return [{"name": instance.name, "status": instance._status, "type": instance.type, "config": dict(instance._config), "devices": instance._devices, "expanded_devices": instance.expanded(), "state": instance.currentState() if recursion > 1 else None} for instance in list(instances.values())]
+
+        if(len(parts) == 2 and method == "GET"):
+            if(not parts[1] in instances):
+                raise NotFound("Instance not found")
+
+            instance = instances[parts[1]]
+            return {"name": instance.name, "status": instance._status, "config": {"volatile.base_image": instance.image, **instance._config}, "devices": instance._devices, "expanded_devices": instance.expanded(), "last_used_at": "2024-01-01T00:00:00Z"}
+
+        if(len(parts) == 2 and method == "POST"):
+            with backend.lock:
+                if(not parts[1] in instances):
+                    raise NotFound("Instance not found")
+                if(data["name"] in instances):
+                    raise NotFound(f"Name already in use: {data['name']}")
+                if(instances[parts[1]]._status != "Stopped"):
+                    raise NotFound("Renaming of running instance not allowed")
+
+                instance = instances.pop(parts[1])
+                instance.name = data["name"]
+                instances[instance.name] = instance
+
+            return None
+
+    raise NotFound(f"Unsupported route: {method} {path}")
+
+def incus(arguments: list) -> tuple:
+    if(arguments[0] == "query"):
+        remote, path = arguments[1].split(":", 1)
+        method = arguments[arguments.index("--request") + 1] if "--request" in arguments else "GET"
+        data = json.loads(arguments[arguments.index("--data") + 1]) if "--data" in arguments else None
+
+        try:
+            result = rest(remote, method, path, data)
+        except (NotFound, Conflict) as error:
+            return (1, "", f"Error: {error}")
+
+        return (0, "" if result is None else json.dumps(result), "")
+
+    backend.call(arguments[0])
+
+    projectName = "default"
+    if("--project" in arguments):
+        index = arguments.index("--project")
+        projectName = arguments[index + 1]
+        arguments = arguments[:index] + arguments[index + 2:]
+
+    def resolve(target: str) -> tuple:
+        remote, name = target.split(":", 1)
+        return (backend.project(remote, projectName), name)
+
+    positional = [argument for argument in arguments[1:] if not argument.startswith("-")]
+
+    if(arguments[:2] == ["remote", "list"]):
+        return (0, json.dumps({name: {"addr": f"https://{name}:8443", "protocol": "incus", "public": False} for name in ["images", *backend.remotes]}), "")
+
+    if(arguments[:2] == ["image", "delete"]):
+        project, alias = resolve(arguments[2])
+        project.images[:] = [image for image in project.images if not alias in [a["name"] for a in image["aliases"]]]
+        return (0, "", "")
+
+    if(arguments[:2] == ["image", "info"]):
+        return (0, f"Fingerprint: {hashlib.sha256(arguments[2].encode()).hexdigest()}\nSize: 100.00MiB\n", "")
+
+    if(arguments[:2] in [["snapshot", "create"], ["snapshot", "delete"]]):
+        project, name = resolve(arguments[2])
+        if(arguments[1] == "create"):
+            project.instances._instances[name].snapshots.add(arguments[3])
+        else:
+            project.instances._instances[name].snapshots.discard(arguments[3])
+        return (0, "", "")
+
+    if(arguments[0] == "init"):
+        config = dict(argument.split("=", 1)[1].split("=", 1) for argument in arguments if argument.startswith("--config="))
+        project, name = resolve(positional[1])
+        project.instances.add(Instance(project, name, image=positional[0], config=config, vm="--vm" in arguments))
+        return (0, "", "")
+
+    if(arguments[0] == "delete"):
+        project, name = resolve(positional[0])
+        if(not name in project.instances._instances):
+            return (1, "", "Error: Instance not found")
+
+        instance = project.instances._instances[name]
+        if(instance._status == "Running" and not "--force" in arguments):
+            return (1, "", "Error: The instance is currently running, stop it first or use --force")
+
+        instance._status = "Stopped"
+        project.instances.remove(instance)
+        return (0, "", "")
+
+    if(arguments[0] == "publish"):
+        project, source = resolve(arguments[1])
+        alias = arguments[arguments.index("--alias") + 1]
+        if(any(alias in [a["name"] for a in image["aliases"]] for image in project.images)):
+            if(not "--reuse" in arguments):
+                return (1, "", "Error: Alias already exists")
+
+            project.images[:] = [image for image in project.images if not alias in [a["name"] for a in image["aliases"]]]
+
+        time.sleep(backend.publishDelay)
+        project.images.append({"fingerprint": hashlib.sha256(alias.encode()).hexdigest(), "aliases": [{"name": alias}], "size": 200 * 2**20, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "last_used_at": "0001-01-01T00:00:00Z", "properties": dict(argument.split("=", 1) for argument in arguments if "=" in argument)})
+        return (0, "", "")
+
+    return (1, "", f"Error: Unsupported command: {arguments[0]}")
+
+class Monitor(object):
+    # `incus monitor` without events, waiters fall back on their backoff.
+    def __init__(self):
+        self.stdout = io.StringIO("")
+        self.returncode = 0
+
+    def poll(self) -> int:
+        return 0
+
+    def terminate(self):
+        pass
+
+    def wait(self, timeout: float=None) -> int:
+        return 0
+
+def run(command, *args, **kwargs):
+    if(isinstance(command, list) and command and command[0] == "incus"):
+        code, stdout, stderr = incus(command[1:])
+        return subprocess.CompletedProcess(command, code, stdout, stderr)
+
+    return realRun(command, *args, **kwargs)
+
+def popen(command, *args, **kwargs):
+    if(isinstance(command, list) and command and command[0] == "incus"):
+        return Monitor()
+
+    return realPopen(command, *args, **kwargs)
+
+def ansibleRun(**kwargs):
+    import os
+
+    backend.runs.append(kwargs)
+    os.makedirs(os.path.join(kwargs.get("artifact_dir") or os.path.join(kwargs["private_data_dir"], "artifacts"), kwargs.get("ident") or "fake"), exist_ok=True)
+    time.sleep(backend.ansibleDelay)
+
+    events = [{"event": "runner_on_ok", "event_data": {"task": "Gathering Facts", "host": host, "duration": backend.ansibleDelay}} for host in (kwargs.get("limit") or "all").split(",")]
+    return streamEvents(kwargs, events)
+
+def streamEvents(kwargs: dict, events: list, *, rc: int=0) -> types.SimpleNamespace:
+    # Events go through event_handler as they happen, the run stops once cancel_callback returns true. Events the
+    # handler returns false for are not kept, like the artifacts of ansible_runner.
+    kept = []
+    for event in events:
+        if(kwargs.get("event_handler") is None or kwargs["event_handler"](event)):
+            kept.append(event)
+
+        if(kwargs.get("cancel_callback") and kwargs["cancel_callback"]()):
+            return types.SimpleNamespace(rc=254, status="canceled", events=iter(kept), stats={})
+
+    return types.SimpleNamespace(rc=rc, status="successful" if rc == 0 else "failed", events=iter(kept), stats={})
+
+realRun = subprocess.run
+realPopen = subprocess.Popen
+
+def install(*, remotes: list=["local"], **kwargs) -> Backend:
+    global backend
+    backend = Backend(**kwargs)
+
+    module = types.ModuleType("pyincus")
+    module.remotes = Remotes()
+    module.incus = types.SimpleNamespace(cwd="/", check=lambda: None)
+    module.utils = types.SimpleNamespace(isFalse=isFalse, isNone=isNone)
+    module.exceptions = types.SimpleNamespace(**{cls.__name__: cls for cls in [InstanceException, InstanceIsNotRunningException, InstanceIsAlreadyStoppedException, InstanceIsPausedException, InstanceExecFailedException, InstanceNotFoundException]})
+    module.models = types.SimpleNamespace(
+        _models=types.SimpleNamespace(Model=Model),
+        instances=types.SimpleNamespace(Instance=Instance),
+        forwards=types.SimpleNamespace(NetworkForward=NetworkForward),
+        acls=types.SimpleNamespace(NetworkACL=NetworkACL),
+        projects=types.SimpleNamespace(Project=Project),
+        networks=types.SimpleNamespace(Network=Network),
+    )
+    sys.modules["pyincus"] = module
+
+    runner = types.ModuleType("ansible_runner")
+    runner.run = ansibleRun
+    sys.modules["ansible_runner"] = runner
+
+    subprocess.run = run
+    subprocess.Popen = popen
+
+    for name in remotes:
+        remote = backend.remotes[name] = Remote(name)
+        project = remote.projects._projects["default"] = Project(remote, "default")
+        project.networks._networks["incusbr0"] = Network(project, "incusbr0", "bridge", "", {"ipv4.address": "10.1.0.1/16"})
+
+    return backend
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import deploy
+
+# Run in a fresh interpreter for every measure: import deploy.py and load what the command needs.
+PROBE = """
+import sys
+import time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+if({fake}):
+    sys.path.insert(0, {benchmarks!r})
+    import fakeincus
+    fakeincus.install()
+    start = time.perf_counter()
+import deploy
+deploy.loadDependencies({command!r})
+print(time.perf_counter() - start, len(sys.modules))
+"""
+
+def measure(args, command: str) -> dict:
+    code = PROBE.format(root=ROOT, benchmarks=os.path.join(ROOT, "benchmarks"), fake=args.fake, command=command)
+    seconds = []
+    modules = 0
+
+    for _ in range(args.repeat):
+        process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if(process.returncode != 0):
+            print(f"Failed to load the dependencies of {command}: {process.stderr.strip().splitlines()[-1]}")
+            sys.exit(1)
+
+        duration, modules = process.stdout.split()
+        seconds.append(float(duration))
+        modules = int(modules)
+
+    return {"command": command, "seconds": round(statistics.median(seconds), 4), "modules": modules}
+
+def compareBaseline(args, results: list) -> list:
+    with open(args.baseline) as f:
+        baseline = {result["command"]: result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        if(not result["command"] in baseline):
+            continue
+
+        previous = baseline[result["command"]]
+        if(result["modules"] > previous["modules"]):
+            regressions.append(f"{result['command']}: {result['modules'] - previous['modules']} more module(s) imported ({previous['modules']} to {result['modules']})")
+
+        if(result["seconds"] > previous["seconds"] * (1 + args.tolerance)):
+            regressions.append(f"{result['command']}: import time went from {previous['seconds']:.3f}s to {result['seconds']:.3f}s")
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the time deploy.py takes to import what each of its commands needs.")
+    parser.add_argument("--commands", help=f"Comma separated commands to measure among {','.join(deploy.COMMAND_DEPENDENCIES)}. Default all.", default=list(deploy.COMMAND_DEPENDENCIES), type=lambda value: value.split(","))
+    parser.add_argument("--repeat", help="Number of fresh interpreters per command, the median is reported. Default 10.", default=10, type=int)
+    parser.add_argument("--fake", help="Replace pyincus and ansible_runner by the fake of benchmark.py, e.g. when they are not installed.", action="store_true")
+    parser.add_argument("--json", help="Write the results to this file, it can be used as a --baseline later.", type=str)
+    parser.add_argument("--baseline", help="Exit with status 1 when a command imports more modules or takes more than --tolerance longer than in this file.", type=str)
+    parser.add_argument("--tolerance", help="Allowed growth of the import time compared to --baseline. Default 0.25 (25%%).", default=0.25, type=float)
+
+    args = parser.parse_args()
+
+    unknown = [command for command in args.commands if not command in deploy.COMMAND_DEPENDENCIES]
+    if(unknown):
+        print(f"Unknown command(s): {', '.join(unknown)}")
+        sys.exit(1)
+
+    results = [measure(args, command) for command in args.commands]
+
+    print(f"{'command':<10} {'seconds':>8} {'modules':>8}  dependencies")
+    for result in results:
+        print(f"{result['command']:<10} {result['seconds']:>8.3f} {result['modules']:>8}  {', '.join(deploy.COMMAND_DEPENDENCIES[result['command']]) or '-'}")
+
+    if(args.json):
+        with open(args.json, "w") as f:
+            json.dump({"parameters": {"fake": args.fake, "python": sys.version.split()[0]}, "results": results}, f, indent=2)
+
+    if(args.baseline):
+        regressions = compareBaseline(args, results)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+        if(regressions):
+            sys.exit(1)
@@ -1,28 +1,123 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
 import os
+import re
 import sys
-import yaml
+import atexit
+import json
 import time
+import uuid
 import shutil
-import pyincus
+import signal
+import socket
+import fnmatch
+import hashlib
 import datetime
 import argparse
+import importlib
+import contextlib
 import textwrap
+import shlex
+import copy
+import tempfile
+import threading
+import traceback
 import subprocess
-import ansible_runner
+import socketserver
+import urllib.parse
 
-from ipaddress import ip_address, ip_network, IPv4Address, IPv6Address, IPv4Network, IPv6Network
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ipaddress import ip_address, ip_network, ip_interface, IPv4Address, IPv6Address
 
-now = datetime.datetime.now()
+class LazyModule(object):
+    # Heavy dependencies are imported on first use so the commands which do not need them (e.g. purge never runs
+    # ansible, a daemon client needs neither) do not pay for their import.
+    def __init__(self, name: str, *, setup=None):
+        self.name = name
+        self.setup = setup
+        self.module = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if(self.module is None):
+            with self.lock:
+                if(self.module is None):
+                    module = importlib.import_module(self.name)
+                    if(self.setup):
+                        self.setup(module)
+
+                    self.module = module
+
+        return self.module
+
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+INCUS_WORKING_DIRECTORY = "/"
+
+yaml = LazyModule("yaml")
+sqlite3 = LazyModule("sqlite3")
+pyincus = LazyModule("pyincus", setup=lambda module: setattr(module.incus, "cwd", INCUS_WORKING_DIRECTORY))
+ansible_runner = LazyModule("ansible_runner")
+
+# Modules loaded before a command starts, so a missing one fails before anything is done. Anything else is
+# imported on first use (e.g. ansible_runner by apply --reprovision).
+COMMAND_DEPENDENCIES = {
+    "deploy": ["yaml", "pyincus", "ansible_runner", "sqlite3"],
+    "apply": ["yaml", "pyincus", "sqlite3"],
+    "destroy": ["yaml", "pyincus", "sqlite3"],
+    "purge": ["pyincus", "sqlite3"],
+    "reconcile": ["yaml", "pyincus", "sqlite3"],
+    "cache": [],
+    "status": [],
+    "validate": ["yaml", "pyincus"],
+    "daemon": ["yaml", "pyincus", "ansible_runner", "sqlite3"],
+}
 
 CHALLENGES_DIRECTORY = "containers"
 CHALLENGE_FILE_NAME = "challenge.yml"
 CONFIGURATION_FILE_NAME = "config.yml"
 INVENTORY_FILE_NAME = "inventory"
+IMAGE_CACHE_PREFIX = "ctf-cache-"
+IMAGE_CACHE_SNAPSHOT = "ctf-cache"
+LEDGER_PATH = os.path.join(os.path.expanduser("~"), ".cache", "incus-track-deployment", "ledger.sqlite")
+VALIDATE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "incus-track-deployment", "validate.json")
+FACT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "incus-track-deployment", "facts")
+DAEMON_SOCKET = os.path.join(os.path.expanduser("~"), ".cache", "incus-track-deployment", "daemon.sock")
+# Options a daemon client sends with its request, anything else (e.g. --jobs) is the daemon's own.
+DAEMON_REQUEST_OPTIONS = ["verbose", "force", "keepInstancesOnFailure", "resume", "plan", "reprovision", "test", "waitTimeout", "cache", "cacheMaxSize", "pool", "poolMaxAge", "placement", "placementRemotes", "portRange", "uniquePorts", "parallel"]
+# Pipeline stages which are checkpointed and skipped by --resume once completed. The network and the cache lookup
+# are always done again, later stages need what they return.
+CHECKPOINTED_STAGES = ["launch", "ip", "boot", "provision", "snapshot", "finalize", "publish"]
+# Instances of a challenge going through their stages at a time, each of them mostly waits on its own incus
+# commands (the default of a ThreadPoolExecutor for I/O bound work).
+PARALLEL_INSTANCES = min(32, (os.cpu_count() or 1) + 4)
+PLACEMENT_POLICIES = ["least-loaded", "spread", "bin-pack"]
+# DHCP leases raise no incus event, the leases of a network are polled with an exponential backoff between these
+# delays (in seconds) until an instance has its addresses.
+IP_POLL_MIN_DELAY = 0.2
+IP_POLL_MAX_DELAY = 1.0
+# Replicas are copied from a snapshot of the provisioned one, or launched from an image published from it.
+REPLICA_METHODS = ["copy", "publish"]
+REPLICA_SNAPSHOT = "ctf-replica"
+REPLICA_IMAGE_PREFIX = "ctf-replica-"
+# Listen ports given to the forwards whose source is auto, unless their network has its own port_range.
+AUTO_PORT_RANGE = "20000-29999"
+# A forward is written with all of its ports and `incus query` cannot send the ETag it was read with, a concurrent
+# write is noticed by reading the forward back. It is merged and written again up to this many times.
+FORWARD_COMMIT_ATTEMPTS = 5
+POOL_PREFIX = "ctf-pool-"
+POOL_CONFIG = "user.ctf-pool"
+# Instance configuration keys which only take effect once the instance restarts (every limits.* key for VMs).
+RESTART_CONFIG_PREFIXES = ("boot.", "linux.", "raw.", "limits.kernel.", "security.idmap.", "security.nesting", "security.privileged", "security.syscalls.")
 
-pyincus.incus.cwd = "/"
 #pyincus.incus.check()
 
+def loadDependencies(command: str):
+    for name in COMMAND_DEPENDENCIES[command]:
+        globals()[name].load()
+
 def printHelp():
     print("Review config file format.")
     print("")
@@ -51,6 +146,9 @@ def printHelp():
               limits.cpu: 1
               limits.memory: 1GiB
               agent.nic_config: true (if using a virtual machine)
+          readiness: (optional)
+            command: systemctl is-system-running --wait (optional)
+            timeout: 120 (optional, default: --wait-timeout)
           network:
             name: testnetwork (required if forwards is present)
             description: testnetwork (optional)
@@ -103,9 +201,770 @@ def printHelp():
         """)
     )
 
-def findNetworkInterfaceCard(instance: "pyincus.models.instances.Instance | str"):
+class IncusException(Exception):
+    pass
+
+def runIncus(arguments: list, *, input: str=None) -> str:
+    tracer.count("incus_calls")
+    process = subprocess.run(["incus", *arguments], cwd=INCUS_WORKING_DIRECTORY, input=input, capture_output=True, text=True)
+
+    if(process.returncode != 0):
+        raise IncusException(process.stderr.strip() or f"incus {arguments[0]} failed with status {process.returncode}")
+
+    return process.stdout
+
+def openIncus(arguments: list) -> subprocess.Popen:
+    return subprocess.Popen(["incus", *arguments], cwd=INCUS_WORKING_DIRECTORY, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+def incusQuery(remote: str, path: str, *, method: str="GET", data=None, project: str=None, wait: bool=False):
+    # Raw REST call for what pyincus does not expose, e.g. replacing every port of a forward in one request.
+    if(project):
+        path += f"{'&' if '?' in path else '?'}project={urllib.parse.quote(project)}"
+
+    arguments = ["query", f"{remote}:{path}", "--request", method]
+
+    if(wait):
+        arguments.append("--wait")
+
+    if(not data is None):
+        arguments += ["--data", json.dumps(data)]
+
+    output = runIncus(arguments)
+
+    return json.loads(output) if output.strip() else None
+
+def parseSize(size: str) -> int:
+    units = {"": 1, "B": 1, "KB": 10**3, "MB": 10**6, "GB": 10**9, "TB": 10**12, "KIB": 2**10, "MIB": 2**20, "GIB": 2**30, "TIB": 2**40}
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", str(size))
+
+    if(not match or not match.group(2).upper() in units):
+        raise argparse.ArgumentTypeError(f"Invalid size: {size}")
+
+    return int(float(match.group(1)) * units[match.group(2).upper()])
+
+def expandPorts(ports: "int | str") -> list:
+    # 80, "80", "8000-8010" and "80,443" are all valid port lists for a forward.
+    result = []
+
+    for part in str(ports).split(','):
+        part = part.strip()
+        if('-' in part):
+            start, end = part.split('-', 1)
+            result.extend(range(int(start), int(end) + 1))
+        elif(part):
+            result.append(int(part))
+
+    return result
+
+def parsePortRange(value: str) -> str:
+    # Ports auto forwards are allocated from, e.g. "20000-29999" or "20000-20999,30000-30999".
+    try:
+        ports = expandPorts(value)
+    except ValueError:
+        ports = []
+
+    if(not ports or any(port < 1 or port > 65535 for port in ports)):
+        raise argparse.ArgumentTypeError(f"Invalid port range: {value}")
+
+    return str(value)
+
+class ForwardManager(object):
+    # Index the ports of every forward of a network with a single listing. Additions and removals are staged
+    # per listen address and written with one update per forward, after checking for listen port conflicts
+    # against the current state of that forward. The forward is read back to notice a concurrent write.
+    def __init__(self, remote: str, project: str, network: str):
+        self.remote = remote
+        self.project = project
+        self.network = network
+        self.lock = threading.RLock()
+        self.forwards = None
+        self.pending = {}
+        self.owners = {}
+
+    def path(self, listenAddress: str=None) -> str:
+        path = f"/1.0/networks/{urllib.parse.quote(self.network)}/forwards"
+        return f"{path}/{urllib.parse.quote(listenAddress)}" if listenAddress else path
+
+    def load(self) -> dict:
+        with self.lock:
+            if(self.forwards is None):
+                forwards = incusQuery(self.remote, f"{self.path()}?recursion=1", project=self.project) or []
+                self.forwards = {forward["listen_address"]: forward.get("ports") or [] for forward in forwards}
+
+            return self.forwards
+
+    @staticmethod
+    def index(ports: list) -> dict:
+        used = {}
+        for port in ports:
+            for listenPort in expandPorts(port["listen_port"]):
+                used[(port.get("protocol") or "tcp", listenPort)] = port["target_address"]
+
+        return used
+
+    def conflicts(self, listenAddress: str, forwards: list, *, ignore: list=[]) -> list:
+        used = self.index(self.load().get(listenAddress, []))
+        conflicts = []
+
+        for forward in forwards:
+            for listenPort in expandPorts(forward.source):
+                target = used.get((forward.protocol, listenPort))
+                if(target and not target in ignore):
+                    conflicts.append(f"{listenAddress}:{listenPort}/{forward.protocol} is already forwarded to {target}")
+
+        return conflicts
+
+    def pendingFor(self, listenAddress: str) -> dict:
+        return self.pending.setdefault(listenAddress, {"remove": set(), "removePorts": [], "add": []})
+
+    @staticmethod
+    def name(listenAddress: str, port: dict) -> str:
+        return f"{listenAddress} {port.get('protocol') or 'tcp'}/{port['listen_port']}"
+
+    @staticmethod
+    def same(port: dict, other: dict) -> bool:
+        key = lambda port: (port.get("protocol") or "tcp", str(port["listen_port"]), port["target_address"], str(port.get("target_port") or port["listen_port"]))
+        return key(port) == key(other)
+
+    def remove(self, addresses: list) -> list:
+        with self.lock:
+            listenAddresses = []
+            for listenAddress, ports in self.load().items():
+                if(any(port["target_address"] in addresses for port in ports)):
+                    self.pendingFor(listenAddress)["remove"].update(addresses)
+                    listenAddresses.append(listenAddress)
+
+            return listenAddresses
+
+    def removePorts(self, listenAddress: str, ports: list):
+        with self.lock:
+            self.pendingFor(listenAddress)["removePorts"].extend(ports)
+
+    def add(self, listenAddress: str, forwards: list, *, targetAddress: str, ignore: list=[], instance: str=None):
+        with self.lock:
+            conflicts = self.conflicts(listenAddress, forwards, ignore=[targetAddress] + ignore)
+            if(conflicts):
+                raise Exception(f"Forward port conflict: {', '.join(conflicts)}")
+
+            for forward in forwards:
+                port = {"protocol": forward.protocol, "listen_port": str(forward.source), "target_address": targetAddress, "target_port": str(forward.destination)}
+                self.pendingFor(listenAddress)["add"].append(port)
+                self.owners[self.name(listenAddress, port)] = instance
+
+    def track(self, listenAddress: str, removed: list, added: list):
+        # Ports are recorded once they are on the forward, even when they already were.
+        for port in removed:
+            ledger.forget("forward", self.remote, self.project, self.name(listenAddress, port), parent=self.network)
+
+        for port in added:
+            ledger.record("forward", self.remote, self.project, self.name(listenAddress, port), parent=self.network, instance=self.owners.pop(self.name(listenAddress, port), None), data={**port, "listen_address": listenAddress})
+
+    def fetch(self, listenAddress: str) -> dict:
+        try:
+            return incusQuery(self.remote, self.path(listenAddress), project=self.project)
+        except IncusException as error:
+            if(not "not found" in str(error).lower()):
+                raise
+
+            return None
+
+    def merge(self, listenAddress: str, currentPorts: list, changes: dict) -> tuple:
+        ports = [port for port in currentPorts if not port["target_address"] in changes["remove"] and not any(self.same(port, other) for other in changes["removePorts"])]
+        added = 0
+
+        for port in changes["add"]:
+            used = self.index(ports)
+            targets = set([used.get((port["protocol"], listenPort)) for listenPort in expandPorts(port["listen_port"])])
+
+            if(targets == set([port["target_address"]])):
+                continue
+            elif(targets != set([None])):
+                raise Exception(f"Forward port conflict: {listenAddress}:{port['listen_port']}/{port['protocol']} is already forwarded to {', '.join(sorted([t for t in targets if t and t != port['target_address']]))}")
+
+            ports.append(port)
+            added += 1
+
+        return (ports, len(currentPorts) - (len(ports) - added), added)
+
+    def applied(self, ports: list, changes: dict) -> bool:
+        added = all(any(self.same(port, other) for other in ports) for port in changes["add"])
+        removed = not any(port["target_address"] in changes["remove"] or any(self.same(port, other) for other in changes["removePorts"]) for port in ports)
+        return added and removed
+
+    def commit(self, args=None) -> int:
+        writes = 0
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+            for listenAddress, changes in pending.items():
+                current = self.fetch(listenAddress)
+
+                for _ in range(FORWARD_COMMIT_ATTEMPTS):
+                    currentPorts = (current or {}).get("ports") or []
+                    ports, removed, added = self.merge(listenAddress, currentPorts, changes)
+
+                    if(not added and not removed):
+                        self.track(listenAddress, changes["removePorts"], changes["add"])
+                        break
+
+                    try:
+                        if(current is None):
+                            incusQuery(self.remote, self.path(), method="POST", data={"listen_address": listenAddress, "ports": ports}, project=self.project)
+                        else:
+                            incusQuery(self.remote, self.path(listenAddress), method="PATCH", data={"ports": ports}, project=self.project)
+                    except IncusException as error:
+                        # Created by someone else since it was read, it is merged with what they wrote.
+                        if(current is None and "already exists" in str(error).lower()):
+                            current = self.fetch(listenAddress)
+                            continue
+
+                        raise
+
+                    # Someone else writing the forward between the read and the write replaced these ports with
+                    # theirs, it is merged again with what is on the forward now.
+                    current = self.fetch(listenAddress)
+                    if(not self.applied((current or {}).get("ports") or [], changes)):
+                        if(args and args.verbose):
+                            print(f"[DEBUG] Forward was changed concurrently, it is written again: {listenAddress}")
+
+                        continue
+
+                    self.load()[listenAddress] = current["ports"]
+                    self.track(listenAddress, [port for port in currentPorts if not port in ports] + changes["removePorts"], changes["add"])
+                    writes += 1
+
+                    if(args and args.verbose):
+                        print(f"[DEBUG] Forward was updated: {listenAddress} ({added} port(s) added, {removed} port(s) removed)")
+
+                    break
+                else:
+                    raise Exception(f"Forward could not be updated, it kept being changed concurrently: {listenAddress}")
+
+        return writes
+
+class ACLRegistry(object):
+    # Load every ACL of a project with what uses it in a single listing. Ownership is resolved on the exact
+    # instance name, missing ACLs are created once per run and the index is kept up to date with what the
+    # script attaches or removes so teardown of many instances does not list the ACLs again.
+    def __init__(self, remote: str, project: pyincus.models.projects.Project):
+        self.remote = remote
+        self.project = project
+        self.lock = threading.RLock()
+        self.usedBy = None
+
+    def load(self) -> dict:
+        with self.lock:
+            if(self.usedBy is None):
+                acls = incusQuery(self.remote, "/1.0/network-acls?recursion=1", project=self.project.name) or []
+                self.usedBy = {acl["name"]: list(acl.get("used_by") or []) for acl in acls}
+
+            return self.usedBy
+
+    @staticmethod
+    def instanceName(usedBy: str) -> str:
+        parts = urllib.parse.urlparse(usedBy).path.strip("/").split("/")
+        return urllib.parse.unquote(parts[2]) if len(parts) >= 3 and parts[1] == "instances" else None
+
+    def ensure(self, acl: "Config.Network.ACL") -> str:
+        with self.lock:
+            if(not acl.name in self.load()):
+                self.project.acls.create(name=acl.name, description=acl.description, egress=acl.egress, ingress=acl.ingress)
+                self.usedBy[acl.name] = []
+                ledger.record("acl", self.remote, self.project.name, acl.name)
+
+            return acl.name
+
+    def attach(self, names: list, *, instance: str=None, network: str=None):
+        with self.lock:
+            usedBy = f"/1.0/instances/{instance}" if instance else f"/1.0/networks/{network}"
+            for name in names:
+                if(not usedBy in self.load()[name]):
+                    self.usedBy[name].append(usedBy)
+
+    def owned(self, instances: list) -> list:
+        # ACLs used by nothing else than the given instances.
+        with self.lock:
+            owned = []
+            for name, usedBy in self.load().items():
+                if(len(usedBy) > 0 and all([self.instanceName(u) in instances for u in usedBy])):
+                    owned.append(name)
+
+            return owned
+
+    def release(self, names: list, instances: list) -> list:
+        deleted = []
+
+        with self.lock:
+            # The index is only kept up to date when it was loaded, a teardown driven by the ledger never lists the ACLs.
+            for name, usedBy in (self.usedBy or {}).items():
+                self.usedBy[name] = [u for u in usedBy if not self.instanceName(u) in instances]
+
+            for name in names:
+                # Something else may have started using it since it was listed.
+                try:
+                    acl = incusQuery(self.remote, f"/1.0/network-acls/{urllib.parse.quote(name)}", project=self.project.name)
+                except IncusException as error:
+                    if(not "not found" in str(error).lower()):
+                        raise
+
+                    ledger.forget("acl", self.remote, self.project.name, name)
+                    continue
+
+                if(len(acl.get("used_by") or []) == 0):
+                    incusQuery(self.remote, f"/1.0/network-acls/{urllib.parse.quote(name)}", method="DELETE", project=self.project.name)
+                    ledger.forget("acl", self.remote, self.project.name, name)
+                    deleted.append(name)
+
+                    if(self.usedBy is not None):
+                        self.usedBy.pop(name, None)
+
+        return deleted
+
+class NetworkLeases(object):
+    # The leases of a network, polled once for every instance waiting for its addresses on it. A waiter reuses
+    # the leases another one fetched less than maxAge ago instead of querying them again.
+    def __init__(self, remote: str, project: str, network: str):
+        self.remote = remote
+        self.project = project
+        self.network = network
+        self.lock = threading.Lock()
+        self.leases = []
+        self.fetchedAt = None
+
+    def get(self, maxAge: float) -> list:
+        with self.lock:
+            if(self.fetchedAt is None or time.monotonic() - self.fetchedAt >= maxAge):
+                self.leases = incusQuery(self.remote, f"/1.0/networks/{urllib.parse.quote(self.network)}/leases", project=self.project) or []
+                self.fetchedAt = time.monotonic()
+
+            return self.leases
+
+    def addresses(self, instance: str, maxAge: float) -> list:
+        return [lease["address"] for lease in self.get(maxAge) if lease.get("hostname") == instance and lease.get("address")]
+
+class Session(object):
+    # Memoize remote, project, instance and network lookups for the whole run since each of them is a round
+    # trip to incus. Anything that mutates an instance or a network must invalidate it afterward so the next
+    # lookup fetches it again.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.remotes = {}
+        self.calls = 0
+        self.hits = 0
+
+    def lookup(self, key: tuple, fetch):
+        with self.lock:
+            if(key in self.cache):
+                self.hits += 1
+                return self.cache[key]
+
+            self.calls += 1
+
+        tracer.count("incus_calls")
+        value = fetch()
+
+        with self.lock:
+            return self.cache.setdefault(key, value)
+
+    def remoteExists(self, name: str) -> bool:
+        return self.lookup(("remote-exists", name), lambda: pyincus.remotes.exists(name=name))
+
+    def remote(self, name: str) -> "pyincus.models.remotes.Remote":
+        return self.lookup(("remote", name), lambda: pyincus.remotes.get(name=name))
+
+    def projectExists(self, remote: str, name: str) -> bool:
+        return self.lookup(("project-exists", remote, name), lambda: self.remote(remote).projects.exists(name=name))
+
+    def project(self, remote: str, name: str) -> pyincus.models.projects.Project:
+        project = self.lookup(("project", remote, name), lambda: self.remote(remote).projects.get(name=name))
+        self.remotes[id(project)] = remote
+        return project
+
+    def remoteOf(self, project: pyincus.models.projects.Project) -> str:
+        return self.remotes[id(project)]
+
+    def instance(self, project: pyincus.models.projects.Project, name: str) -> pyincus.models.instances.Instance:
+        return self.lookup(("instance", id(project), name), lambda: project.instances.get(name=name))
+
+    def network(self, project: pyincus.models.projects.Project, name: str) -> pyincus.models.networks.Network:
+        return self.lookup(("network", id(project), name), lambda: project.networks.get(name=name))
+
+    def networkSubnets(self, project: pyincus.models.projects.Project, name: str) -> tuple:
+        def fetch():
+            config = self.network(project, name).config
+
+            subnet4 = ip_network(config["ipv4.address"], strict=False) if "ipv4.address" in config and not pyincus.utils.isNone(config["ipv4.address"]) else None
+            subnet6 = ip_network(config["ipv6.address"], strict=False) if "ipv6.address" in config and not pyincus.utils.isNone(config["ipv6.address"]) else None
+
+            return (subnet4, subnet6)
+
+        return self.lookup(("network-subnets", id(project), name), fetch)
+
+    def forwards(self, project: pyincus.models.projects.Project, network: str) -> ForwardManager:
+        return self.lookup(("forwards", id(project), network), lambda: ForwardManager(self.remoteOf(project), project.name, network))
+
+    def acls(self, project: pyincus.models.projects.Project) -> ACLRegistry:
+        return self.lookup(("acls", id(project)), lambda: ACLRegistry(self.remoteOf(project), project))
+
+    def leases(self, project: pyincus.models.projects.Project, network: str) -> NetworkLeases:
+        return self.lookup(("leases", id(project), network), lambda: NetworkLeases(self.remoteOf(project), project.name, network))
+
+    def commitForwards(self, args=None) -> int:
+        with self.lock:
+            managers = [value for key, value in self.cache.items() if key[0] == "forwards"]
+
+        return sum([manager.commit(args) for manager in managers])
+
+    def invalidate(self, project: pyincus.models.projects.Project, *, instance: str=None, network: str=None):
+        with self.lock:
+            if(instance):
+                self.cache.pop(("instance", id(project), instance), None)
+
+            if(network):
+                self.cache.pop(("network", id(project), network), None)
+                self.cache.pop(("network-subnets", id(project), network), None)
+
+    def forget(self):
+        # Remotes and projects are kept, anything else may have been changed by someone else since.
+        with self.lock:
+            self.cache = {key: value for key, value in self.cache.items() if key[0] in ["remote-exists", "remote", "project-exists", "project"]}
+
+    def __str__(self):
+        return f"{self.calls} incus lookup(s), {self.hits} served from cache"
+
+session = Session()
+
+class Tracer(object):
+    # Timing spans of every phase of a run. Spans opened by a thread are nested under the span it currently is
+    # in, counters (incus calls, poll iterations) are added to every span of that stack.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.traceId = uuid.uuid4().hex
+        self.spans = []
+
+    def stack(self) -> list:
+        if(not hasattr(self.local, "stack")):
+            self.local.stack = []
+
+        return self.local.stack
+
+    def current(self) -> dict:
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def new(self, name: str, parent: dict, attributes: dict) -> dict:
+        return {"trace_id": self.traceId, "span_id": uuid.uuid4().hex[:16], "parent_id": parent["span_id"] if parent else None, "name": name, "attributes": {**(parent["attributes"] if parent else {}), **attributes}, "start": time.time(), "end": None, "duration": None, "status": "ok", "incus_calls": 0, "polls": 0}
+
+    @contextlib.contextmanager
+    def span(self, name: str, *, parent: dict=None, **attributes):
+        span = self.new(name, parent or self.current(), attributes)
+        stack = self.stack()
+        stack.append(span)
+        start = time.monotonic()
+
+        try:
+            yield span
+        except BaseException as error:
+            if(not isinstance(error, SystemExit) or error.code not in [0, None]):
+                span["status"] = "error"
+            raise
+        finally:
+            stack.remove(span)
+            span["duration"] = time.monotonic() - start
+            span["end"] = span["start"] + span["duration"]
+
+            with self.lock:
+                self.spans.append(span)
+
+    def record(self, name: str, *, start: float, end: float, parent: dict=None, status: str="ok", **attributes) -> dict:
+        # Span of something timed elsewhere, e.g. an ansible task.
+        span = self.new(name, parent or self.current(), attributes)
+        span.update({"start": start, "end": end, "duration": max(end - start, 0), "status": status})
+
+        with self.lock:
+            self.spans.append(span)
+
+        return span
+
+    def count(self, counter: str, value: int=1):
+        for span in self.stack():
+            span[counter] += value
+
+    def writeJSONLines(self, path: str):
+        with open(path, "w") as f:
+            for span in sorted(self.spans, key=lambda span: span["start"]):
+                f.write(json.dumps(span) + "\n")
+
+    def writePrometheus(self, path: str):
+        totals = {}
+        for span in self.spans:
+            labels = (span["name"], span["attributes"].get("challenge", ""), span["attributes"].get("instance", ""))
+            total = totals.setdefault(labels, {"count": 0, "duration": 0.0, "incus_calls": 0, "polls": 0, "errors": 0})
+            total["count"] += 1
+            total["duration"] += span["duration"]
+            total["incus_calls"] += span["incus_calls"]
+            total["polls"] += span["polls"]
+            total["errors"] += 1 if span["status"] == "error" else 0
+
+        metrics = [
+            ("ctf_deploy_phase_seconds_total", "counter", "Time spent in a phase.", "duration"),
+            ("ctf_deploy_phase_runs_total", "counter", "Number of times a phase ran.", "count"),
+            ("ctf_deploy_phase_errors_total", "counter", "Number of times a phase failed.", "errors"),
+            ("ctf_deploy_phase_incus_calls_total", "counter", "Incus calls made during a phase.", "incus_calls"),
+            ("ctf_deploy_phase_polls_total", "counter", "Poll iterations while waiting during a phase.", "polls"),
+        ]
+
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        with open(path, "w") as f:
+            for metric, kind, description, key in metrics:
+                f.write(f"# HELP {metric} {description}\n")
+                f.write(f"# TYPE {metric} {kind}\n")
+                for (phase, challenge, instance), total in sorted(totals.items()):
+                    f.write(f'{metric}{{phase="{escape(phase)}",challenge="{escape(challenge)}",instance="{escape(instance)}"}} {total[key]}\n')
+
+    def writeTrace(self, path: str):
+        # OpenTelemetry (OTLP/JSON) trace, which collectors and most trace viewers can import.
+        def attribute(key, value):
+            if(isinstance(value, bool)):
+                return {"key": key, "value": {"boolValue": value}}
+            if(isinstance(value, int)):
+                return {"key": key, "value": {"intValue": str(value)}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for span in self.spans:
+            otlp = {
+                "traceId": span["trace_id"],
+                "spanId": span["span_id"],
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(int(span["start"] * 1e9)),
+                "endTimeUnixNano": str(int(span["end"] * 1e9)),
+                "attributes": [attribute(key, value) for key, value in span["attributes"].items()] + [attribute("incus.calls", span["incus_calls"]), attribute("polls", span["polls"])],
+                "status": {"code": 2 if span["status"] == "error" else 1},
+            }
+            if(span["parent_id"]):
+                otlp["parentSpanId"] = span["parent_id"]
+            spans.append(otlp)
+
+        with open(path, "w") as f:
+            json.dump({"resourceSpans": [{"resource": {"attributes": [attribute("service.name", "incus-track-deployment")]}, "scopeSpans": [{"scope": {"name": "deploy.py"}, "spans": spans}]}]}, f)
+
+    def export(self, args):
+        if(args.metrics):
+            self.writeJSONLines(args.metrics)
+        if(args.metricsPrometheus):
+            self.writePrometheus(args.metricsPrometheus)
+        if(args.trace):
+            self.writeTrace(args.trace)
+
+tracer = Tracer()
+
+class Ledger(object):
+    # Local SQLite record of what the script created (instances, networks, ACLs, forward ports, static addresses
+    # and cached images) with the challenge and run which created it. Teardown and apply use it as an index of
+    # what belongs to an instance instead of reading its state and listing every forward and ACL of the project.
+    # Nothing is recorded until it is opened.
+    schema = """
+        CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, challenge TEXT, command TEXT, started REAL, finished REAL, status TEXT);
+        CREATE TABLE IF NOT EXISTS resources (id INTEGER PRIMARY KEY, run INTEGER, challenge TEXT, kind TEXT, remote TEXT, project TEXT, parent TEXT, name TEXT, instance TEXT, data TEXT, created REAL, deleted REAL);
+        CREATE INDEX IF NOT EXISTS resources_name ON resources (kind, remote, project, name) WHERE deleted IS NULL;
+        CREATE INDEX IF NOT EXISTS resources_instance ON resources (remote, project, instance) WHERE deleted IS NULL;
+        CREATE TABLE IF NOT EXISTS checkpoints (remote TEXT, project TEXT, instance TEXT, stage TEXT, run INTEGER, status TEXT, data TEXT, updated REAL, PRIMARY KEY (remote, project, instance, stage));
+        CREATE TABLE IF NOT EXISTS reservations (kind TEXT, scope TEXT, value TEXT, remote TEXT, project TEXT, instance TEXT, owner TEXT, run INTEGER, reserved REAL, released REAL, PRIMARY KEY (kind, scope, value));
+        CREATE INDEX IF NOT EXISTS reservations_instance ON reservations (remote, project, instance) WHERE released IS NULL;
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.connection = None
+
+    def open(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # Autocommit, concurrent runs (or a daemon and a script) may write to the same ledger.
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.schema)
+
+    def execute(self, query: str, parameters: tuple=()) -> list:
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+    @property
+    def current(self) -> tuple:
+        return getattr(self.local, "run", None)
+
+    @current.setter
+    def current(self, value: tuple):
+        self.local.run = value
+
+    @contextlib.contextmanager
+    def run(self, challenge: str, command: str):
+        if(not self.connection):
+            yield None
+            return
+
+        with self.lock:
+            run = self.connection.execute("INSERT INTO runs (challenge, command, started, status) VALUES (?, ?, ?, 'running')", (challenge, command, time.time())).lastrowid
+
+        previous = self.current
+        self.current = (run, challenge)
+        status = "ok"
+
+        try:
+            yield run
+        except BaseException as error:
+            if(not isinstance(error, SystemExit) or error.code not in [0, None]):
+                status = "failed"
+            raise
+        finally:
+            self.current = previous
+            self.execute("UPDATE runs SET finished = ?, status = ? WHERE id = ?", (time.time(), status, run))
+
+    def record(self, kind: str, remote: str, project: str, name: str, *, parent: str=None, instance: str=None, data: dict=None):
+        if(not self.connection):
+            return
+
+        run, challenge = self.current or (None, None)
+        key = (kind, remote, project, name, parent)
+
+        with self.lock:
+            updated = self.connection.execute("UPDATE resources SET run = ?, challenge = ?, instance = ?, data = ? WHERE kind = ? AND remote = ? AND project = ? AND name = ? AND parent IS ? AND deleted IS NULL", (run, challenge, instance, json.dumps(data or {}), *key)).rowcount
+            if(not updated):
+                self.connection.execute("INSERT INTO resources (run, challenge, kind, remote, project, name, parent, instance, data, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (run, challenge, *key, instance, json.dumps(data or {}), time.time()))
+
+    def forget(self, kind: str, remote: str, project: str, name: str=None, *, parent: str=None, instance: str=None):
+        if(not self.connection):
+            return
+
+        conditions = ["kind = ?", "remote = ?", "project = ?", "deleted IS NULL"]
+        parameters = [kind, remote, project]
+        for column, value in [("name", name), ("parent", parent), ("instance", instance)]:
+            if(value is not None):
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+
+        self.execute(f"UPDATE resources SET deleted = ? WHERE {' AND '.join(conditions)}", (time.time(), *parameters))
+
+    def forgetInstance(self, remote: str, project: str, name: str):
+        self.forget("instance", remote, project, name)
+        self.forget("address", remote, project, instance=name)
+        self.clearCheckpoints(remote, project, name)
+
+    def checkpoint(self, remote: str, project: str, instance: str, stage: str, *, status: str="done", data: dict=None):
+        if(not self.connection):
+            return
+
+        run, _ = self.current or (None, None)
+        self.execute("INSERT OR REPLACE INTO checkpoints (remote, project, instance, stage, run, status, data, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (remote, project, instance, stage, run, status, json.dumps(data or {}), time.time()))
+
+    def checkpoints(self, remote: str, project: str, instance: str) -> dict:
+        if(not self.connection):
+            return {}
+
+        rows = self.execute("SELECT stage, status, data FROM checkpoints WHERE remote = ? AND project = ? AND instance = ?", (remote, project, instance))
+        return {stage: {"status": status, "data": json.loads(data or "{}")} for stage, status, data in rows}
+
+    def clearCheckpoints(self, remote: str, project: str, instance: str):
+        if(not self.connection):
+            return
+
+        self.execute("DELETE FROM checkpoints WHERE remote = ? AND project = ? AND instance = ?", (remote, project, instance))
+
+    def reserved(self, kind: str, scope: str) -> set:
+        if(not self.connection):
+            return set()
+
+        return set([row[0] for row in self.execute("SELECT value FROM reservations WHERE kind = ? AND scope = ? AND released IS NULL", (kind, scope))])
+
+    def reservation(self, kind: str, scope: str, remote: str, project: str, instance: str, owner: str) -> tuple:
+        # Last value reserved for the owner (e.g. a forward or a NIC) of the instance as (value, released).
+        if(not self.connection):
+            return None
+
+        rows = self.execute("SELECT value, released FROM reservations WHERE kind = ? AND scope = ? AND remote = ? AND project = ? AND instance = ? AND owner = ? ORDER BY reserved DESC LIMIT 1", (kind, scope, remote, project, instance, owner))
+        return rows[0] if rows else None
+
+    def reserve(self, kind: str, scope: str, value: str, remote: str, project: str, instance: str, owner: str) -> bool:
+        # The primary key makes the reservation atomic between concurrent runs: it only succeeds when the value
+        # was never reserved, was released or already is the owner's.
+        if(not self.connection):
+            return True
+
+        run, _ = self.current or (None, None)
+
+        with self.lock:
+            return self.connection.execute("""
+                INSERT INTO reservations (kind, scope, value, remote, project, instance, owner, run, reserved) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (kind, scope, value) DO UPDATE SET remote = excluded.remote, project = excluded.project, instance = excluded.instance, owner = excluded.owner, run = excluded.run, reserved = excluded.reserved, released = NULL
+                WHERE reservations.released IS NOT NULL OR (reservations.remote = excluded.remote AND reservations.project = excluded.project AND reservations.instance = excluded.instance AND reservations.owner = excluded.owner)
+            """, (kind, scope, value, remote, project, instance, owner, run, time.time())).rowcount > 0
+
+    def reservedBy(self, kind: str, scope: str, value: str) -> str:
+        if(not self.connection):
+            return None
+
+        rows = self.execute("SELECT remote, project, instance FROM reservations WHERE kind = ? AND scope = ? AND value = ? AND released IS NULL", (kind, scope, value))
+        return "/".join(rows[0]) if rows else None
+
+    def releaseReservations(self, kind: str, remote: str, project: str, instance: str, *, keep: list=[]) -> list:
+        if(not self.connection):
+            return []
+
+        with self.lock:
+            rows = self.connection.execute("SELECT scope, value, owner FROM reservations WHERE kind = ? AND remote = ? AND project = ? AND instance = ? AND released IS NULL", (kind, remote, project, instance)).fetchall()
+            released = [(scope, value) for scope, value, owner in rows if not owner in keep]
+
+            for scope, value in released:
+                self.connection.execute("UPDATE reservations SET released = ? WHERE kind = ? AND scope = ? AND value = ?", (time.time(), kind, scope, value))
+
+        return released
+
+    def resources(self, kind: str=None, *, remote: str=None, project: str=None, name: str=None, instance: str=None, challenges: list=None) -> list:
+        if(not self.connection):
+            return []
+
+        conditions = ["deleted IS NULL"]
+        parameters = []
+        for column, value in [("kind", kind), ("remote", remote), ("project", project), ("name", name), ("instance", instance)]:
+            if(value is not None):
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+
+        if(challenges is not None):
+            conditions.append(f"challenge IN ({','.join('?' * len(challenges))})")
+            parameters += challenges
+
+        columns = ["id", "run", "challenge", "kind", "remote", "project", "parent", "name", "instance", "data", "created"]
+        rows = self.execute(f"SELECT {', '.join(columns)} FROM resources WHERE {' AND '.join(conditions)} ORDER BY id", tuple(parameters))
+
+        return [{**dict(zip(columns, row)), "data": json.loads(row[9] or "{}")} for row in rows]
+
+    def find(self, kind: str, remote: str, project: str, name: str) -> dict:
+        resources = self.resources(kind, remote=remote, project=project, name=name)
+        return resources[-1] if resources else None
+
+    def addresses(self, remote: str, project: str, instance: str) -> list:
+        # Addresses pinned on the instance or targeted by its forwards, None when the instance is not recorded.
+        if(not self.find("instance", remote, project, instance)):
+            return None
+
+        resources = self.resources(remote=remote, project=project, instance=instance)
+        return sorted(set([resource["name"] for resource in resources if resource["kind"] == "address"] + [resource["data"]["target_address"] for resource in resources if resource["kind"] == "forward"]))
+
+ledger = Ledger()
+
+
+def findNetworkInterfaceCard(project: pyincus.models.projects.Project=None, *, instance: "pyincus.models.instances.Instance | str"):
     if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+        instance = session.instance(project, instance)
 
     nic = None
 
@@ -115,65 +974,109 @@ def findNetworkInterfaceCard(instance: "pyincus.models.instances.Instance | str"
 
     return nic
 
-def destroy(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", nic: str='eth0'):
-    if(args.verbose):
-        print(f"[DEBUG] Attempt to destroy instance: {instance.name}")
+def destroy(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", nic: str='eth0', commitForwards: bool=True, releaseACLs: bool=True, releaseReservations: bool=True):
+    with tracer.span("destroy", instance=instance if isinstance(instance, str) else instance.name):
+        destroyInstance(project, args, instance=instance, nic=nic, commitForwards=commitForwards, releaseACLs=releaseACLs, releaseReservations=releaseReservations)
 
-    aclsToRemove = associatedACLs(project=project, args=args, instance=instance)
+def destroyInstance(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", nic: str='eth0', commitForwards: bool=True, releaseACLs: bool=True, releaseReservations: bool=True):
+    name = instance if isinstance(instance, str) else instance.name
+    remote = session.remoteOf(project)
+    recorded = ledger.find("instance", remote, project.name, name)
 
-    removeForwardPort(project=project, args=args, instance=instance, nic=nic)
+    if(args.verbose):
+        print(f"[DEBUG] Attempt to destroy instance: {name}{' (recorded in the ledger)' if recorded else ''}")
 
-    try:
-        instance.pause()
-        if(args.verbose):
-            print(f"[DEBUG] Instance was paused: {instance.name}")
-    except pyincus.exceptions.InstanceException as error:
-        if(isinstance(error, pyincus.exceptions.InstanceIsNotRunningException)):
-            pass
-        else:
-            print(error)
-            sys.exit(1)
+    if(recorded):
+        # Everything the script created for the instance is in the ledger, nothing has to be read from incus.
+        aclsToRemove = recordedACLs(remote, project.name, [recorded]) if releaseACLs else []
+        removeRecordedForwards(project, args, instance=name, commit=commitForwards)
+    else:
+        aclsToRemove = associatedACLs(project=project, args=args, instance=instance) if releaseACLs else []
+        removeForwardPort(project=project, args=args, instance=instance, nic=nic, commit=commitForwards)
 
     try:
-        instance.stop()
-        if(args.verbose):
-            print(f"[DEBUG] Instance was stopped: {instance.name}")
-    except pyincus.exceptions.InstanceException as error:
-        if(isinstance(error, (pyincus.exceptions.InstanceIsAlreadyStoppedException, pyincus.exceptions.InstanceIsNotRunningException))):
-            pass
-        else:
+        forceDelete(remote, project.name, name)
+    except IncusException as error:
+        # The ledger may be out of date, the instance is gone either way.
+        if(not recorded or not "not found" in str(error).lower()):
             print(error)
             sys.exit(1)
 
-    instance.delete()
+    session.invalidate(project, instance=name)
+    ledger.forgetInstance(remote, project.name, name)
     if(args.verbose):
-        print(f"[DEBUG] Instance was deleted: {instance.name}")
+        print(f"[DEBUG] Instance was deleted: {name}")
+
+    if(releaseReservations):
+        for scope, protocol, port in portAllocator.release(remote, project.name, name):
+            if(args.verbose):
+                print(f"[DEBUG] Listen port was released: {port}/{protocol} ({scope})")
 
-    for acl in aclsToRemove:
-        if(len(acl.usedBy) == 0):
-            acl.delete()
+        for scope, address in addressManager.release(remote, project.name, name):
             if(args.verbose):
-                print(f"[DEBUG] ACL was deleted: {acl.name}")
+                print(f"[DEBUG] Address was released: {address} ({scope})")
+
+    releaseNetworkACLs(project=project, args=args, acls=aclsToRemove, instances=[name])
+
+def recordedACLs(remote: str, project: str, instances: list) -> list:
+    # ACLs the script created for the challenges of the given instances, they are only deleted once unused.
+    return sorted(set([acl["name"] for acl in ledger.resources("acl", remote=remote, project=project, challenges=list(set([instance["challenge"] for instance in instances if instance["challenge"]])))]))
+
+def removeRecordedForwards(project: pyincus.models.projects.Project, args, *, instance: str, commit: bool=True):
+    managers = []
 
+    for forward in ledger.resources("forward", remote=session.remoteOf(project), project=project.name, instance=instance):
+        manager = session.forwards(project, forward["parent"])
+        manager.removePorts(forward["data"]["listen_address"], [forward["data"]])
+        managers.append(manager)
 
-def deploy(project: pyincus.models.projects.Project, args, *, name: str, nameSource: str, remoteSource: str=None, projectSource: str=None, config: dict=None, network: pyincus.models.networks.Network=None, isVM: bool=False, isClone: bool=False, nic: str='eth0') -> pyincus.models.instances.Instance:
+        if(args.verbose):
+            print(f"[DEBUG] Forward port of {instance} will be removed: {forward['name']}")
+
+    if(commit):
+        for manager in set(managers):
+            manager.commit(args)
+
+def forceDelete(remote: str, project: str, name: str):
+    # Stop (forced) and delete in a single request instead of pause, stop and delete.
+    runIncus(["delete", "--force", f"{remote}:{name}", "--project", project])
+
+def releaseNetworkACLs(project: pyincus.models.projects.Project, args, *, acls: list, instances: list):
+    for name in session.acls(project).release(acls, instances):
+        if(args.verbose):
+            print(f"[DEBUG] ACL was deleted: {name}")
+
+
+def deploy(project: pyincus.models.projects.Project, args, *, name: str, nameSource: str, remoteSource: str=None, projectSource: str=None, config: dict=None, network: pyincus.models.networks.Network=None, isVM: bool=False, isClone: bool=False, nic: str='eth0', addresses: dict={}) -> pyincus.models.instances.Instance:
     if(project.instances.exists(name=name)):
-        if(args.force):
-            instance = project.instances.get(name=name)
-            destroy(project=project, args=args, instance=instance, nic=nic)
+        # A recorded instance whose launch did not complete is launched again by --resume.
+        if(args.force or (args.resume and ledger.find("instance", session.remoteOf(project), project.name, name))):
+            instance = session.instance(project, name)
+            # The listen ports and addresses allocated to the instance are kept for the one replacing it.
+            destroy(project=project, args=args, instance=instance, nic=nic, releaseReservations=False)
         else:
-            print(f"Instance already exists. Use --force if you want to redeploy.")
+            print("Instance already exists. Use --force if you want to redeploy or --resume to continue a failed deployment.")
             sys.exit(1)
 
+    if(args.pool):
+        profile = {"nameSource": nameSource, "remoteSource": remoteSource, "projectSource": projectSource, "isVM": isVM, "isClone": isClone}
+        instance = warmPool.claim(project, args, name=name, key=warmPool.key(project, **profile), config=config, network=network, nic=nic, addresses=addresses)
+        warmPool.refill(project, args, **profile)
+
+        if(instance):
+            recordInstance(project, name=name, nic=nic, addresses=addresses)
+            return instance
+
     if(isClone):
         if(args.verbose):
             print(f"[DEBUG] Copying {'virtual machine' if isVM else 'instance'} from {f'{remoteSource}:'if remoteSource else ''}{nameSource} to {name}")
         
-        device={nic:{"name": nic,"type":"nic","network":network.name}} if network else None
+        device={nic:{"name": nic,"type":"nic","network":network.name, **addresses}} if network else None
         
         instance = project.instances.copy(source=nameSource, name=name, remoteSource=remoteSource, projectSource=projectSource, config=config, device=device, instanceOnly=True)
         
         instance.start()
+        session.invalidate(project, instance=name)
 
         if(args.verbose):
             print(f"[DEBUG] {'Virtual machine' if isVM else 'Instance'} was copied from {f'{remoteSource}:'if remoteSource else ''}{nameSource}: {name}")
@@ -181,156 +1084,180 @@ def deploy(project: pyincus.models.projects.Project, args, *, name: str, nameSou
         if(args.verbose):
             print(f"[DEBUG] Launching {'virtual machine' if isVM else 'instance'} from image {f'{remoteSource}:'if remoteSource else ''}{nameSource} to create {name}")
         
-        instance = project.instances.launch(image=nameSource, name=name, remoteSource=remoteSource, config=config, network=network.name if network else None, vm=isVM)
+        if(network and addresses):
+            # The instance is created stopped so its addresses are pinned before the first boot instead of restarting it.
+            remote = session.remoteOf(project)
+            runIncus(["init", f"{remoteSource}:{nameSource}" if remoteSource else nameSource, f"{remote}:{name}", "--project", project.name, *(["--vm"] if isVM else []), *[f"--config={key}={configValue(value)}" for key, value in (config or {}).items()]])
+
+            instance = session.instance(project, name)
+            devices = instance.devices
+            devices[nic] = {"name": nic, "type": "nic", "network": network.name, **addresses}
+            instance.devices = devices
+
+            instance.start()
+            session.invalidate(project, instance=name)
+        else:
+            instance = project.instances.launch(image=nameSource, name=name, remoteSource=remoteSource, config=config, network=network.name if network else None, vm=isVM)
         
         if(args.verbose):
             print(f"[DEBUG] {'Virtual machine' if isVM else 'Instance'} was launched: {instance.name}")
 
+    recordInstance(project, name=name, nic=nic, addresses=addresses)
+
     return instance
 
-def associatedACLs(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str"):
-    toRemove = []
-    if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+def recordInstance(project: pyincus.models.projects.Project, *, name: str, nic: str='eth0', addresses: dict={}):
+    remote = session.remoteOf(project)
 
-    acls = project.acls.list()
-    for acl in acls:
-        if(len(acl.usedBy) == 1):
-            if(instance.name in acl.usedBy[0]):
-                toRemove.append(acl)
+    ledger.record("instance", remote, project.name, name)
+    ledger.clearCheckpoints(remote, project.name, name)
+    recordAddresses(remote, project.name, name, nic, addresses)
 
-                if(args.verbose):
-                    print(f"[DEBUG] Found ACL to delete: {acl.name}")
+def recordAddresses(remote: str, project: str, instance: str, nic: str, addresses: dict):
+    # The pinned addresses replace the recorded ones.
+    ledger.forget("address", remote, project, instance=instance)
 
-    return toRemove
+    for key in ["ipv4.address", "ipv6.address"]:
+        if(addresses.get(key)):
+            ledger.record("address", remote, project, addresses[key], instance=instance, data={"nic": nic, "key": key})
 
-def removeForwardPort(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", nic: str='eth0'):
-    if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+def associatedACLs(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str | list"):
+    if(isinstance(instance, list)):
+        names = [i if isinstance(i, str) else i.name for i in instance]
+    else:
+        names = [instance if isinstance(instance, str) else instance.name]
+
+    toRemove = session.acls(project).owned(names)
+
+    if(args.verbose):
+        for name in toRemove:
+            print(f"[DEBUG] Found ACL to delete: {name}")
+
+    return toRemove
 
-    targetAddress4 = None
-    targetAddress6 = None
+def findInstanceAddresses(instance: pyincus.models.instances.Instance, nic: str='eth0') -> list:
+    addresses = []
 
     if(instance.status.lower() != "running"):
         devices = instance.devices
         if(nic in devices):
             if("ipv4.address" in devices[nic]):
-                targetAddress4 = devices[nic]["ipv4.address"]
+                addresses.append(devices[nic]["ipv4.address"])
 
             if("ipv6.address" in devices[nic]):
-                targetAddress6 = devices[nic]["ipv6.address"]
+                addresses.append(devices[nic]["ipv6.address"])
 
     else:
-        nic = findNetworkInterfaceCard(instance=instance) if not nic in instance.state["network"] else nic
-        for address in instance.state["network"][nic]["addresses"]:
-            if(address["family"] == "inet" and address["scope"] == "global"):
-                targetAddress4 = address["address"]
-                break
-            if(address["family"] == "inet6" and address["scope"] == "global"):
-                targetAddress6 = address["address"]
-                break
+        state = instance.state
+        nic = findNetworkInterfaceCard(instance=instance) if not nic in state["network"] else nic
+        for address in state["network"][nic]["addresses"]:
+            if(address["family"] in ["inet", "inet6"] and address["scope"] == "global"):
+                addresses.append(address["address"])
 
-    if(not targetAddress4 is None or not targetAddress6 is None):
-        nic = findNetworkInterfaceCard(instance=instance) if not nic in instance.expandedDevices else nic
-        network = project.networks.get(name=instance.expandedDevices[nic]["network"])
+    return addresses
 
-        for forward in network.forwards.list():
-            for port in forward.ports:
-                if(port["target_address"] in [targetAddress4, targetAddress6]):
-                    forward.removePort(protocol=port["protocol"], listenPorts=port["listen_port"])
-                    if(args.verbose):
-                        print(f"[DEBUG] Forward port was removed: {port['listen_port']}")
+def removeForwardPort(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", nic: str='eth0', commit: bool=True):
+    if(isinstance(instance, str)):
+        instance = session.instance(project, instance)
+
+    addresses = findInstanceAddresses(instance, nic)
+
+    if(addresses):
+        expandedDevices = instance.expandedDevices
+        nic = findNetworkInterfaceCard(project, instance=instance) if not nic in expandedDevices else nic
+        forwards = session.forwards(project, expandedDevices[nic]["network"])
+
+        for listenAddress in forwards.remove(addresses):
+            if(args.verbose):
+                print(f"[DEBUG] Forward ports of {', '.join(addresses)} will be removed from: {listenAddress}")
+
+        if(commit):
+            forwards.commit(args)
 
 def setNetworkACLs(project: pyincus.models.projects.Project, args, *, acls: list, instance: "pyincus.models.instances.Instance | str"=None, network: "pyincus.models.networks.Network | str"=None, nic: str='eth0'):
     if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+        instance = session.instance(project, instance)
+
+    registry = session.acls(project)
+    names = [registry.ensure(acl) for acl in acls]
 
     if(instance):
         devices = instance.devices
 
         if(not nic in devices):
             devices[nic] = instance.expandedDevices[nic]
-        
-        if(not "security.acls" in devices[nic]):
-            securityACL = []
-        else:
-            securityACL = devices[nic]["security.acls"].split(',')
 
-        for acl in acls:
-            if(not project.acls.exists(name=acl.name)):
-                acl = project.acls.create(name=acl.name, description=acl.description, egress=acl.egress, ingress=acl.ingress)
-            else:
-                acl = project.acls.get(name=acl.name)
+        securityACL = [name for name in devices[nic].get("security.acls", "").split(',') if name]
+        missing = [name for name in names if not name in securityACL]
 
-            securityACL.append(acl.name)
+        if(missing):
+            devices[nic]["security.acls"] = ','.join(securityACL + missing)
 
-        devices[nic]["security.acls"] = ','.join(securityACL)
+            instance.devices = devices
+            session.invalidate(project, instance=instance.name)
 
-        instance.devices = devices
+        registry.attach(names, instance=instance.name)
 
         if(args.verbose):
-            for acl in acls:
-                print(f"[DEBUG] ACL ({acl.name}) attached to Instance ({instance.name}).")
+            for name in names:
+                print(f"[DEBUG] ACL ({name}) attached to Instance ({instance.name}).")
     else:
         if(isinstance(network, str)):
-            network = project.networks.get(name=network)
+            network = session.network(project, network)
 
         config = network.config
-        
-        if(not "security.acls" in config):
-            securityACL = []
-        else:
-            securityACL = config["security.acls"].split(',')
 
-        for acl in acls:
-            if(not project.acls.exists(name=acl.name)):
-                acl = project.acls.create(name=acl.name, description=acl.description, egress=acl.egress, ingress=acl.ingress)
-            else:
-                acl = project.acls.get(name=acl.name)
+        securityACL = [name for name in config.get("security.acls", "").split(',') if name]
+        missing = [name for name in names if not name in securityACL]
 
-            securityACL.append(acl.name)
+        if(missing):
+            config["security.acls"] = ','.join(securityACL + missing)
 
-        config["security.acls"] = ','.join(securityACL)
+            network.config = config
+            session.invalidate(project, network=network.name)
 
-        network.config = config
+        registry.attach(names, network=network.name)
 
         if(args.verbose):
-            for acl in acls:
-                print(f"[DEBUG] ACL ({acl.name}) attached to Network ({network.name}).")
+            for name in names:
+                print(f"[DEBUG] ACL ({name}) attached to Network ({network.name}).")
 
-def setForwardsPorts(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", network: str, listenAddress: str, forwards: list, nic: str='eth0'):
+def setForwardsPorts(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", network: str, listenAddress: str, forwards: list, nic: str='eth0', targetAddress: str=None):
     if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+        instance = session.instance(project, instance)
 
-    targetAddress4 = None
-    targetAddress6 = None
-    for address in instance.state["network"][nic]["addresses"]:
-        if(address["family"] == "inet" and address["scope"] == "global"):
-            targetAddress4 = address["address"]
-            break
-        if(address["family"] == "inet6" and address["scope"] == "global"):
-            targetAddress6 = address["address"]
-            break
+    # An address pinned before launch is the target even if the instance is still getting it.
+    if(targetAddress is None):
+        targetAddress4 = None
+        targetAddress6 = None
+        for address in instance.state["network"][nic]["addresses"]:
+            if(address["family"] == "inet" and address["scope"] == "global"):
+                targetAddress4 = address["address"]
+                break
+            if(address["family"] == "inet6" and address["scope"] == "global"):
+                targetAddress6 = address["address"]
+                break
 
-    if(targetAddress4 is None and targetAddress6 is None):
-        print("Failed to find IPv4 or IPv6 addresses for instance.")
-        sys.exit(1)
+        if(targetAddress4 is None and targetAddress6 is None):
+            print("Failed to find IPv4 or IPv6 addresses for instance.")
+            sys.exit(1)
 
-    targetAddress = targetAddress4 if targetAddress4 else targetAddress6
+        targetAddress = targetAddress4 if targetAddress4 else targetAddress6
 
-    network = project.networks.get(name=network)
-    forward = network.forwards.get(listenAddress=listenAddress)
+    manager = session.forwards(project, network)
+    manager.add(listenAddress, forwards, targetAddress=targetAddress, instance=instance.name)
+    manager.commit(args)
 
-    for f in forwards:
-        forward.addPort(protocol=f.protocol, listenPorts=f.source, targetAddress=targetAddress, targetPorts=f.destination)
-        if(args.verbose):
+    if(args.verbose):
+        for f in forwards:
             print(f"[DEBUG] Forward port was added: {f.source}")
 
 def setStaticIP(project: pyincus.models.projects.Project, args, *, instance: "pyincus.models.instances.Instance | str", ipv4: str=None, ipv6: str=None, nic: str='eth0'):
     if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+        instance = session.instance(project, instance)
 
     devices = instance.devices
+    original = {name: dict(device) for name, device in devices.items()}
 
     if(not nic in devices):
         devices[nic] = instance.expandedDevices[nic]
@@ -343,7 +1270,7 @@ def setStaticIP(project: pyincus.models.projects.Project, args, *, instance: "py
                 devices[nic]["ipv4.address"] = address["address"]
                 break
 
-    network = project.networks.get(name=instance.expandedDevices[nic]["network"])
+    network = session.network(project, instance.expandedDevices[nic]["network"])
 
     if("ipv6.dhcp.stateful" in network.config and network.config["ipv6.dhcp.stateful"]):
         if(ipv6):
@@ -354,71 +1281,201 @@ def setStaticIP(project: pyincus.models.projects.Project, args, *, instance: "py
                     devices[nic]["ipv6.address"] = address["address"]
                     break
 
+    recordAddresses(session.remoteOf(project), project.name, instance.name, nic, devices[nic])
+
+    if(devices == original):
+        return
+
+    # Pinning the address the instance already has does not require a restart.
     instance.devices = devices
+    session.invalidate(project, instance=instance.name)
 
     if(args.verbose):
         print(f"[DEBUG] Instance has now static ips: {instance.name} with {devices}.")
 
-def waitForIPAddresses(instance: "pyincus.models.instances.Instance | str", staticIPv4: str=None, staticIPv6: str=None, nic: str='eth0'):
+class EventMonitor(object):
+    # A single `incus monitor` subscription per remote shared by every waiter. Waiters are woken up as soon
+    # as a lifecycle event concerns their instance (or any network) instead of polling at a fixed rate.
+    monitors = {}
+    monitorsLock = threading.Lock()
+
+    @classmethod
+    def get(cls, remote: str) -> "EventMonitor":
+        with cls.monitorsLock:
+            if(not remote in cls.monitors or not cls.monitors[remote].alive):
+                cls.monitors[remote] = cls(remote)
+
+            return cls.monitors[remote]
+
+    def __init__(self, remote: str):
+        self.remote = remote
+        self.condition = threading.Condition()
+        self.events = {}
+        self.sequence = 0
+
+        try:
+            self.process = openIncus(["monitor", f"{remote}:", "--all-projects", "--type=lifecycle", "--format=json"])
+            self.alive = True
+        except OSError:
+            self.process = None
+            self.alive = False
+            return
+
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        buffer = ""
+        for line in self.process.stdout:
+            buffer += line
+            try:
+                event = json.loads(buffer)
+            except json.JSONDecodeError:
+                continue
+
+            buffer = ""
+            self.notify(event)
+
+        with self.condition:
+            self.alive = False
+            self.condition.notify_all()
+
+    def notify(self, event: dict):
+        metadata = event.get("metadata") or {}
+        source = urllib.parse.urlparse(metadata.get("source", ""))
+        parts = source.path.strip("/").split("/")
+        project = event.get("project") or urllib.parse.parse_qs(source.query).get("project", ["default"])[0]
+
+        with self.condition:
+            self.sequence += 1
+
+            if(len(parts) >= 3):
+                self.events[(project, parts[1], parts[2])] = self.sequence
+
+            self.condition.notify_all()
+
+    def latest(self, keys: list) -> int:
+        return max([self.events.get(key, 0) for key in keys], default=0)
+
+    def wait(self, keys: list, since: int, timeout: float) -> int:
+        with self.condition:
+            if(self.alive):
+                self.condition.wait_for(lambda: self.latest(keys) > since or not self.alive, timeout)
+            else:
+                self.condition.wait(timeout)
+
+            return self.latest(keys)
+
+    def close(self):
+        if(self.process and self.process.poll() is None):
+            self.process.terminate()
+
+@atexit.register
+def closeEventMonitors():
+    for monitor in list(EventMonitor.monitors.values()):
+        monitor.close()
+
+def waitUntil(check, *, description: str, remote: str=None, project: str=None, keys: list=[], timeout: float=None, minDelay: float=0.2, maxDelay: float=5.0):
+    # Call check() until it returns something truthy. Between attempts, wait for a lifecycle event on one of
+    # the keys (e.g. ("instances", name)) or for an exponentially growing delay when nothing happens.
+    deadline = time.monotonic() + timeout if timeout else None
+    monitor = EventMonitor.get(remote) if remote else None
+    keys = [(project or "default", *key) for key in keys]
+    since = monitor.latest(keys) if monitor else 0
+    delay = minDelay
+
+    while(True):
+        tracer.count("polls")
+        result = check()
+        if(result):
+            return result
+
+        if(deadline and time.monotonic() >= deadline):
+            raise TimeoutError(f"Timed out after {timeout}s waiting for {description}.")
+
+        wait = min(delay, deadline - time.monotonic()) if deadline else delay
+
+        if(monitor):
+            latest = monitor.wait(keys, since, max(wait, 0))
+            if(latest > since):
+                since = latest
+                delay = minDelay
+                continue
+        else:
+            time.sleep(max(wait, 0))
+
+        delay = min(delay * 2, maxDelay)
+
+def waitForIPAddresses(project: pyincus.models.projects.Project, *, instance: "pyincus.models.instances.Instance | str", staticIPv4: str=None, staticIPv6: str=None, nic: str='eth0', remote: str=None, timeout: float=None):
     if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+        instance = session.instance(project, instance)
 
     if(instance.status.lower() != "running"):
         raise Exception(f"Instance is not running: {instance.status}")
 
-    network = project.networks.get(name=instance.expandedDevices[nic]["network"])
+    networkName = instance.expandedDevices[nic]["network"]
+    subnet4, subnet6 = session.networkSubnets(project, networkName)
 
-    ipv4Enabled = not pyincus.utils.isFalse(staticIPv4) and ("ipv4.address" in network.config and not pyincus.utils.isNone(network.config["ipv4.address"]))
-    ipv6Enabled = not pyincus.utils.isFalse(staticIPv6) and ("ipv6.address" in network.config and not pyincus.utils.isNone(network.config["ipv6.address"]))
+    ipv4Enabled = not pyincus.utils.isFalse(staticIPv4) and subnet4 is not None
+    ipv6Enabled = not pyincus.utils.isFalse(staticIPv6) and subnet6 is not None
 
-    subnet4 = ip_network(network.config["ipv4.address"], strict=False) if ipv4Enabled else None
-    subnet6 = ip_network(network.config["ipv6.address"], strict=False) if ipv6Enabled else None
+    leases = session.leases(project, networkName)
 
-    ipv4 = None
-    ipv6 = None
-    
-    while(True):
-        for address in instance.state["network"][nic]["addresses"]:
-            if(ipv4Enabled and address["family"] == "inet" and address["scope"] == "global" and ip_address(address["address"]) in subnet4):
-                ipv4 = address["address"]
-            
-            if(ipv6Enabled and address["family"] == "inet6" and address["scope"] == "global" and ip_address(address["address"]) in subnet6):
-                ipv6 = address["address"]
+    def addresses() -> list:
+        # Networks without leases (e.g. unmanaged ones) only have the state of the instance.
+        try:
+            return leases.addresses(instance.name, IP_POLL_MIN_DELAY)
+        except IncusException:
+            return [address["address"] for address in instance.state["network"][nic]["addresses"] if address["scope"] == "global"]
 
-            if((not ipv4Enabled or ipv4) and (not ipv6Enabled or ipv6)):
-                break
+    def check():
+        ipv4 = None
+        ipv6 = None
 
-        if((not ipv4Enabled or ipv4) and (not ipv6Enabled or ipv6)):
-            break
+        for address in addresses():
+            if(ipv4Enabled and not ":" in address and ip_address(address) in subnet4):
+                ipv4 = address
 
-        # Avoid spamming too much
-        time.sleep(0.2)
+            if(ipv6Enabled and ":" in address and ip_address(address) in subnet6):
+                ipv6 = address
 
-def waitForBoot(instance: "pyincus.models.instances.Instance | str"):
+        return (not ipv4Enabled or ipv4) and (not ipv6Enabled or ipv6)
+
+    waitUntil(check, description=f"IP addresses of {instance.name}", remote=remote, project=project.name, keys=[("instances", instance.name), ("networks", networkName)], timeout=timeout, minDelay=IP_POLL_MIN_DELAY, maxDelay=IP_POLL_MAX_DELAY)
+
+def waitForBoot(project: pyincus.models.projects.Project, *, instance: "pyincus.models.instances.Instance | str", command: str=None, remote: str=None, timeout: float=None):
     if(isinstance(instance, str)):
-        instance = project.instances.get(name=instance)
+        instance = session.instance(project, instance)
 
-    if(instance.type == "virtual-machine"):
-        time.sleep(15)
+    deadline = time.monotonic() + timeout if timeout else None
 
     if(instance.status.lower() != "running"):
-        time.sleep(5)
-        if(instance.status.lower() != "running"):
-            instance.start()
-            time.sleep(5)
+        instance.start()
+        session.invalidate(project, instance=instance.name)
 
-    while(True):
+    # Incus reports -1 processes until the agent of a virtual machine is up. It is the cheapest way to know
+    # the guest has booted without spawning anything inside of it.
+    def agentIsReady():
+        state = instance.state
+        return state["status"].lower() == "running" and state.get("processes", -1) > 0
+
+    waitUntil(agentIsReady, description=f"agent of {instance.name}", remote=remote, project=project.name, keys=[("instances", instance.name)], timeout=timeout)
+
+    if(not command):
+        return
+
+    def commandSucceeded():
         try:
-            instance.exec("whoami")
-            break
+            instance.exec(command)
+            return True
         except pyincus.exceptions.InstanceException as error:
             if(not isinstance(error, (pyincus.exceptions.InstanceIsPausedException,pyincus.exceptions.InstanceIsNotRunningException, pyincus.exceptions.InstanceExecFailedException, pyincus.exceptions.InstanceNotFoundException))):
                 print(f"{type(error).__name__}: {error}")
                 sys.exit(1)
 
-        # Avoid spamming too much
-        time.sleep(0.2)
- 
+        return False
+
+    waitUntil(commandSucceeded, description=f"readiness command of {instance.name}", remote=remote, project=project.name, keys=[("instances", instance.name)], timeout=max(deadline - time.monotonic(), 0) if deadline else None, minDelay=0.5)
+
 class Model(object):
     def __str__(self):
         return str(self.__dict__)
@@ -426,19 +1483,97 @@ class Model(object):
     def __repr__(self):
         return self.__str__()
 
-class Config(Model):
-    def __init__(self, name: str, remote: str, project: str, *, launch: dict=None, copy: dict=None, network: dict=None):
-        pyincus.models._models.Model().validateObjectFormat(name, remote, project)
-        self.name = name
-        self.remote = remote
-        self.project = project
+class Validators(object):
+    # The validators of pyincus are methods of its models, a single instance of each model is kept instead of
+    # one for every value checked.
+    def __init__(self):
+        self.models = {}
 
-        if(launch and copy):
-            raise Exception("There can only be one of them: launch and copy")
+    def model(self, module: str, name: str):
+        if(not (module, name) in self.models):
+            self.models[(module, name)] = getattr(getattr(pyincus.models, module), name)()
 
-        self.launch = self.Launch(**launch) if launch else None
-        self.copy = self.Copy(**copy) if copy else None
-        self.network = self.Network(**network) if network else None
+        return self.models[(module, name)]
+
+    @property
+    def object(self) -> "pyincus.models._models.Model":
+        return self.model("_models", "Model")
+
+    @property
+    def instance(self) -> "pyincus.models.instances.Instance":
+        return self.model("instances", "Instance")
+
+    @property
+    def forward(self) -> "pyincus.models.forwards.NetworkForward":
+        return self.model("forwards", "NetworkForward")
+
+    @property
+    def acl(self) -> "pyincus.models.acls.NetworkACL":
+        return self.model("acls", "NetworkACL")
+
+validators = Validators()
+
+class Config(Model):
+    def __init__(self, name: str, remote: "str | list", project: str, *, launch: dict=None, copy: dict=None, network: dict=None, readiness: dict=None, restart: bool=False):
+        # A list of remotes are the candidates the instance is placed on, the remote is only known once placed.
+        self.remotes = remote if isinstance(remote, list) else [remote]
+        if(len(self.remotes) == 0 or len(set(self.remotes)) != len(self.remotes)):
+            raise Exception("remote must be a remote or a list of distinct remotes.")
+
+        validators.object.validateObjectFormat(name, *self.remotes, project)
+        self.name = name
+        self.remote = self.remotes[0] if len(self.remotes) == 1 else None
+        self.project = project
+
+        if(launch and copy):
+            raise Exception("There can only be one of them: launch and copy")
+
+        self.launch = self.Launch(**launch) if launch else None
+        self.copy = self.Copy(**copy) if copy else None
+        self.network = self.Network(**network) if network else None
+        self.readiness = self.Readiness(**readiness) if readiness else None
+        self.restart = True if restart else False
+
+        if(self.network and self.remote):
+            self.network.place(self.remote)
+
+        # Inventory host of the instance, a replica is provisioned (or cloned) as the config it was expanded from.
+        self.host = name
+        self.replicaOf = None
+        self.replicaMethod = None
+
+    class Replicas(Model):
+        def __init__(self, *, count: int=None, names: list=None, name: str="{name}-{replica}", method: str="copy"):
+            if((count is None) == (names is None)):
+                raise Exception("Replicas must have one of them: count or names")
+
+            if(count is not None and (not isinstance(count, int) or count < 1)):
+                raise Exception("Replicas count must be a positive number.")
+
+            if(names is not None and (not isinstance(names, list) or len(names) == 0 or len(set(map(str, names))) != len(names))):
+                raise Exception("Replicas names must be a list of distinct names.")
+
+            if(not method in REPLICA_METHODS):
+                raise Exception(f"Replicas method must be within these values: {REPLICA_METHODS}")
+
+            self.count = count
+            self.names = [str(name) for name in names] if names else None
+            self.name = name
+            self.method = method
+
+        def fields(self, name: str) -> list:
+            # Values of the templates of each replica: {name} of the config, {index} from 1 and {replica}, its
+            # name within names or its index.
+            replicas = self.names or [i + 1 for i in range(self.count)]
+            return [{"name": name, "index": i + 1, "replica": replica} for i, replica in enumerate(replicas)]
+
+    class Readiness(Model):
+        def __init__(self, command: str=None, timeout: int=None):
+            if(timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0)):
+                raise Exception("Readiness timeout must be a positive number of seconds.")
+
+            self.command = command
+            self.timeout = timeout
 
     class Launch(Model):
         def __init__(self, image, config: dict=None, is_virtual_machine: bool=False):
@@ -448,22 +1583,22 @@ class Config(Model):
 
         class Image(Model):
             def __init__(self, name: str, remote: str):
-                pyincus.models._models.Model().validateObjectFormat(remote)
-                pyincus.models.instances.Instance().validateImageName(name)
+                validators.object.validateObjectFormat(remote)
+                validators.instance.validateImageName(name)
                 self.name = name
                 self.remote = remote
 
     class Copy(Model):
         def __init__(self, name: str, remote: str, project: str=None, config: dict=None):
-            pyincus.models._models.Model().validateObjectFormat(name, remote, project)
+            validators.object.validateObjectFormat(name, remote, project)
             self.name = name
             self.remote = remote
             self.project = project
             self.config = config
 
     class Network(Model):
-        def __init__(self, name: str, _type: str=None, description: str=None, config: dict=None, *, action: str='skip', nic: str='eth0',listen_address: str=None, ipv4: str=None, ipv6: str=None, static_ip: bool=False, forwards: list=[], acls: list=[]):
-            pyincus.models._models.Model().validateObjectFormat(name)
+        def __init__(self, name: str, _type: str=None, description: str=None, config: dict=None, *, action: str='skip', nic: str='eth0',listen_address: str=None, ipv4: str=None, ipv6: str=None, static_ip: bool=False, port_range: str=None, forwards: list=[], acls: list=[]):
+            validators.object.validateObjectFormat(name)
             self.name = name
             self.description = description
             self.action = action
@@ -471,14 +1606,17 @@ class Config(Model):
             self.config = config
             self.nic = nic
             
-            if(listen_address): 
-                try:
-                    IPv4Address(listen_address)
-                except:
+            # A mapping gives the listen address of each remote the instance may be placed on.
+            listenAddresses = listen_address if isinstance(listen_address, dict) else {None: listen_address}
+            for address in listenAddresses.values():
+                if(address):
                     try:
-                        IPv6Address(listen_address)
+                        IPv4Address(address)
                     except:
-                        raise Exception("listen_address must be a valid IPv4/IPv6 address.")
+                        try:
+                            IPv6Address(address)
+                        except:
+                            raise Exception("listen_address must be a valid IPv4/IPv6 address or a mapping of remotes to addresses.")
 
             if(ipv4 and not pyincus.utils.isFalse(ipv4)):
                 try:
@@ -492,107 +1630,278 @@ class Config(Model):
                 except:
                     raise Exception("ipv6 must be a valid IPv6 address.")
 
-            self.listenAddress = listen_address
+            self.listenAddresses = listen_address if isinstance(listen_address, dict) else None
+            self.listenAddress = None if self.listenAddresses else listen_address
 
             self.ipv4 = ipv4
             self.ipv6 = ipv6
 
             self.staticIp = True if static_ip else False
 
+            if(port_range is not None):
+                try:
+                    parsePortRange(port_range)
+                except argparse.ArgumentTypeError:
+                    raise Exception("port_range must be a port list (e.g. 20000-29999).")
+
+            self.portRange = port_range
+
             self.forwards = []
             for forward in forwards:
                 self.forwards.append(self.Forward(**forward))
 
+            # The port of an auto forward is given back to the same protocol and destination on a redeploy.
+            auto = [(forward.protocol, str(forward.destination)) for forward in self.forwards if forward.auto]
+            if(len(set(auto)) != len(auto)):
+                raise Exception("Forwards whose source is auto must have distinct destinations.")
+
             self.acls = []
             for acl in acls:
                 self.acls.append(self.ACL(**acl))
 
+        def place(self, remote: str):
+            if(self.listenAddresses is None):
+                return
+
+            self.listenAddress = self.listenAddresses.get(remote)
+            if(self.forwards and not self.listenAddress):
+                raise Exception(f"listen_address has no address for remote: {remote}")
+
         class Forward(Model):
-            def __init__(self, source: int, destination: int, protocol: str="tcp"):
-                pyincus.models.forwards.NetworkForward().validatePortList(ports=source)
-                pyincus.models.forwards.NetworkForward().validatePortList(ports=destination)
+            def __init__(self, source: "int | str", destination: int, protocol: str="tcp"):
+                # An auto source is given a free listen port of the port range when the challenge is deployed.
+                self.auto = source == "auto"
 
-                if(not protocol.lower() in pyincus.models.forwards.NetworkForward().possibleProtocols):
-                    raise Exception(f"Forward protocol must be within these values: {pyincus.models.forwards.NetworkForward().possibleProtocols}")
+                if(not self.auto):
+                    validators.forward.validatePortList(ports=source)
+                validators.forward.validatePortList(ports=destination)
 
-                self.source = source
+                if(self.auto and len(expandPorts(destination)) != 1):
+                    raise Exception("A forward whose source is auto must have a single destination port.")
+
+                if(not protocol.lower() in validators.forward.possibleProtocols):
+                    raise Exception(f"Forward protocol must be within these values: {validators.forward.possibleProtocols}")
+
+                self.source = None if self.auto else source
                 self.destination = destination
                 self.protocol = protocol.lower()
 
         class ACL(Model):
             def __init__(self, name: str, *, description: str=None, egress: list=[], ingress: list=[]):
-                pyincus.models._models.Model().validateObjectFormat(name)
+                validators.object.validateObjectFormat(name)
 
                 self.name = name
                 self.description = description
                 
-                pyincus.models.acls.NetworkACL().validateGress(egress)
-                pyincus.models.acls.NetworkACL().validateGress(ingress)
+                validators.acl.validateGress(egress)
+                validators.acl.validateGress(ingress)
 
                 self.egress = egress
                 self.ingress = ingress
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument("challengePath", type=str)
-    parser.add_argument("-v", "--verbose", help="Verbose", action="store_true")
-    parser.add_argument("-f", "--force", help="Force deletion if instance exists", action="store_true")
-    parser.add_argument("-k", "--keep-instances-on-failure", dest='keepInstancesOnFailure', help="Keep instance(s) if the script fails.", action="store_true")
-    parser.add_argument("-a", "--apply", help="Apply configuration file without redeploying (can only be done if the instance exists).", action="store_true")
-    parser.add_argument("-t", "--test", help="Once completed, destroy everything (only the instance is destroyed at the moment).", action="store_true")
-
-    purge = parser.add_argument_group('purge')
-    purge.add_argument("--purge", help="Completely remove an instance and forward ports.", action="store_true")
-    purge.add_argument("--remote", help="Specify remote.", type=str)
-    purge.add_argument("--project", help="Specify project.", type=str)
-    purge.add_argument("--nic", help="Specify NIC (Network Interface Card). Default 'eth0'.", default="eth0", type=str)
-
-    args = parser.parse_args()
-
-    if(args.purge):
-        args.force = True
-
-        if(not args.remote or not args.project):
-            print("Missing --remote and/or --project arguments.")
-            sys.exit(1)
+class Challenge(Model):
+    def __init__(self, path: str, *, config: list, ansible: dict=None, placement: dict=None):
+        self.path = path
+        self.config = config
+        self.ansible = self.Ansible(**ansible) if ansible else self.Ansible()
+        self.placement = self.Placement(**placement) if placement else self.Placement()
+
+        names = [conf.name for conf in config]
+        for name in names:
+            if(names.count(name) > 1):
+                raise Exception(f"Instance name is used more than once: {name}")
+
+        # Only the first replica of a config is provisioned, the inventory host of the config targets it.
+        hosts = [conf.host for conf in config if not conf.replicaOf]
+        for host in hosts:
+            if(hosts.count(host) > 1):
+                raise Exception(f"Inventory host is used more than once: {host}")
+
+        self.hostVars = {conf.host: {"ansible_incus_host": conf.name} for conf in config if conf.host != conf.name and not conf.replicaOf}
+
+    class Ansible(Model):
+        def __init__(self, *, per_host: bool=False, pipelining: bool=True, fact_cache: bool=True, fact_cache_timeout: int=86400, gather_facts: bool=True, forks: int=None, env: dict={}, resume_from_failed_task: bool=True, abort_on_failure: bool=True):
+            if(forks is not None and (not isinstance(forks, int) or forks < 1)):
+                raise Exception("Ansible forks must be a positive number.")
+
+            if(not isinstance(fact_cache_timeout, int) or fact_cache_timeout < 0):
+                raise Exception("Ansible fact_cache_timeout must be a number of seconds.")
+
+            if(not isinstance(env, dict)):
+                raise Exception("Ansible env must be a mapping of environment variables.")
+
+            self.perHost = True if per_host else False
+            self.pipelining = True if pipelining else False
+            self.factCache = True if fact_cache else False
+            self.factCacheTimeout = fact_cache_timeout
+            self.gatherFacts = True if gather_facts else False
+            self.forks = forks
+            self.env = env
+            self.resumeFromFailedTask = True if resume_from_failed_task else False
+            self.abortOnFailure = True if abort_on_failure else False
+
+    class Placement(Model):
+        def __init__(self, *, policy: str="least-loaded", affinity: str="network", max_instances_per_cpu: float=None, max_memory_usage: float=None):
+            if(not policy in PLACEMENT_POLICIES):
+                raise Exception(f"Placement policy must be within these values: {PLACEMENT_POLICIES}")
+
+            if(not affinity in ["network", "challenge"]):
+                raise Exception("Placement affinity must be within these values: ['network', 'challenge']")
+
+            if(max_instances_per_cpu is not None and (not isinstance(max_instances_per_cpu, (int, float)) or max_instances_per_cpu <= 0)):
+                raise Exception("Placement max_instances_per_cpu must be a positive number.")
+
+            if(max_memory_usage is not None and (not isinstance(max_memory_usage, (int, float)) or not 0 < max_memory_usage <= 1)):
+                raise Exception("Placement max_memory_usage must be a ratio between 0 and 1.")
+
+            self.policy = policy
+            self.affinity = affinity
+            self.maxInstancesPerCPU = max_instances_per_cpu
+            self.maxMemoryUsage = max_memory_usage
+
+
+class PrefixedOutput(object):
+    # Prefix every line written by a worker thread with the challenge it is working on. Lines are buffered
+    # per thread so output of concurrent deployments is never mixed on the same line. A thread may also write
+    # to its own target instead of the stream (e.g. the client of a daemon request).
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @property
+    def prefix(self):
+        return getattr(self.local, "prefix", None)
+
+    @prefix.setter
+    def prefix(self, value):
+        self.flush()
+        self.local.prefix = value
+
+    @property
+    def target(self):
+        return getattr(self.local, "target", None) or self.stream
+
+    @target.setter
+    def target(self, value):
+        self.flush()
+        self.local.target = value
+
+    @property
+    def context(self) -> tuple:
+        return (self.prefix, getattr(self.local, "target", None))
+
+    @context.setter
+    def context(self, value: tuple):
+        self.prefix, self.target = value
+
+    def write(self, data: str):
+        if(not self.prefix):
+            with self.lock:
+                return self.target.write(data)
+
+        buffer = getattr(self.local, "buffer", "") + data
+        lines = buffer.splitlines(keepends=True)
+
+        if(lines and not lines[-1].endswith("\n")):
+            self.local.buffer = lines.pop()
+        else:
+            self.local.buffer = ""
 
-        if(not pyincus.remotes.exists(name=args.remote)):
-            print(f"Remote was not found: {args.remote}")
-            sys.exit(1)
+        if(lines):
+            with self.lock:
+                self.target.write(''.join(f"[{self.prefix}] {line}" for line in lines))
 
-        remote = pyincus.remotes.get(name=args.remote)
+        return len(data)
 
-        if(not remote.projects.exists(name=args.project)):
-            print(f"Project was not found: {args.project}")
-            sys.exit(1)
+    def flush(self):
+        buffer = getattr(self.local, "buffer", "")
+        if(buffer):
+            self.local.buffer = ""
+            with self.lock:
+                self.target.write(f"[{self.prefix}] {buffer}\n")
 
-        project = remote.projects.get(name=args.project)
+        self.target.flush()
 
-        if(not project.instances.exists(name=args.challengePath)):
-            print(f"Instance was not found: {args.challengePath}")
-            sys.exit(1)
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
-        instance = project.instances.get(name=args.challengePath)
+networkLock = threading.Lock()
+# Parsed challenges by path and modification time of their files, a daemon only parses them again once edited.
+# Every caller gets its own copy, concurrent requests may change what they were given (e.g. placement).
+configCache = {}
+configCacheLock = threading.Lock()
 
-        destroy(project=project, args=args, instance=instance, nic=args.nic)
+def findChallengePath(path: str) -> str:
+    if(os.path.exists(path) and os.path.isdir(path)):
+        return path
+    elif(os.path.exists(os.path.join(CHALLENGES_DIRECTORY, path)) and os.path.isdir(os.path.join(CHALLENGES_DIRECTORY, path))):
+        return os.path.join(CHALLENGES_DIRECTORY, path)
 
-        sys.exit(1)
+    return None
 
-    if(os.path.exists(args.challengePath) and os.path.isdir(args.challengePath)):
-        challengePath = args.challengePath
-        if(args.verbose):
-            print(f"[DEBUG] challengePath: {challengePath}")
-    elif(os.path.exists(os.path.join(CHALLENGES_DIRECTORY, args.challengePath)) and os.path.isdir(os.path.join(CHALLENGES_DIRECTORY, args.challengePath))):
-        challengePath = os.path.join(CHALLENGES_DIRECTORY, args.challengePath)
+def listChallenges(directory: str=CHALLENGES_DIRECTORY) -> list:
+    if(not os.path.isdir(directory)):
+        return []
+
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if os.path.isfile(os.path.join(directory, name, CONFIGURATION_FILE_NAME))]
+
+def formatPorts(ports: str, fields: dict) -> "int | str":
+    ports = ports.format(**fields)
+    return int(ports) if ports.isdigit() else ports
+
+def expandReplicas(conf: dict) -> list:
+    # A config with replicas is one instance per replica. Their names, addresses, listen addresses and forward
+    # sources are templates, e.g. "web-{replica}" or "10.20.1.{index}".
+    if(not isinstance(conf, dict) or not conf.get("replicas")):
+        return [Config(**conf)]
+
+    conf = dict(conf)
+    replicas = Config.Replicas(**conf.pop("replicas"))
+    expanded = []
+
+    try:
+        for fields in replicas.fields(conf.get("name")):
+            replica = dict(conf, name=replicas.name.format(**fields))
+
+            if(conf.get("network")):
+                network = replica["network"] = dict(conf["network"])
+                for key in ["ipv4", "ipv6", "listen_address"]:
+                    if(isinstance(network.get(key), str)):
+                        network[key] = network[key].format(**fields)
+                    elif(isinstance(network.get(key), dict)):
+                        network[key] = {remote: address.format(**fields) if isinstance(address, str) else address for remote, address in network[key].items()}
+
+                network["forwards"] = [dict(forward, source=formatPorts(forward["source"], fields)) if isinstance(forward, dict) and isinstance(forward.get("source"), str) else forward for forward in network.get("forwards") or []]
+
+            expanded.append(Config(**replica))
+    except (KeyError, IndexError) as error:
+        raise Exception(f"Unknown replicas template field: {error}")
+
+    for replica in expanded:
+        replica.host = conf.get("name")
+        replica.replicaOf = expanded[0].name if replica is not expanded[0] else None
+        replica.replicaMethod = replicas.method
+
+    return expanded
+
+def parseConfig(challengePath: str, configContent: dict) -> Challenge:
+    if(not isinstance(configContent, dict) or not "config" in configContent):
+        raise Exception("config.yml must have a config key.")
+
+    config = []
+
+    if(isinstance(configContent["config"], list)):
+        for conf in configContent["config"]:
+            config += expandReplicas(conf)
+    elif(isinstance(configContent["config"], dict)):
+        config += expandReplicas(configContent["config"])
     else:
-        print(os.path.join(CHALLENGES_DIRECTORY, args.challengePath))
-        print("challengePath must be the folder name of the challenge of the path to the challenge.")
-        print("")
-        print("Examples:")
-        print(f"\tpython3 {__file__} test-challenge-deployment")
-        print(f"\tpython3 {__file__} ./containers/test-challenge-deployment/")
-        sys.exit(1)
+        raise Exception("config must be an instance or a list of instances.")
 
+    return Challenge(challengePath, config=config, ansible=configContent.get("ansible"), placement=configContent.get("placement"))
+
+def loadConfig(args, challengePath: str) -> Challenge:
     configPath = os.path.join(challengePath, CONFIGURATION_FILE_NAME)
     inventoryPath = os.path.join(challengePath, INVENTORY_FILE_NAME)
     challengeYamlPath = os.path.join(challengePath, CHALLENGE_FILE_NAME)
@@ -609,196 +1918,2882 @@ if __name__ == '__main__':
         print(f"Missing challenge file: {challengeYamlPath}")
         sys.exit(1)
 
+    key = (os.path.abspath(challengePath), *[os.stat(path).st_mtime_ns for path in [configPath, inventoryPath, challengeYamlPath]])
+    with configCacheLock:
+        if(key in configCache):
+            return copy.deepcopy(configCache[key])
+
     with open(configPath) as f:
         configContent = yaml.safe_load(f.read())
 
-    if(not "config" in configContent):
+    if(not configContent or not "config" in configContent):
         printHelp()
         sys.exit(1)
 
-    config = []
-
     try:
-        if(isinstance(configContent["config"], list)):
-            for conf in configContent["config"]:
-                config.append(Config(**conf))
-        elif(isinstance(configContent["config"], dict)):
-            config.append(Config(**configContent["config"]))
-        else:
-            raise Exception()
+        challenge = parseConfig(challengePath, configContent)
     except Exception as error:
         printHelp()
         print(f"{type(error).__name__}: {error}")
         sys.exit(1)
 
     if(args.verbose):
-        print(f"[DEBUG] config: {config}")
-    
+        print(f"[DEBUG] config: {challenge.config}")
+
+    with configCacheLock:
+        configCache[key] = challenge
+
+    return copy.deepcopy(challenge)
+
+def ensureNetwork(project: pyincus.models.projects.Project, args, *, network: "Config.Network") -> pyincus.models.networks.Network:
+    # Challenges deployed in parallel may share a network, only one of them may create or update it at a time.
+    with networkLock:
+        if(network.action in ['create', 'update', 'skip']):
+            if(project.networks.exists(name=network.name)):
+                if(network.action != 'skip' and network.action == 'create'):
+                    raise Exception(f"Network '{network.name}' already exists.")
+                elif(network.action == 'skip'):
+                    return session.network(project, network.name)
+                elif(network.action == 'update'):
+                    if(args.verbose):
+                        print(f"[DEBUG] Network '{network.name}' already existed.")
+                        print(f"[DEBUG] Updating network: '{network.name}'")
+
+                    current = session.network(project, network.name)
+
+                    if(current.description != network.description):
+                        current.description = network.description
+
+                    if(network.config):
+                        current.config = {**current.config, **network.config}
+
+                    session.invalidate(project, network=network.name)
+
+                    return current
+            else:
+                if(not network.type):
+                    raise Exception("Type must be specified when creating a network.")
+
+                if(args.verbose):
+                    print(f"[DEBUG] Creating network: {network.name}")
+
+                created = project.networks.create(name=network.name, _type=network.type, description=network.description, config=network.config)
+                ledger.record("network", session.remoteOf(project), project.name, network.name, data={"type": network.type})
+
+                return created
+        else:
+            if(not project.networks.exists(name=network.name)):
+                raise Exception(f"Network was not found: {network.name}")
+
+            return session.network(project, network.name)
+
+def cleanup(args, config: list):
+    with tracer.span("teardown"):
+        teardown(args, config)
+
+def teardown(args, config: list):
+    if(args.verbose):
+        print("Cleaning...")
+
+    # Forwards and ACLs of every instance are collected first and released once per project at the end. Instances
+    # recorded in the ledger are destroyed from what it holds, the others are looked up in incus.
+    destroyed = {}
+
     for conf in config:
-        if(not pyincus.remotes.exists(name=conf.remote)):
-            print(f"Remote was not found: {conf.remote}")
-            sys.exit(1)
+        project = session.project(conf.remote, conf.project)
+        recorded = ledger.find("instance", conf.remote, conf.project, conf.name)
+        if(recorded or project.instances.exists(name=conf.name)):
+            destroyed.setdefault(id(project), (project, [], []))[1].append(conf)
 
-        remote = pyincus.remotes.get(name=conf.remote)
+            if(recorded):
+                destroyed[id(project)][2].append(recorded)
 
-        if(not remote.projects.exists(name=conf.project)):
-            print(f"Project was not found: {conf.project}")
-            sys.exit(1)
+    for project, confs, recorded in destroyed.values():
+        unrecorded = [conf.name for conf in confs if not conf.name in [instance["name"] for instance in recorded]]
+        acls = recordedACLs(session.remoteOf(project), project.name, recorded)
 
-        project = remote.projects.get(name=conf.project)
+        if(unrecorded):
+            acls = sorted(set(acls + associatedACLs(project=project, args=args, instance=unrecorded)))
 
-        kwargs = {
-            "name": conf.name,
-            "remoteSource": None,
-            "projectSource": None,
-            "nameSource": None,
-            "isClone": False,
-            "isVM": False,
-            "nic": "eth0"
-        }
+        for conf in confs:
+            instance = conf.name if conf.name in [instance["name"] for instance in recorded] else session.instance(project, conf.name)
+            destroy(project=project, args=args, instance=instance, nic=conf.network.nic if conf.network else 'eth0', commitForwards=False, releaseACLs=False)
 
-        if(conf.launch):
-            kwargs["nameSource"] = conf.launch.image.name
-            kwargs["remoteSource"] = conf.launch.image.remote
-            kwargs["config"] = conf.launch.config
-            kwargs["isVM"] = conf.launch.isVM
+        session.commitForwards(args)
+        releaseNetworkACLs(project=project, args=args, acls=acls, instances=[conf.name for conf in confs])
 
-        if(conf.copy):
-            kwargs["nameSource"] = conf.copy.name
-            kwargs["remoteSource"] = conf.copy.remote
-            kwargs["projectSource"] = conf.copy.project
-            kwargs["config"] = conf.copy.config
-            kwargs["isClone"] = True
+def instanceArguments(conf: Config) -> dict:
+    kwargs = {
+        "name": conf.name,
+        "remoteSource": None,
+        "projectSource": None,
+        "nameSource": None,
+        "isClone": False,
+        "isVM": False,
+        "nic": "eth0"
+    }
 
-            kwargs["isVM"] = pyincus.remotes.get(name=conf.copy.remote).projects.get(name=conf.copy.project).instances.get(name=conf.copy.name).type == "virtual-machine"
+    if(conf.launch):
+        kwargs["nameSource"] = conf.launch.image.name
+        kwargs["remoteSource"] = conf.launch.image.remote
+        kwargs["config"] = conf.launch.config
+        kwargs["isVM"] = conf.launch.isVM
 
-        if(conf.network):
-            network = None
-
-            if(conf.network.action in ['create', 'update', 'skip']):
-                if(project.networks.exists(name=conf.network.name)):
-                    if(conf.network.action != 'skip' and conf.network.action == 'create'):
-                        raise Exception(f"Network '{conf.network.name}' already exists.")
-                    elif(conf.network.action == 'skip'):
-                        network = project.networks.get(name=conf.network.name)
-                    elif(conf.network.action == 'update'):
-                        if(args.verbose):
-                            print(f"[DEBUG] Network '{conf.network.name}' already existed.")
-                            print(f"[DEBUG] Updating network: '{conf.network.name}'")
-
-                        network = project.networks.get(name=conf.network.name)
-                        
-                        if(network.description != conf.network.description):
-                            network.description = conf.network.description
-
-                        if(conf.network.config):
-                            network.config = {**network.config, **conf.network.config}
-                else:
-                    if(not conf.network.type):
-                        raise Exception("Type must be specified when creating a network.")
+    if(conf.copy):
+        kwargs["nameSource"] = conf.copy.name
+        kwargs["remoteSource"] = conf.copy.remote
+        kwargs["projectSource"] = conf.copy.project
+        kwargs["config"] = conf.copy.config
+        kwargs["isClone"] = True
 
-                    if(args.verbose):
-                        print(f"[DEBUG] Creating network: {conf.network.name}")
+        kwargs["isVM"] = session.instance(session.project(conf.copy.remote, conf.copy.project), conf.copy.name).type == "virtual-machine"
 
-                    network = project.networks.create(name=conf.network.name, _type=conf.network.type, description=conf.network.description, config=conf.network.config)
-            else:
-                if(not project.networks.exists(name=conf.network.name)):
-                    raise Exception(f"Network was not found: {conf.network.name}")
+    if(conf.network and conf.network.nic):
+        kwargs["nic"] = conf.network.nic
 
-                network = project.networks.get(name=conf.network.name)
+    return kwargs
 
-            kwargs["network"] = network
+def ansibleEnvironment(challengePath: str, ansible: Challenge.Ansible, *, forget: list=[]) -> dict:
+    envvars = {"ANSIBLE_PIPELINING": str(ansible.pipelining)}
 
-            if(conf.network.nic):
-                kwargs["nic"] = conf.network.nic 
+    if(ansible.factCache):
+        # Facts are kept per challenge across runs. Facts of hosts which were just (re)launched are dropped since
+        # their addresses and hostname changed.
+        directory = os.path.join(FACT_CACHE_DIRECTORY, hashlib.sha256(os.path.abspath(challengePath).encode()).hexdigest()[:16])
+        os.makedirs(directory, exist_ok=True)
 
-        if(not args.apply):
-            instance = deploy(project=project, args=args, **kwargs)
-        else:
-            instance = project.instances.get(name=conf.name)
+        for host in forget:
+            try:
+                os.remove(os.path.join(directory, host))
+            except OSError:
+                pass
+
+        envvars.update({"ANSIBLE_GATHERING": "smart", "ANSIBLE_CACHE_PLUGIN": "jsonfile", "ANSIBLE_CACHE_PLUGIN_CONNECTION": directory, "ANSIBLE_CACHE_PLUGIN_TIMEOUT": str(ansible.factCacheTimeout)})
+
+    if(not ansible.gatherFacts):
+        envvars["ANSIBLE_GATHERING"] = "explicit"
+
+    envvars.update({key: str(value) for key, value in ansible.env.items()})
+
+    return envvars
+
+def printTaskTimings(durations: dict, limit: int=10):
+    if(not durations):
+        return
+
+    print("Slowest tasks:")
+    for task, values in sorted(durations.items(), key=lambda item: max(item[1]), reverse=True)[:limit]:
+        print(f"\t{max(values):7.1f}s {task} ({len(values)} host(s))")
+
+def eventTime(value: str) -> float:
+    # Ansible runner timestamps are ISO 8601, in UTC when they carry no timezone.
+    if(not value):
+        return None
 
     try:
-        for conf in config:
-            project = pyincus.remotes.get(name=conf.remote).projects.get(name=conf.project)
-            instance = project.instances.get(name=conf.name)
-            waitForIPAddresses(instance=instance, staticIPv4=conf.network.ipv4, staticIPv6=conf.network.ipv6, nic=conf.network.nic)
-
-            if("isVM" in kwargs and kwargs["isVM"]):
-                waitForBoot(instance=instance)
-    except:
-        import traceback
-        print(traceback.format_exc())
-        if(not args.keepInstancesOnFailure):
-            if(args.verbose):
-                print("Cleaning...")
-            for conf in config:
-                project = pyincus.remotes.get(name=conf.remote).projects.get(name=conf.project)
-                instance = project.instances.get(name=conf.name)
-                if(conf.network):
-                    destroy(project=project, args=args, instance=instance, nic=conf.network.nic)
-                else:
-                    destroy(project=project, args=args, instance=instance)
+        timestamp = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
 
-        sys.exit(1)
-    
-    # ensure all vms are up after  restart before lauching ansible
-    for conf in config:
-        project = pyincus.remotes.get(name=conf.remote).projects.get(name=conf.project)
-        instance = project.instances.get(name=conf.name)
-        waitForIPAddresses(instance=instance, staticIPv4=conf.network.ipv4, staticIPv6=conf.network.ipv6, nic=conf.network.nic)
+    return (timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=datetime.timezone.utc)).timestamp()
 
-        if("isVM" in kwargs and kwargs["isVM"]):
-            waitForBoot(instance=instance)
+def provision(args, challengePath: str, *, limit: str=None, ansible: Challenge.Ansible=None, hosts: int=1, forget: list=[], restarts: set=None, failures: dict=None, startAtTask: str=None, hostVars: dict=None) -> bool:
+    ident = uuid.uuid4().hex
+    ansible = ansible or Challenge.Ansible()
+    envvars = ansibleEnvironment(challengePath, ansible, forget=forget)
 
-    r = ansible_runner.run(debug=True, private_data_dir=challengePath, playbook=CHALLENGE_FILE_NAME)
+    if(args.verbose):
+        print(f"[DEBUG] Ansible environment: {envvars}")
+
+    if(startAtTask):
+        print(f"Resuming the playbook at task: {startAtTask}")
+
+    # Variables of placed hosts (e.g. ansible_incus_remote) are given by a second inventory, host variables
+    # override the group variables of the challenge's inventory.
+    inventory = None
+    if(hostVars):
+        descriptor, placementInventory = tempfile.mkstemp(prefix="incus-track-deployment-", suffix=".json")
+        with os.fdopen(descriptor, "w") as f:
+            json.dump({"all": {"hosts": hostVars}}, f)
+
+        inventory = [os.path.join(os.path.abspath(challengePath), INVENTORY_FILE_NAME), placementInventory]
+
+    durations = {}
+    plays = {}
+    progress = {}
+    aborted = threading.Event()
+
+    def handle(event: dict) -> bool:
+        # Events are handled as the playbook runs instead of once it is over, none of them is written to the artifacts.
+        if(not event.get("event") in ["runner_on_ok", "runner_on_failed", "runner_on_skipped", "runner_on_unreachable"]):
+            return False
+
+        data = event.get("event_data") or {}
+        result = data.get("res") or {}
+        host = data.get("host") or ""
+        failed = event["event"] in ["runner_on_failed", "runner_on_unreachable"]
+        durations.setdefault(data.get("task") or "", []).append(float(data.get("duration") or 0))
+
+        end = eventTime(data.get("end") or event.get("created")) or time.time()
+        start = eventTime(data.get("start")) or end - float(data.get("duration") or 0)
+        plays.setdefault(data.get("play") or "", []).append({"start": start, "end": end, "status": "error" if failed else "ok", "task": data.get("task") or "", "host": host})
+
+        # The first task which failed on a host (ignored errors aside) is where --resume starts the playbook again.
+        if(failures is not None and failed and not data.get("ignore_errors") and not host in failures):
+            failures[host] = data.get("task")
+
+        # A playbook asks for a restart with `set_fact: incus_restart=true`.
+        facts = result.get("ansible_facts") or {}
+        if(restarts is not None and facts.get("incus_restart") and not pyincus.utils.isFalse(facts["incus_restart"])):
+            restarts.add(host)
+
+        # Ansible's own output is only shown with --verbose, otherwise one line per host and task.
+        progress[host] = progress.get(host, 0) + 1
+        if(not args.verbose):
+            status = {"runner_on_ok": "changed" if result.get("changed") else "ok", "runner_on_failed": "failed", "runner_on_skipped": "skipped", "runner_on_unreachable": "unreachable"}[event["event"]]
+            message = f" ({result['msg']})" if failed and result.get("msg") else ""
+            print(f"{host} [{progress[host]}] {status}{' (ignored)' if data.get('ignore_errors') and failed else ''}: {data.get('task') or ''}{message}")
+
+        # The playbook is stopped at the first failure instead of provisioning the other hosts for nothing.
+        if(failed and not data.get("ignore_errors") and ansible.abortOnFailure and not aborted.is_set()):
+            print(f"{host}: task failed, the playbook is aborted: {data.get('task')}")
+            aborted.set()
+
+        return False
+
+    # Artifacts are written to a temporary directory and env/ files are not written (the environment variables and
+    # command line go to the process), nothing is written to the challenge so concurrent runs do not share them.
+    artifactDirectory = tempfile.mkdtemp(prefix="incus-track-deployment-ansible-")
+
+    # The run is shared by every host unless limited, so it is not attributed to the instance whose thread runs it.
+    try:
+        with tracer.span("ansible", instance=limit or "", limit=limit or "all") as span:
+            r = ansible_runner.run(debug=args.verbose, quiet=not args.verbose, private_data_dir=challengePath, artifact_dir=artifactDirectory, playbook=CHALLENGE_FILE_NAME, ident=ident, limit=limit, envvars=envvars, forks=ansible.forks or max(hosts, 1), cmdline=f"--start-at-task {shlex.quote(startAtTask)}" if startAtTask else None, inventory=inventory, suppress_env_files=True, event_handler=handle, cancel_callback=aborted.is_set)
+    finally:
+        if(inventory):
+            os.remove(inventory[1])
 
-    if(r.rc != 0):
-        shutil.rmtree(os.path.join(challengePath, "artifacts"))
+        shutil.rmtree(artifactDirectory, ignore_errors=True)
 
-        if(not args.keepInstancesOnFailure):
-            if(args.verbose):
-                print("Cleaning...")
-            for conf in config:
-                project = pyincus.remotes.get(name=conf.remote).projects.get(name=conf.project)
-                instance = project.instances.get(name=conf.name)
-                if(conf.network):
-                    destroy(project=project, args=args, instance=instance, nic=conf.network.nic)
-                else:
-                    destroy(project=project, args=args, instance=instance)
+    for name, tasks in plays.items():
+        status = "error" if any(task["status"] == "error" for task in tasks) else "ok"
+        play = tracer.record("ansible.play", start=min(task["start"] for task in tasks), end=max(task["end"] for task in tasks), parent=span, status=status, play=name)
 
-        sys.exit(1)
+        for task in tasks:
+            tracer.record("ansible.task", parent=play, instance=task["host"], **task)
 
-    shutil.rmtree(os.path.join(challengePath, "artifacts"))
+    printTaskTimings(durations)
 
-    for conf in config:
-        if(conf.network):
-            project = pyincus.remotes.get(name=conf.remote).projects.get(name=conf.project)
-            instance = project.instances.get(name=conf.name)
+    return r.rc == 0
 
-            if(conf.network.staticIp or conf.network.ipv4 or conf.network.ipv6):
-                setStaticIP(project=project, args=args, instance=instance, ipv4=conf.network.ipv4, ipv6=conf.network.ipv6, nic=conf.network.nic)
-        
-            instance.restart()
-                
-            if(conf.network.acls):
+class AddressManager(object):
+    # Addresses of the instances with static_ip, picked before launch so the instance boots on its final address
+    # instead of waiting for a DHCP lease which is pinned afterwards. The addresses in use on a network (its own,
+    # the leases, the NIC devices of the instances of the project and the reservations of the ledger) are indexed
+    # once, free addresses are then taken in order from the subnet. Reservations go through the ledger like
+    # listen ports, and an instance gets back the address it had while it is free.
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.used = {}
+        self.hosts = {}
+        self.free = {}
+
+    def index(self, project: pyincus.models.projects.Project, network: pyincus.models.networks.Network) -> str:
+        remote = session.remoteOf(project)
+        scope = f"{remote} {project.name} {network.name}"
+
+        if(scope in self.used):
+            return scope
+
+        used = set(ledger.reserved("address", scope))
+        config = network.config
+        for key in ["ipv4.address", "ipv6.address"]:
+            if(key in config and not pyincus.utils.isNone(config[key])):
+                used.add(str(ip_interface(config[key]).ip))
+
+        try:
+            used.update([str(ip_address(lease["address"])) for lease in incusQuery(remote, f"/1.0/networks/{urllib.parse.quote(network.name)}/leases", project=project.name) or []])
+        except IncusException as error:
+            # Only managed networks have leases.
+            if(not "not found" in str(error).lower() and not "not supported" in str(error).lower()):
+                raise
+
+        for instance in incusQuery(remote, "/1.0/instances?recursion=1", project=project.name) or []:
+            for device in (instance.get("expanded_devices") or {}).values():
+                if(device.get("type") == "nic" and device.get("network") == network.name):
+                    used.update([str(ip_address(device[key])) for key in ["ipv4.address", "ipv6.address"] if device.get(key) and not pyincus.utils.isNone(device[key])])
+
+        self.used[scope] = used
+
+        return scope
+
+    def allocate(self, args, project: pyincus.models.projects.Project, *, instance: str, network: pyincus.models.networks.Network, family: str, reserve: bool=True) -> str:
+        remote = session.remoteOf(project)
+        subnet4, subnet6 = session.networkSubnets(project, network.name)
+        subnet = subnet4 if family == "ipv4" else subnet6
+
+        with self.lock:
+            scope = self.index(project, network)
+            used = self.used[scope]
+
+            previous = ledger.reservation("address", scope, remote, project.name, instance, family)
+            if(previous and ip_address(previous[0]) in subnet and (previous[1] is None or not previous[0] in used)):
+                if(not reserve or ledger.reserve("address", scope, previous[0], remote, project.name, instance, family)):
+                    used.add(previous[0])
+                    return previous[0]
+
+            free = self.free.setdefault((scope, family), [])
+            hosts = self.hosts.setdefault((scope, family), subnet.hosts())
+
+            while(True):
+                address = free.pop() if free else next(hosts, None)
+                if(address is None):
+                    raise Exception(f"No free {family} address left in {subnet} on network: {network.name}")
+
+                address = str(address)
+                if(address in used):
+                    continue
+
+                if(not reserve):
+                    free.append(address)
+                    return address
+
+                # Reserved by a concurrent run since the index was built otherwise.
+                used.add(address)
+                if(ledger.reserve("address", scope, address, remote, project.name, instance, family)):
+                    return address
+
+    def reserve(self, args, project: pyincus.models.projects.Project, *, instance: str, network: pyincus.models.networks.Network, family: str, address: str) -> str:
+        # Addresses given in config.yml, the conflict with the reservation of another instance is returned.
+        remote = session.remoteOf(project)
+        address = str(ip_address(address))
+
+        with self.lock:
+            scope = self.index(project, network)
+
+            if(not ledger.reserve("address", scope, address, remote, project.name, instance, family)):
+                return f"{address} is reserved by {ledger.reservedBy('address', scope, address) or 'another instance'}"
+
+            self.used[scope].add(address)
+
+        return None
+
+    def release(self, remote: str, project: str, instance: str) -> list:
+        with self.lock:
+            released = ledger.releaseReservations("address", remote, project, instance)
+
+            for scope, address in released:
+                if(scope in self.used):
+                    self.used[scope].discard(address)
+                    self.free.setdefault((scope, "ipv6" if ":" in address else "ipv4"), []).append(address)
+
+        return released
+
+    def forget(self):
+        with self.lock:
+            self.used = {}
+            self.hosts = {}
+            self.free = {}
+
+addressManager = AddressManager()
+
+def staticAddresses(project: pyincus.models.projects.Project, args, *, conf: Config, network: pyincus.models.networks.Network) -> dict:
+    # Addresses known before launch are pinned at creation, IPv6 only on networks with stateful DHCPv6. With
+    # static_ip, the addresses which are not given are picked from the free addresses of the network.
+    addresses = {}
+    subnet4, subnet6 = session.networkSubnets(project, network.name)
+    stateful = network.config.get("ipv6.dhcp.stateful")
+
+    for family, address, enabled in [("ipv4", conf.network.ipv4, subnet4 is not None), ("ipv6", conf.network.ipv6, subnet6 is not None and stateful)]:
+        if(address and pyincus.utils.isFalse(address)):
+            continue
+
+        if(address and (family == "ipv4" or stateful)):
+            conflict = addressManager.reserve(args, project, instance=conf.name, network=network, family=family, address=address)
+            if(conflict):
+                raise Exception(f"Address conflict: {conflict}")
+
+            addresses[f"{family}.address"] = address
+        elif(not address and conf.network.staticIp and enabled):
+            addresses[f"{family}.address"] = addressManager.allocate(args, project, instance=conf.name, network=network, family=family)
+
+            if(args.verbose):
+                print(f"[DEBUG] Address allocated to {conf.name}: {addresses[f'{family}.address']}")
+
+    return addresses
+
+def finalize(project: pyincus.models.projects.Project, args, *, instance: pyincus.models.instances.Instance, conf: Config, restart: bool=False, addresses: dict={}):
+    # Static addresses and ACLs are applied to the running instance, it is only restarted when config.yml or
+    # the playbook (incus_restart fact) asks for it. Addresses pinned at launch are already the instance's.
+    if(conf.network):
+        if(conf.network.staticIp or conf.network.ipv4 or conf.network.ipv6):
+            with tracer.span("static-ip"):
+                setStaticIP(project=project, args=args, instance=instance, ipv4=addresses.get("ipv4.address") or conf.network.ipv4, ipv6=addresses.get("ipv6.address") or conf.network.ipv6, nic=conf.network.nic)
+
+        if(conf.network.acls):
+            with tracer.span("acls"):
                 if(conf.network.type == 'ovn'):
                     setNetworkACLs(project=project, args=args, instance=instance, acls=conf.network.acls, nic=conf.network.nic)
                 else:
                     setNetworkACLs(project=project, args=args, network=conf.network.name, acls=conf.network.acls, nic=conf.network.nic)
 
-            if(conf.network.forwards):
-                waitForIPAddresses(instance=instance, staticIPv4=conf.network.ipv4, staticIPv6=conf.network.ipv6, nic=conf.network.nic)
-                setForwardsPorts(project=project, args=args, instance=instance, network=conf.network.name, listenAddress=conf.network.listenAddress, forwards=conf.network.forwards, nic=conf.network.nic)
+    if(restart):
+        if(args.verbose):
+            print(f"[DEBUG] Restarting instance: {instance.name}")
+
+        with tracer.span("restart"):
+            instance.restart()
+            session.invalidate(project, instance=instance.name)
+
+        if(conf.network and conf.network.forwards):
+            with tracer.span("ip"):
+                waitForIPAddresses(project=project, instance=instance, staticIPv4=conf.network.ipv4, staticIPv6=conf.network.ipv6, nic=conf.network.nic, remote=conf.remote, timeout=args.waitTimeout)
+
+    if(conf.network and conf.network.forwards):
+        with tracer.span("forwards"):
+            setForwardsPorts(project=project, args=args, instance=instance, network=conf.network.name, listenAddress=conf.network.listenAddress, forwards=conf.network.forwards, nic=conf.network.nic, targetAddress=addresses.get("ipv4.address") or addresses.get("ipv6.address"))
+
+class ImageCache(object):
+    # Provisioned instances are published as images on their remote, keyed on everything that changes the
+    # result of the playbook: the base image (or copy source), how the instance is launched and every file
+    # of the challenge except config.yml. A deployment with the same key launches from that image instead.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bases = {}
+        self.images = {}
+
+    def base(self, conf: Config) -> str:
+        if(conf.launch):
+            key = ("image", conf.launch.image.remote, conf.launch.image.name)
         else:
-            project.instances.get(name=conf.name).restart()
+            key = ("instance", conf.copy.remote, conf.copy.project or conf.project, conf.copy.name)
 
-    print(f"Elasped time: {(datetime.datetime.now() - now).total_seconds()}")
+        with self.lock:
+            if(key in self.bases):
+                return self.bases[key]
 
-    if(args.test):
-        for conf in config:
-            project = pyincus.remotes.get(name=conf.remote).projects.get(name=conf.project)
-            instance = project.instances.get(name=conf.name)
-            if(conf.network):
-                destroy(project=project, args=args, instance=instance, nic=conf.network.nic)
-            else:
-                destroy(project=project, args=args, instance=instance)
\ No newline at end of file
+        if(conf.launch):
+            output = runIncus(["image", "info", f"{conf.launch.image.remote}:{conf.launch.image.name}"])
+            match = re.search(r"^Fingerprint:\s*(\S+)", output, re.MULTILINE)
+            base = match.group(1) if match else hashlib.sha256(output.encode()).hexdigest()
+        else:
+            # last_used_at changes every time the source is started, only the image it was created from is kept.
+            source = incusQuery(conf.copy.remote, f"/1.0/instances/{urllib.parse.quote(conf.copy.name)}", project=conf.copy.project or conf.project)
+            base = source['config'].get('volatile.base_image') or hashlib.sha256(json.dumps(source['config'], sort_keys=True).encode()).hexdigest()
+
+        with self.lock:
+            return self.bases.setdefault(key, base)
+
+    def content(self, challengePath: str) -> str:
+        digest = hashlib.sha256()
+        for root, directories, files in os.walk(challengePath):
+            directories[:] = sorted([directory for directory in directories if directory != "artifacts"])
+
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                relativePath = os.path.relpath(path, challengePath)
+                if(relativePath == CONFIGURATION_FILE_NAME):
+                    continue
+
+                digest.update(relativePath.encode() + b"\0")
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def key(self, content: str, conf: Config) -> str:
+        # The playbook tells hosts apart by their inventory host, not by the name of the instance.
+        source = {"host": conf.host, "base": self.base(conf), "launch": str(conf.launch), "copy": str(conf.copy), "content": content}
+        return hashlib.sha256(json.dumps(source, sort_keys=True).encode()).hexdigest()[:32]
+
+    def list(self, remote: str, project: str) -> list:
+        with self.lock:
+            if(not (remote, project) in self.images):
+                images = incusQuery(remote, "/1.0/images?recursion=1", project=project) or []
+                self.images[(remote, project)] = [image for image in images if any([alias["name"].startswith(IMAGE_CACHE_PREFIX) for alias in image.get("aliases") or []])]
+
+            return self.images[(remote, project)]
+
+    def find(self, remote: str, project: str, key: str) -> str:
+        alias = f"{IMAGE_CACHE_PREFIX}{key}"
+        for image in self.list(remote, project):
+            if(alias in [a["name"] for a in image.get("aliases") or []]):
+                return alias
+
+        return None
+
+    def snapshot(self, remote: str, project: str, name: str):
+        runIncus(["snapshot", "create", f"{remote}:{name}", IMAGE_CACHE_SNAPSHOT, "--project", project, "--reuse"])
+
+    def publish(self, args, *, remote: str, project: str, name: str, key: str):
+        alias = f"{IMAGE_CACHE_PREFIX}{key}"
+
+        try:
+            runIncus(["publish", f"{remote}:{name}/{IMAGE_CACHE_SNAPSHOT}", f"{remote}:", "--project", project, "--alias", alias, f"user.ctf-cache.instance={name}"])
+        except IncusException as error:
+            # Another deployment of the same challenge may have published it first.
+            if(not "already exists" in str(error).lower()):
+                raise
+
+        runIncus(["snapshot", "delete", f"{remote}:{name}", IMAGE_CACHE_SNAPSHOT, "--project", project])
+        ledger.record("image", remote, project, alias, data={"instance": name})
+
+        with self.lock:
+            self.images.pop((remote, project), None)
+
+        if(args.verbose):
+            print(f"[DEBUG] Provisioned instance was published as cached image: {alias}")
+
+        if(args.cacheMaxSize):
+            self.evict(args, remote=remote, project=project, maxSize=args.cacheMaxSize)
+
+    def evict(self, args, *, remote: str, project: str, maxSize: int) -> list:
+        images = sorted(self.list(remote, project), key=lambda image: max(image.get("last_used_at") or "", image.get("created_at") or ""))
+        total = sum([image.get("size", 0) for image in images])
+        evicted = []
+
+        while(total > maxSize and images):
+            image = images.pop(0)
+            incusQuery(remote, f"/1.0/images/{image['fingerprint']}", method="DELETE", project=project, wait=True)
+            total -= image.get("size", 0)
+            evicted.append(image)
+
+            for alias in image.get("aliases") or []:
+                ledger.forget("image", remote, project, alias["name"])
+
+            if(args.verbose):
+                print(f"[DEBUG] Cached image was evicted: {', '.join([alias['name'] for alias in image.get('aliases') or []])}")
+
+        with self.lock:
+            self.images.pop((remote, project), None)
+
+        return evicted
+
+imageCache = ImageCache()
+
+def listImageCache(args):
+    remote = args.remote or "local"
+    project = args.project or "default"
+    images = sorted(imageCache.list(remote, project), key=lambda image: max(image.get("last_used_at") or "", image.get("created_at") or ""), reverse=True)
+
+    for image in images:
+        aliases = ', '.join([alias["name"] for alias in image.get("aliases") or []])
+        print(f"{aliases}\t{image.get('size', 0) / 2**20:.1f}MiB\tcreated {image.get('created_at')}\tlast used {image.get('last_used_at')}\t{(image.get('properties') or {}).get('user.ctf-cache.instance', '')}")
+
+    print(f"{len(images)} cached image(s), {sum([image.get('size', 0) for image in images]) / 2**20:.1f}MiB")
+
+class WarmPool(object):
+    # Instances launched ahead of time from a given source (image unpacked, first boot done), stopped and tagged
+    # with user.ctf-pool. Claiming one is a rename, which incus only lets one caller do, so concurrent runs never
+    # get the same instance. The pooled instances of a project are indexed once per run and the index is kept up
+    # to date with what the run claims and launches. Pools are refilled in the background while the deployment
+    # goes on, a single refill per pool is queued at a time.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.pending = set()
+        self.executor = None
+        self.futures = []
+
+    def key(self, project: pyincus.models.projects.Project, *, nameSource: str, remoteSource: str, projectSource: str, isVM: bool, isClone: bool) -> str:
+        return hashlib.sha256(json.dumps([session.remoteOf(project), project.name, nameSource, remoteSource, projectSource, isVM, isClone]).encode()).hexdigest()[:12]
+
+    @staticmethod
+    def created(instance: dict) -> int:
+        return int(instance["config"].get(f"{POOL_CONFIG}.created") or 0)
+
+    def index(self, project: pyincus.models.projects.Project) -> dict:
+        def fetch():
+            pools = {}
+            for instance in incusQuery(session.remoteOf(project), "/1.0/instances?recursion=1", project=project.name) or []:
+                key = (instance.get("config") or {}).get(POOL_CONFIG)
+                if(key):
+                    pools.setdefault(key, []).append(instance)
+
+            for pooled in pools.values():
+                pooled.sort(key=self.created)
+
+            return pools
+
+        return session.lookup(("pool", id(project)), fetch)
+
+    def stale(self, args, instance: dict) -> bool:
+        return time.time() - self.created(instance) > args.poolMaxAge
+
+    def take(self, project: pyincus.models.projects.Project, args, key: str) -> dict:
+        # The oldest instance which is not stale is taken out of the index, stale ones are left to the refill.
+        with self.lock:
+            pooled = self.index(project).get(key) or []
+            candidate = next((instance for instance in pooled if not self.stale(args, instance)), None)
+
+            if(candidate):
+                pooled.remove(candidate)
+
+            return candidate
+
+    def claim(self, project: pyincus.models.projects.Project, args, *, name: str, key: str, config: dict=None, network: pyincus.models.networks.Network=None, nic: str='eth0', addresses: dict={}) -> pyincus.models.instances.Instance:
+        # cloud-init only runs on the first boot, which pooled instances already did.
+        if(any(k.startswith("cloud-init.") or k.startswith("user.user-data") for k in config or {})):
+            return None
+
+        remote = session.remoteOf(project)
+
+        while(True):
+            candidate = self.take(project, args, key)
+            if(candidate is None):
+                break
+
+            try:
+                incusQuery(remote, f"/1.0/instances/{urllib.parse.quote(candidate['name'])}", method="POST", data={"name": name}, project=project.name, wait=True)
+            except IncusException:
+                # Claimed by another run since the pool was indexed.
+                continue
+
+            session.invalidate(project, instance=name)
+            instance = session.instance(project, name)
+
+            instance.config = {**{k: v for k, v in instance.config.items() if not k.startswith(POOL_CONFIG)}, **{k: configValue(v) for k, v in (config or {}).items()}}
+
+            if(network):
+                devices = instance.devices
+                devices[nic] = {"name": nic, "type": "nic", "network": network.name, **addresses}
+                instance.devices = devices
+
+            instance.start()
+            session.invalidate(project, instance=name)
+
+            if(args.verbose):
+                print(f"[DEBUG] Instance was claimed from the warm pool: {candidate['name']} -> {name}")
+
+            return instance
+
+        if(args.verbose):
+            print(f"[DEBUG] Warm pool is empty: {key}")
+
+        return None
+
+    def launch(self, project: pyincus.models.projects.Project, args, *, key: str, nameSource: str, remoteSource: str, projectSource: str, isVM: bool, isClone: bool) -> dict:
+        name = f"{POOL_PREFIX}{key}-{uuid.uuid4().hex[:8]}"
+        config = {POOL_CONFIG: key, f"{POOL_CONFIG}.created": str(int(time.time()))}
+
+        if(isClone):
+            project.instances.copy(source=nameSource, name=name, remoteSource=remoteSource, projectSource=projectSource, config=config, instanceOnly=True)
+        else:
+            instance = project.instances.launch(image=nameSource, name=name, remoteSource=remoteSource, config=config, vm=isVM)
+            waitForBoot(project, instance=instance, remote=session.remoteOf(project), timeout=args.waitTimeout)
+            instance.stop()
+
+        session.invalidate(project, instance=name)
+
+        if(args.verbose):
+            print(f"[DEBUG] Instance was added to the warm pool: {name}")
+
+        return {"name": name, "config": config}
+
+    def fill(self, project: pyincus.models.projects.Project, args, **profile) -> int:
+        key = self.key(project, **profile)
+        remote = session.remoteOf(project)
+
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+
+        with lock:
+            # Recycle instances launched from an image which may have been updated since.
+            with self.lock:
+                pooled = self.index(project).setdefault(key, [])
+                stale = [instance for instance in pooled if self.stale(args, instance)]
+                pooled[:] = [instance for instance in pooled if not instance in stale]
+                missing = max(args.pool - len(pooled), 0)
+
+            for instance in stale:
+                forceDelete(remote, project.name, instance["name"])
+
+                if(args.verbose):
+                    print(f"[DEBUG] Stale instance was removed from the warm pool: {instance['name']}")
+
+            with ThreadPoolExecutor(max_workers=max(missing, 1)) as executor:
+                for future in [executor.submit(self.launch, project, args, key=key, **profile) for _ in range(missing)]:
+                    instance = future.result()
+
+                    with self.lock:
+                        pooled.append(instance)
+
+            return missing
+
+    def refill(self, project: pyincus.models.projects.Project, args, **profile):
+        output = sys.stdout.context if isinstance(sys.stdout, PrefixedOutput) else None
+        parent = tracer.current()
+        key = self.key(project, **profile)
+
+        def worker():
+            if(output):
+                sys.stdout.context = output
+
+            # Instances claimed from now on are not counted by this refill, they queue another one.
+            with self.lock:
+                self.pending.discard(key)
+
+            try:
+                with tracer.span("pool.refill", parent=parent):
+                    self.fill(project, args, **profile)
+            finally:
+                if(output):
+                    sys.stdout.context = (None, None)
+
+        with self.lock:
+            if(key in self.pending):
+                return
+
+            self.pending.add(key)
+
+            if(self.executor is None):
+                self.executor = ThreadPoolExecutor(max_workers=args.jobs)
+
+            self.futures.append(self.executor.submit(worker))
+
+    def wait(self) -> bool:
+        # Pending refills are finished before the script exits.
+        success = True
+        for future in as_completed(self.futures):
+            try:
+                future.result()
+            except (Exception, SystemExit) as error:
+                print(f"Warm pool refill failed: {error}")
+                success = False
+
+        self.futures = []
+        return success
+
+warmPool = WarmPool()
+
+def fillWarmPools(args, challengePaths: list) -> bool:
+    profiles = {}
+    for challengePath in challengePaths:
+        for conf in loadConfig(args, challengePath).config:
+            kwargs = instanceArguments(conf=conf)
+            profile = {"nameSource": kwargs["nameSource"], "remoteSource": kwargs["remoteSource"], "projectSource": kwargs["projectSource"], "isVM": kwargs["isVM"], "isClone": kwargs["isClone"]}
+
+            # The instance may be placed on any of its candidates.
+            for remote in args.placementRemotes or conf.remotes:
+                project = session.project(remote, conf.project)
+                profiles[warmPool.key(project, **profile)] = (project, profile)
+
+    for key, (project, profile) in profiles.items():
+        source = f"{profile['remoteSource']}:{profile['nameSource']}" if profile["remoteSource"] else profile["nameSource"]
+        print(f"Filling warm pool {key}: {source}{' (virtual machine)' if profile['isVM'] else ''}")
+        warmPool.refill(project, args, **profile)
+
+    return warmPool.wait()
+
+class PipelineAborted(Exception):
+    pass
+
+class Pipeline(object):
+    # Every instance goes through network -> launch -> ip -> boot -> provision -> finalize on a worker of the pool.
+    # The only synchronization points are the shared networks and, unless ansible.per_host is set, the
+    # playbook which runs once every instance is ready. Replicas are not provisioned, they are launched
+    # from their first replica once it is.
+    def __init__(self, args, challenge: Challenge):
+        self.args = args
+        self.challenge = challenge
+        self.output = sys.stdout.context if isinstance(sys.stdout, PrefixedOutput) else None
+        self.ledgerRun = ledger.current
+        self.lock = threading.Lock()
+        self.networks = {}
+        self.unprovisioned = set()
+        self.restarts = set()
+        self.content = None
+        self.failed = threading.Event()
+        self.span = tracer.current()
+        self.provisioned = [conf for conf in challenge.config if not conf.replicaOf]
+        # Unless ansible.per_host is set, the playbook runs once for every instance.
+        self.shared = not challenge.ansible.perHost
+        self.launched = set()
+        self.failures = {}
+        self.hosts = {conf.name: conf.host for conf in challenge.config}
+        self.replicated = threading.Condition(self.lock)
+
+        # Stages completed by the run being resumed, per instance, they are skipped.
+        self.checkpoints = {conf.name: ledger.checkpoints(conf.remote, conf.project, conf.name) if args.resume else {} for conf in challenge.config}
+
+        # Replicas are launched again unless their first replica was completed, they would not be copies of it.
+        for conf in challenge.config:
+            if(conf.replicaOf and not self.completed(next(first for first in challenge.config if first.name == conf.replicaOf), "finalize")):
+                self.checkpoints[conf.name] = {}
+
+        # Sources of the replicas to launch, set once their first replica was snapshotted (or published).
+        self.replicaSources = {conf.replicaOf: None for conf in challenge.config if conf.replicaOf and not self.completed(conf, "launch")}
+
+    def network(self, project: pyincus.models.projects.Project, conf: Config) -> pyincus.models.networks.Network:
+        key = (conf.remote, conf.project, conf.network.name)
+
+        with self.lock:
+            if(not key in self.networks):
+                self.networks[key] = ensureNetwork(project=project, args=self.args, network=conf.network)
+
+            return self.networks[key]
+
+    def completed(self, conf: Config, stage: str) -> bool:
+        return (self.checkpoints[conf.name].get(stage) or {}).get("status") == "done"
+
+    def checkpoint(self, hosts: list, stage: str, *, status: str="done", data: dict=None):
+        for conf in self.challenge.config:
+            if(conf.name in hosts):
+                ledger.checkpoint(conf.remote, conf.project, conf.name, stage, status=status, data=data)
+
+    def startAtTask(self, hosts: list) -> str:
+        # The playbook starts again at the task which failed, when it failed at the same task on every host.
+        if(not self.args.resume or not self.challenge.ansible.resumeFromFailedTask):
+            return None
+
+        tasks = set([(self.checkpoints[host].get("provision") or {}).get("data", {}).get("task") for host in hosts])
+        return tasks.pop() if len(tasks) == 1 and not None in tasks else None
+
+    def runPlaybook(self, hosts: list, *, limit: str) -> bool:
+        failures = {}
+
+        # Facts of instances which were not launched again are still valid.
+        success = provision(self.args, self.challenge.path, limit=limit, ansible=self.challenge.ansible, hosts=len(hosts), forget=[self.hosts[host] for host in hosts if host in self.launched], restarts=self.restarts, failures=failures, startAtTask=self.startAtTask(hosts), hostVars=self.challenge.hostVars)
+
+        if(not success):
+            # Hosts which did not fail themselves start again at the first failed task too, so every host of the
+            # playbook starts at the same task.
+            for host in hosts:
+                self.checkpoint([host], "provision", status="failed", data={"task": failures.get(self.hosts[host]) or next(iter(failures.values()), None)})
+
+        return success
+
+    def provisionAll(self):
+        # Instances launched from a cached image are already provisioned.
+        hosts = [conf.name for conf in self.challenge.config if conf.name in self.unprovisioned]
+        if(not hosts):
+            return
+
+        if(not self.runPlaybook(hosts, limit=None if len(hosts) == len(self.provisioned) else ','.join([self.hosts[host] for host in hosts]))):
+            raise Exception("Provisioning failed.")
+
+    def cachedImage(self, conf: Config) -> tuple:
+        with self.lock:
+            if(self.content is None):
+                self.content = imageCache.content(self.challenge.path)
+
+        key = imageCache.key(self.content, conf)
+        return (key, imageCache.find(conf.remote, conf.project, key))
+
+    def provisionHost(self, name: str):
+        if(not self.runPlaybook([name], limit=self.hosts[name])):
+            raise Exception(f"Provisioning failed: {name}")
+
+    def replicate(self, conf: Config):
+        # The provisioned first replica is snapshotted once for all the others.
+        runIncus(["snapshot", "create", f"{conf.remote}:{conf.name}", REPLICA_SNAPSHOT, "--project", conf.project, "--reuse"])
+
+        if(conf.replicaMethod == "publish"):
+            alias = f"{REPLICA_IMAGE_PREFIX}{conf.name}"
+            runIncus(["publish", f"{conf.remote}:{conf.name}/{REPLICA_SNAPSHOT}", f"{conf.remote}:", "--project", conf.project, "--alias", alias, "--reuse"])
+            source = {"nameSource": alias, "remoteSource": conf.remote, "projectSource": None, "isClone": False}
+        else:
+            source = {"nameSource": f"{conf.name}/{REPLICA_SNAPSHOT}", "remoteSource": conf.remote, "projectSource": conf.project, "isClone": True}
+
+        with self.replicated:
+            self.replicaSources[conf.name] = (conf, source)
+            self.replicated.notify_all()
+
+    def replicaSource(self, conf: Config) -> dict:
+        with self.replicated:
+            while(self.replicaSources[conf.replicaOf] is None):
+                if(self.failed.is_set()):
+                    raise PipelineAborted(f"The first replica {conf.replicaOf} failed.")
+
+                self.replicated.wait(timeout=1)
+
+            return self.replicaSources[conf.replicaOf][1]
+
+    def removeReplicaSources(self):
+        # Replicas do not depend on their source once launched, the snapshot and the image are not kept.
+        for source in self.replicaSources.values():
+            if(source is None):
+                continue
+
+            conf, source = source
+            try:
+                if(not source["isClone"]):
+                    runIncus(["image", "delete", f"{conf.remote}:{source['nameSource']}", "--project", conf.project])
+
+                runIncus(["snapshot", "delete", f"{conf.remote}:{conf.name}", REPLICA_SNAPSHOT, "--project", conf.project])
+            except IncusException as error:
+                print(f"{conf.name}: the source of its replicas could not be removed: {error}")
+
+    def stage(self, conf: Config, stage: str, function, /, **kwargs):
+        if(self.failed.is_set()):
+            raise PipelineAborted(f"Another instance failed before stage '{stage}'.")
+
+        if(self.completed(conf, stage)):
+            if(self.args.verbose):
+                print(f"[DEBUG] {conf.name}: stage '{stage}' was completed by the resumed run, skipped")
+
+            return None
+
+        with tracer.span(stage) as span:
+            result = function(**kwargs)
+
+        if(stage in CHECKPOINTED_STAGES):
+            ledger.checkpoint(conf.remote, conf.project, conf.name, stage)
+
+        if(self.args.verbose):
+            print(f"[DEBUG] {conf.name}: stage '{stage}' completed in {span['duration']:.1f}s ({span['incus_calls']} incus call(s), {span['polls']} poll(s))")
+
+        return result
+
+    def runInstance(self, conf: Config, function, /, *args):
+        if(self.output):
+            sys.stdout.context = self.output
+
+        ledger.current = self.ledgerRun
+
+        try:
+            with tracer.span("instance", parent=self.span, instance=conf.name):
+                return function(conf, *args)
+        except (Exception, SystemExit) as error:
+            self.failed.set()
+
+            if(not isinstance(error, (PipelineAborted, SystemExit))):
+                print(traceback.format_exc())
+
+            with self.replicated:
+                self.replicated.notify_all()
+
+            raise
+        finally:
+            if(self.output):
+                sys.stdout.context = (None, None)
+
+            ledger.current = None
+
+    def pinned(self, project: pyincus.models.projects.Project, conf: Config, addresses: dict) -> bool:
+        # The instance boots on the addresses pinned before its launch, there is no lease to wait for once every
+        # family it would wait for is pinned.
+        if(not conf.network or not addresses):
+            return False
+
+        subnet4, subnet6 = session.networkSubnets(project, conf.network.name)
+        waitsFor4 = subnet4 is not None and not pyincus.utils.isFalse(conf.network.ipv4)
+        waitsFor6 = subnet6 is not None and not pyincus.utils.isFalse(conf.network.ipv6)
+
+        return (not waitsFor4 or "ipv4.address" in addresses) and (not waitsFor6 or "ipv6.address" in addresses)
+
+    def prepare(self, conf: Config) -> dict:
+        # Stages before the playbook, what the later stages need is returned.
+        project = session.project(conf.remote, conf.project)
+        kwargs = instanceArguments(conf=conf)
+
+        # Nothing is resumed for an instance which is gone since.
+        if(self.completed(conf, "launch") and not project.instances.exists(name=conf.name)):
+            print(f"{conf.name}: instance is gone, it is deployed again.")
+            self.checkpoints[conf.name] = {}
+
+        staticIPv4 = conf.network.ipv4 if conf.network else None
+        staticIPv6 = conf.network.ipv6 if conf.network else None
+
+        cacheKey = None
+        if(self.args.cache and not conf.replicaOf):
+            cacheKey, alias = self.stage(conf, "cache", self.cachedImage, conf=conf)
+
+            if(alias):
+                if(self.args.verbose):
+                    print(f"[DEBUG] {conf.name}: launching from cached image {alias}")
+
+                kwargs.update({"nameSource": alias, "remoteSource": conf.remote, "projectSource": None, "isClone": False})
+                cacheKey = None
+
+        if((not self.args.cache or cacheKey) and not self.completed(conf, "provision") and not conf.replicaOf):
+            with self.lock:
+                self.unprovisioned.add(conf.name)
+
+        if(conf.network):
+            kwargs["network"] = self.stage(conf, "network", self.network, project=project, conf=conf)
+            kwargs["addresses"] = staticAddresses(project, self.args, conf=conf, network=kwargs["network"])
+
+        # A replica is not taken from the warm pool, its source is its first replica.
+        launchArgs = self.args
+        if(conf.replicaOf and not self.completed(conf, "launch")):
+            kwargs.update(self.stage(conf, "replica", self.replicaSource, conf=conf))
+            launchArgs = argparse.Namespace(**{**vars(self.args), "pool": 0})
+
+        instance = self.stage(conf, "launch", deploy, project=project, args=launchArgs, **kwargs)
+        if(instance is None):
+            instance = session.instance(project, conf.name)
+        else:
+            with self.lock:
+                self.launched.add(conf.name)
+
+        if(not self.pinned(project, conf, kwargs.get("addresses") or {})):
+            self.stage(conf, "ip", waitForIPAddresses, project=project, instance=instance, staticIPv4=staticIPv4, staticIPv6=staticIPv6, nic=kwargs["nic"], remote=conf.remote, timeout=self.args.waitTimeout)
+
+        if(kwargs["isVM"] or conf.readiness):
+            self.stage(conf, "boot", waitForBoot, project=project, instance=instance, command=conf.readiness.command if conf.readiness else None, remote=conf.remote, timeout=conf.readiness.timeout if conf.readiness and conf.readiness.timeout else self.args.waitTimeout)
+
+        return {"project": project, "kwargs": kwargs, "instance": instance, "cacheKey": cacheKey}
+
+    def complete(self, conf: Config, prepared: dict):
+        # Stages after the playbook.
+        project, kwargs, instance, cacheKey = prepared["project"], prepared["kwargs"], prepared["instance"], prepared["cacheKey"]
+
+        if(not self.shared and conf.name in self.unprovisioned):
+            self.stage(conf, "provision", self.provisionHost, name=conf.name)
+
+        if(conf.name in self.replicaSources):
+            self.stage(conf, "replicate", self.replicate, conf=conf)
+
+        if(cacheKey):
+            self.stage(conf, "snapshot", imageCache.snapshot, remote=conf.remote, project=conf.project, name=conf.name)
+
+        self.stage(conf, "finalize", finalize, project=project, args=self.args, instance=instance, conf=conf, restart=conf.restart or (not conf.replicaOf and conf.host in self.restarts), addresses=kwargs.get("addresses") or {})
+
+        if(cacheKey):
+            self.stage(conf, "publish", imageCache.publish, args=self.args, remote=conf.remote, project=conf.project, name=conf.name, key=cacheKey)
+
+    def runStages(self, conf: Config):
+        self.complete(conf, self.prepare(conf))
+
+    def provisionShared(self):
+        # Every instance was prepared, even one provisioned by the resumed run or launched from a cached image,
+        # the playbook runs once for all of them before any is completed.
+        with tracer.span("provision", parent=self.span):
+            self.provisionAll()
+
+        for conf in self.provisioned:
+            if(not self.completed(conf, "provision")):
+                ledger.checkpoint(conf.remote, conf.project, conf.name, "provision")
+
+    def run(self) -> bool:
+        # Up to --parallel instances go through their stages at a time. With a shared playbook, instances are
+        # prepared, provisioned together then completed, so none of them holds a worker while waiting for the
+        # others. Replicas are queued after the instances they are copied from, which already have a worker.
+        errors = {}
+        prepared = {}
+        replicas = [conf for conf in self.challenge.config if conf.replicaOf]
+
+        def wait(futures: dict, results: dict):
+            for future in as_completed(futures):
+                try:
+                    results[futures[future].name] = future.result()
+                except (Exception, SystemExit) as error:
+                    errors[futures[future].name] = error
+
+        with ThreadPoolExecutor(max_workers=max(self.args.parallel, 1)) as executor:
+            if(self.shared):
+                wait({executor.submit(self.runInstance, conf, self.prepare): conf for conf in self.provisioned}, prepared)
+
+                if(not errors):
+                    try:
+                        self.provisionShared()
+                    except Exception as error:
+                        self.failed.set()
+                        print(traceback.format_exc())
+                        errors.update({conf.name: error for conf in self.provisioned})
+
+                futures = {executor.submit(self.runInstance, conf, self.complete, prepared[conf.name]): conf for conf in self.provisioned} if not errors else {}
+            else:
+                futures = {executor.submit(self.runInstance, conf, self.runStages): conf for conf in self.provisioned}
+
+            if(not errors):
+                futures.update({executor.submit(self.runInstance, conf, self.runStages): conf for conf in replicas})
+            else:
+                errors.update({conf.name: PipelineAborted(f"The first replica {conf.replicaOf} failed.") for conf in replicas})
+
+            wait(futures, {})
+
+        self.removeReplicaSources()
+
+        for name, error in errors.items():
+            if(isinstance(error, PipelineAborted)):
+                print(f"Instance was interrupted: {name}")
+            else:
+                print(f"Instance failed: {name}")
+
+        return len(errors) == 0
+
+class PortAllocator(object):
+    # Listen ports of the forwards whose source is auto. The used ports of a scope (a listen address of a remote,
+    # or every listen address with --unique-ports) are indexed once from the forwards and the reservations of the
+    # ledger, and the free ports of a range are kept on a stack so a port is allocated in O(1). Reservations are
+    # written to the ledger, which makes them atomic between concurrent runs, and a forward gets back the port it
+    # had while it is free so its port does not change when the instance is redeployed.
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.used = {}
+        self.free = {}
+        self.ranges = {}
+        self.indexed = set()
+
+    @staticmethod
+    def scope(args, remote: str, listenAddress: str) -> str:
+        return "*" if args.uniquePorts else f"{remote} {listenAddress}"
+
+    @staticmethod
+    def owner(forward: "Config.Network.Forward") -> str:
+        return f"{forward.protocol}/{forward.destination}"
+
+    def usedPorts(self, scope: str, protocol: str) -> set:
+        if(not (scope, protocol) in self.used):
+            # Reservations are "protocol/port", every protocol of the scope is indexed at once.
+            for value in ledger.reserved("port", scope):
+                reservedProtocol, port = value.split("/")
+                self.used.setdefault((scope, reservedProtocol), set()).add(int(port))
+
+            self.used.setdefault((scope, protocol), set())
+
+        return self.used[(scope, protocol)]
+
+    def reserveLedger(self, scope: str, protocol: str, port: int, remote: str, project: str, instance: str, owner: str) -> bool:
+        return ledger.reserve("port", scope, f"{protocol}/{port}", remote, project, instance, owner)
+
+    def index(self, args, project: pyincus.models.projects.Project, network: str, listenAddress: str) -> str:
+        remote = session.remoteOf(project)
+        scope = self.scope(args, remote, listenAddress)
+
+        if(not project.networks.exists(name=network)):
+            return scope
+
+        manager = session.forwards(project, network)
+        for address, ports in manager.load().items():
+            key = (remote, project.name, network, address)
+            if(key in self.indexed or (address != listenAddress and not args.uniquePorts)):
+                continue
+
+            self.indexed.add(key)
+            for protocol, port in manager.index(ports):
+                self.usedPorts(scope, protocol).add(port)
+
+        return scope
+
+    def stack(self, scope: str, protocol: str, portRange: str) -> list:
+        if(not portRange in self.ranges):
+            self.ranges[portRange] = set(expandPorts(portRange))
+
+        if(not (scope, protocol, portRange) in self.free):
+            used = self.usedPorts(scope, protocol)
+            self.free[(scope, protocol, portRange)] = [port for port in sorted(self.ranges[portRange], reverse=True) if not port in used]
+
+        return self.free[(scope, protocol, portRange)]
+
+    def allocate(self, args, project: pyincus.models.projects.Project, *, instance: str, network: str, listenAddress: str, forward: "Config.Network.Forward", portRange: str, reserve: bool=True) -> int:
+        remote = session.remoteOf(project)
+        owner = self.owner(forward)
+
+        with self.lock:
+            scope = self.index(args, project, network, listenAddress)
+            used = self.usedPorts(scope, forward.protocol)
+            stack = self.stack(scope, forward.protocol, portRange)
+
+            previous = ledger.reservation("port", scope, remote, project.name, instance, owner)
+            port = int(previous[0].split("/")[1]) if previous else None
+            if(port in self.ranges[portRange] and (previous[1] is None or not port in used)):
+                if(not reserve or self.reserveLedger(scope, forward.protocol, port, remote, project.name, instance, owner)):
+                    used.add(port)
+                    return port
+
+            while(stack):
+                port = stack.pop()
+                if(port in used):
+                    continue
+
+                if(not reserve):
+                    stack.append(port)
+                    return port
+
+                # Reserved by a concurrent run since the index was built otherwise.
+                used.add(port)
+                if(self.reserveLedger(scope, forward.protocol, port, remote, project.name, instance, owner)):
+                    return port
+
+        raise Exception(f"No free listen port left in {portRange} on {listenAddress}")
+
+    def reserve(self, args, project: pyincus.models.projects.Project, *, instance: str, network: str, listenAddress: str, forward: "Config.Network.Forward") -> list:
+        # Ports given in config.yml, the conflicts with the reservations of other instances are returned.
+        remote = session.remoteOf(project)
+        conflicts = []
+
+        with self.lock:
+            scope = self.index(args, project, network, listenAddress)
+            used = self.usedPorts(scope, forward.protocol)
+
+            for port in expandPorts(forward.source):
+                if(self.reserveLedger(scope, forward.protocol, port, remote, project.name, instance, self.owner(forward))):
+                    used.add(port)
+                else:
+                    conflicts.append(f"{listenAddress}:{port}/{forward.protocol} is reserved by {ledger.reservedBy('port', scope, f'{forward.protocol}/{port}') or 'another instance'}")
+
+        return conflicts
+
+    def release(self, remote: str, project: str, instance: str, *, keep: list=[]) -> list:
+        with self.lock:
+            released = []
+            for scope, value in ledger.releaseReservations("port", remote, project, instance, keep=keep):
+                protocol, port = value.split("/")
+                released.append((scope, protocol, int(port)))
+
+            for scope, protocol, port in released:
+                self.usedPorts(scope, protocol).discard(port)
+
+                for (stackScope, stackProtocol, portRange), stack in self.free.items():
+                    if(stackScope == scope and stackProtocol == protocol and port in self.ranges[portRange]):
+                        stack.append(port)
+
+        return released
+
+    def forget(self):
+        with self.lock:
+            self.used = {}
+            self.free = {}
+            self.indexed = set()
+
+portAllocator = PortAllocator()
+
+def allocatePorts(args, challenge: Challenge) -> Challenge:
+    # The ports given in config.yml are reserved too, so a concurrent run does not allocate them and a port
+    # already reserved by another instance fails here instead of once the instance is provisioned. Forwards
+    # whose source is auto are given their port on copies, the parsed challenge keeps auto.
+    allocated = copy.copy(challenge)
+    allocated.config = []
+
+    for conf in challenge.config:
+        if(not conf.network or not conf.network.forwards or not conf.network.listenAddress):
+            allocated.config.append(conf)
+            continue
+
+        project = session.project(conf.remote, conf.project)
+        auto = [forward for forward in conf.network.forwards if forward.auto]
+
+        if(not args.plan):
+            conflicts = []
+            for forward in conf.network.forwards:
+                if(not forward.auto):
+                    conflicts += portAllocator.reserve(args, project, instance=conf.name, network=conf.network.name, listenAddress=conf.network.listenAddress, forward=forward)
+
+            if(conflicts):
+                for conflict in conflicts:
+                    print(f"Forward port conflict: {conflict}")
+                sys.exit(1)
+
+        if(auto):
+            conf = copy.copy(conf)
+            conf.network = copy.copy(conf.network)
+            conf.network.forwards = [copy.copy(forward) for forward in conf.network.forwards]
+
+            for forward in conf.network.forwards:
+                if(forward.auto):
+                    try:
+                        forward.source = portAllocator.allocate(args, project, instance=conf.name, network=conf.network.name, listenAddress=conf.network.listenAddress, forward=forward, portRange=conf.network.portRange or args.portRange, reserve=not args.plan)
+                    except Exception as error:
+                        print(f"{conf.name}: {error}")
+                        sys.exit(1)
+
+                    if(args.verbose):
+                        print(f"[DEBUG] Listen port allocated to {conf.name}: {conf.network.listenAddress}:{forward.source}/{forward.protocol}")
+
+        # Ports of forwards which were removed from the configuration are freed.
+        if(not args.plan):
+            portAllocator.release(conf.remote, conf.project, conf.name, keep=[portAllocator.owner(forward) for forward in conf.network.forwards])
+
+        allocated.config.append(conf)
+
+    return allocated
+
+def checkForwards(challenge: Challenge) -> list:
+    conflicts = []
+    used = {}
+
+    for conf in challenge.config:
+        if(not conf.network or not conf.network.forwards):
+            continue
+
+        for forward in conf.network.forwards:
+            for listenPort in expandPorts(forward.source):
+                key = (conf.remote, conf.network.listenAddress, forward.protocol, listenPort)
+                if(key in used):
+                    conflicts.append(f"{conf.network.listenAddress}:{listenPort}/{forward.protocol} is used by both {used[key]} and {conf.name}")
+                used[key] = conf.name
+
+        project = session.project(conf.remote, conf.project)
+        if(not project.networks.exists(name=conf.network.name)):
+            continue
+
+        # Ports already forwarded to the instance being redeployed are not conflicts. The addresses of a recorded
+        # instance are known without its state, which has none yet when it boots on a pinned address.
+        ignore = []
+        if(project.instances.exists(name=conf.name)):
+            ignore = ledger.addresses(conf.remote, conf.project, conf.name) or findInstanceAddresses(session.instance(project, conf.name), conf.network.nic)
+
+        conflicts += session.forwards(project, conf.network.name).conflicts(conf.network.listenAddress, conf.network.forwards, ignore=ignore)
+
+    return conflicts
+
+class Change(Model):
+    def __init__(self, target: str, lines: list, apply, *, restart: bool=False):
+        self.target = target
+        self.lines = lines
+        self.apply = apply
+        self.restart = restart
+
+def configValue(value) -> str:
+    if(isinstance(value, bool)):
+        return "true" if value else "false"
+
+    return str(value)
+
+def planNetwork(project: pyincus.models.projects.Project, args, *, conf: Config) -> list:
+    network = conf.network
+    target = f"Network ({network.name})"
+
+    if(not project.networks.exists(name=network.name)):
+        return [Change(target, ["+ create"], lambda: ensureNetwork(project=project, args=args, network=network))]
+
+    if(network.action != 'update'):
+        return []
+
+    current = session.network(project, network.name)
+    lines = []
+
+    updateDescription = (current.description or "") != (network.description or "")
+    if(updateDescription):
+        lines.append(f"~ description: {current.description} -> {network.description}")
+
+    config = current.config
+    changed = {key: configValue(value) for key, value in (network.config or {}).items() if config.get(key) != configValue(value)}
+    lines += [f"~ config {key}: {config.get(key)} -> {value}" for key, value in changed.items()]
+
+    if(not lines):
+        return []
+
+    def apply():
+        if(updateDescription):
+            current.description = network.description
+
+        if(changed):
+            current.config = {**current.config, **changed}
+
+        session.invalidate(project, network=network.name)
+
+    return [Change(target, lines, apply)]
+
+def planACLs(project: pyincus.models.projects.Project, args, *, conf: Config) -> list:
+    registry = session.acls(project)
+    changes = []
+
+    missing = [acl for acl in conf.network.acls if not acl.name in registry.load()]
+    if(missing):
+        changes.append(Change("ACLs", [f"+ create {acl.name}" for acl in missing], lambda: [registry.ensure(acl) for acl in missing]))
+
+    # ACLs of other networks are attached to the network itself, which may be shared, so they are only ever added.
+    if(conf.network.acls and conf.network.type != 'ovn' and project.networks.exists(name=conf.network.name)):
+        current = session.network(project, conf.network.name).config.get("security.acls", "")
+        names = [name for name in current.split(',') if name]
+        attach = [acl.name for acl in conf.network.acls if not acl.name in names]
+
+        if(attach):
+            changes.append(Change(f"Network ({conf.network.name})", [f"~ config security.acls: {current} -> {','.join(names + attach)}"], lambda: setNetworkACLs(project=project, args=args, network=conf.network.name, acls=conf.network.acls, nic=conf.network.nic)))
+
+    return changes
+
+def planInstance(project: pyincus.models.projects.Project, args, *, conf: Config, instance: pyincus.models.instances.Instance, leases: list=None) -> tuple:
+    target = f"Instance ({conf.name})"
+    changes = []
+
+    source = conf.launch or conf.copy
+    config = instance.config
+    changed = {key: configValue(value) for key, value in ((source.config if source else None) or {}).items() if config.get(key) != configValue(value)}
+
+    if(changed):
+        isVM = instance.type == "virtual-machine"
+
+        def applyConfig():
+            instance.config = {**instance.config, **changed}
+            session.invalidate(project, instance=instance.name)
+
+        restart = any(key.startswith(RESTART_CONFIG_PREFIXES) or (isVM and key.startswith("limits.")) for key in changed)
+        changes.append(Change(target, [f"~ config {key}: {config.get(key)} -> {value}" for key, value in changed.items()], applyConfig, restart=restart))
+
+    if(not conf.network):
+        return (changes, None)
+
+    nic = conf.network.nic
+    devices = instance.devices
+    device = dict(devices[nic] if nic in devices else instance.expandedDevices.get(nic, {"type": "nic"}))
+    desired = {**device, "network": conf.network.name}
+
+    running = instance.status.lower() == "running"
+    if(leases is None):
+        leases = findInstanceAddresses(instance, nic) if running else []
+    lease4 = next((address for address in leases if not ":" in address), None)
+    lease6 = next((address for address in leases if ":" in address), None)
+
+    # Same rules as finalize: any of static_ip, ipv4 or ipv6 pins the addresses, the current lease is kept when
+    # no address is given and IPv6 is only pinned on networks with stateful DHCPv6.
+    ipv4 = conf.network.ipv4 if conf.network.ipv4 and not pyincus.utils.isFalse(conf.network.ipv4) else None
+    ipv6 = conf.network.ipv6 if conf.network.ipv6 and not pyincus.utils.isFalse(conf.network.ipv6) else None
+
+    if(conf.network.staticIp or ipv4 or ipv6):
+        desired["ipv4.address"] = ipv4 or device.get("ipv4.address") or lease4
+
+        network = session.network(project, conf.network.name) if project.networks.exists(name=conf.network.name) else None
+        if(network and network.config.get("ipv6.dhcp.stateful")):
+            desired["ipv6.address"] = ipv6 or device.get("ipv6.address") or lease6
+    else:
+        desired.pop("ipv4.address", None)
+        desired.pop("ipv6.address", None)
+
+    if(conf.network.type == 'ovn'):
+        if(conf.network.acls):
+            desired["security.acls"] = ','.join([acl.name for acl in conf.network.acls])
+        else:
+            desired.pop("security.acls", None)
+
+    desired = {key: value for key, value in desired.items() if value is not None}
+    keys = [key for key in sorted(set(device) | set(desired)) if device.get(key) != desired.get(key)]
+
+    if(keys):
+        def applyDevice():
+            devices = instance.devices
+            devices[nic] = desired
+            instance.devices = devices
+            session.invalidate(project, instance=instance.name)
+
+            if(ledger.find("instance", conf.remote, conf.project, instance.name)):
+                recordAddresses(conf.remote, conf.project, instance.name, nic, desired)
+
+            if("security.acls" in desired):
+                session.acls(project).attach(desired["security.acls"].split(','), instance=instance.name)
+
+        # A new address or network is only picked up by the instance on restart, pinning its current lease is not.
+        restart = "network" in keys or any(desired.get(key) and not desired[key] in leases for key in keys if key in ["ipv4.address", "ipv6.address"])
+        changes.append(Change(f"{target} {nic}", [f"~ {key}: {device.get(key)} -> {desired.get(key)}" for key in keys], applyDevice, restart=restart))
+
+    if(any(change.restart for change in changes) and not desired.get("ipv4.address") and not desired.get("ipv6.address")):
+        targetAddress = None
+    else:
+        targetAddress = desired.get("ipv4.address") or desired.get("ipv6.address") or lease4 or lease6
+
+    return (changes, targetAddress)
+
+def planForwards(project: pyincus.models.projects.Project, args, *, conf: Config, addresses: list, targetAddress: str) -> list:
+    manager = session.forwards(project, conf.network.name)
+    listenAddress = conf.network.listenAddress
+
+    desired = [{"protocol": forward.protocol, "listen_port": str(forward.source), "target_address": targetAddress, "target_port": str(forward.destination)} for forward in conf.network.forwards]
+    current = [port for port in manager.load().get(listenAddress, []) if port["target_address"] in addresses + [targetAddress]]
+
+    lines = []
+    removals = {}
+    for address, ports in manager.load().items():
+        for port in ports:
+            if(port["target_address"] in addresses + [targetAddress] and not (address == listenAddress and any(manager.same(port, other) for other in desired))):
+                removals.setdefault(address, []).append(port)
+                lines.append(f"- {address}:{port['listen_port']}/{port.get('protocol') or 'tcp'} -> {port['target_address']}:{port.get('target_port') or port['listen_port']}")
+
+    toAdd = [forward for forward, port in zip(conf.network.forwards, desired) if not any(manager.same(port, other) for other in current)]
+    lines += [f"+ {listenAddress}:{forward.source}/{forward.protocol} -> {targetAddress}:{forward.destination}" for forward in toAdd]
+
+    if(not lines):
+        return []
+
+    def apply():
+        for address, ports in removals.items():
+            manager.removePorts(address, ports)
+
+        if(toAdd):
+            manager.add(listenAddress, toAdd, targetAddress=targetAddress, ignore=addresses, instance=conf.name)
+
+        manager.commit(args)
+
+    return [Change(f"Forwards ({conf.network.name})", lines, apply)]
+
+def printPlan(name: str, changes: list):
+    if(not changes):
+        print(f"\t{name}: up to date")
+
+    for change in changes:
+        print(f"\t{change.target}{' (restart)' if change.restart else ''}:")
+        for line in change.lines:
+            print(f"\t\t{line}")
+
+def applyChallenge(args, challenge: Challenge):
+    # Only what differs between config.yml and the live state is written, one write per object, and an instance
+    # is only restarted when one of its changes requires it. The playbook is not run unless --reprovision is given.
+    plans = []
+    networks = set()
+
+    for conf in challenge.config:
+        project = session.project(conf.remote, conf.project)
+        if(not project.instances.exists(name=conf.name)):
+            print(f"Instance was not found: {conf.name}")
+            sys.exit(1)
+
+        instance = session.instance(project, conf.name)
+        changes = []
+
+        if(conf.network):
+            key = (conf.remote, conf.project, conf.network.name)
+            if(not key in networks):
+                networks.add(key)
+                changes += planNetwork(project, args, conf=conf)
+
+            changes += planACLs(project, args, conf=conf)
+
+        # The addresses of an instance recorded in the ledger are known without reading its state.
+        recorded = ledger.addresses(conf.remote, conf.project, conf.name) if conf.network else None
+        running = instance.status.lower() == "running"
+
+        instanceChanges, targetAddress = planInstance(project, args, conf=conf, instance=instance, leases=recorded if recorded and running else None)
+        changes += instanceChanges
+
+        addresses = (recorded or findInstanceAddresses(instance, conf.network.nic)) if conf.network else []
+        if(conf.network and targetAddress):
+            changes += planForwards(project, args, conf=conf, addresses=addresses, targetAddress=targetAddress)
+
+        plans.append((conf, project, instance, changes, addresses, conf.network is not None and not targetAddress))
+
+    print("Plan:")
+    for conf, project, instance, changes, addresses, deferred in plans:
+        printPlan(conf.name, changes if not deferred else changes + [Change(f"Forwards ({conf.network.name})", ["~ computed once the instance got its new address"], None)])
+
+    if(args.plan):
+        return
+
+    for conf, project, instance, changes, addresses, deferred in plans:
+        for change in changes:
+            change.apply()
+
+        if(any(change.restart for change in changes) and instance.status.lower() == "running"):
+            if(args.verbose):
+                print(f"[DEBUG] Restarting instance: {conf.name}")
+
+            instance.restart()
+            session.invalidate(project, instance=instance.name)
+
+            if(conf.network):
+                waitForIPAddresses(project=project, instance=instance, staticIPv4=conf.network.ipv4, staticIPv6=conf.network.ipv6, nic=conf.network.nic, remote=conf.remote, timeout=args.waitTimeout)
+
+        if(deferred):
+            leases = findInstanceAddresses(instance, conf.network.nic)
+            targetAddress = next((address for address in leases if not ":" in address), None) or next(iter(leases), None)
+
+            if(not targetAddress):
+                print(f"Forwards of {conf.name} were not applied: the instance has no address.")
+                continue
+
+            for change in planForwards(project, args, conf=conf, addresses=addresses, targetAddress=targetAddress):
+                printPlan(conf.name, [change])
+                change.apply()
+
+    if(args.reprovision and not provision(args, challenge.path, ansible=challenge.ansible, hosts=len(challenge.config), hostVars=challenge.hostVars)):
+        print("Provisioning failed.")
+        sys.exit(1)
+
+class Scheduler(object):
+    # Place instances whose remote is a list of candidates. The resources and instance count of every candidate
+    # are read once per run and what the run places is added to them, so the challenges of a batch are spread
+    # as they are placed. Instances which already exist on a candidate stay there.
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loads = {}
+        self.names = {}
+
+    def load(self, remote: str) -> dict:
+        with self.lock:
+            if(not remote in self.loads):
+                resources = incusQuery(remote, "/1.0/resources") or {}
+                instances = incusQuery(remote, "/1.0/instances?all-projects=true") or []
+                self.loads[remote] = {"threads": max(((resources.get("cpu") or {}).get("total") or 1), 1), "memoryUsed": (resources.get("memory") or {}).get("used") or 0, "memoryTotal": (resources.get("memory") or {}).get("total") or 1, "instances": len(instances), "placed": 0}
+
+            return self.loads[remote]
+
+    def exists(self, remote: str, project: str, name: str) -> bool:
+        if(ledger.find("instance", remote, project, name)):
+            return True
+
+        with self.lock:
+            if(not (remote, project) in self.names):
+                self.names[(remote, project)] = set([path.rstrip("/").split("/")[-1] for path in incusQuery(remote, "/1.0/instances", project=project) or []])
+
+            return name in self.names[(remote, project)]
+
+    def fits(self, remote: str, placement: "Challenge.Placement", size: int) -> bool:
+        load = self.load(remote)
+
+        if(placement.maxInstancesPerCPU and (load["instances"] + size) / load["threads"] > placement.maxInstancesPerCPU):
+            return False
+
+        if(placement.maxMemoryUsage and load["memoryUsed"] / load["memoryTotal"] > placement.maxMemoryUsage):
+            return False
+
+        return True
+
+    def choose(self, candidates: list, policy: str, placement: "Challenge.Placement", confs: list) -> str:
+        with self.lock:
+            room = [remote for remote in candidates if self.fits(remote, placement, len(confs))]
+            if(not room):
+                return None
+
+            perCPU = lambda remote: (self.load(remote)["instances"] + len(confs)) / self.load(remote)["threads"]
+            memory = lambda remote: self.load(remote)["memoryUsed"] / self.load(remote)["memoryTotal"]
+
+            # Ties go to the first candidate.
+            if(policy == "spread"):
+                remote = min(room, key=lambda remote: (self.load(remote)["placed"], perCPU(remote), memory(remote)))
+            elif(policy == "bin-pack"):
+                remote = min(room, key=lambda remote: (-perCPU(remote), -memory(remote)))
+            else:
+                remote = min(room, key=lambda remote: (perCPU(remote), memory(remote)))
+
+            self.load(remote)["instances"] += len(confs)
+            self.load(remote)["placed"] += len(confs)
+
+            for conf in confs:
+                self.names.setdefault((remote, conf.project), set()).add(conf.name)
+
+            return remote
+
+    def forget(self):
+        with self.lock:
+            self.loads = {}
+            self.names = {}
+
+scheduler = Scheduler()
+
+def placementGroups(challenge: Challenge, affinity: str) -> list:
+    # Instances on the same network are placed on the same remote.
+    if(affinity == "challenge"):
+        return [list(challenge.config)]
+
+    groups = []
+    for conf in challenge.config:
+        group = next((group for group in groups if conf.network and any(other.network and other.network.name == conf.network.name and other.project == conf.project for other in group)), None)
+        if(group):
+            group.append(conf)
+        else:
+            groups.append([conf])
+
+    return groups
+
+def placeChallenge(args, challenge: Challenge) -> Challenge:
+    candidatesOf = lambda conf: args.placementRemotes or conf.remotes
+    if(all(len(candidatesOf(conf)) == 1 and conf.remote == candidatesOf(conf)[0] for conf in challenge.config)):
+        return challenge
+
+    policy = args.placement or challenge.placement.policy
+    placed = copy.copy(challenge)
+    placed.config = []
+    remotes = {}
+
+    for remote in set([remote for conf in challenge.config for remote in candidatesOf(conf)]):
+        if(not session.remoteExists(remote)):
+            print(f"Remote was not found: {remote}")
+            sys.exit(1)
+
+    for group in placementGroups(challenge, challenge.placement.affinity):
+        candidates = [remote for remote in candidatesOf(group[0]) if all(remote in candidatesOf(conf) for conf in group)]
+        if(not candidates):
+            print(f"No remote is a candidate of every instance of: {', '.join([conf.name for conf in group])}")
+            sys.exit(1)
+
+        existing = set([remote for conf in group for remote in candidates if scheduler.exists(remote, conf.project, conf.name)])
+        if(len(existing) > 1):
+            print(f"Instances of {', '.join([conf.name for conf in group])} are on more than one remote: {', '.join(sorted(existing))}")
+            sys.exit(1)
+
+        if(existing):
+            remote = existing.pop()
+        elif(args.command == "deploy"):
+            remote = scheduler.choose(candidates, policy, challenge.placement, group)
+            if(not remote):
+                print(f"No remote has room for: {', '.join([conf.name for conf in group])}")
+                sys.exit(1)
+
+            print(f"Placement ({policy}): {', '.join([conf.name for conf in group])} on {remote}")
+        else:
+            # Nothing was deployed, apply and destroy find nothing.
+            remote = candidates[0]
+
+        for conf in group:
+            remotes[conf.name] = remote
+
+    for conf in challenge.config:
+        conf = copy.copy(conf)
+        conf.remote = remotes[conf.name]
+
+        if(conf.network):
+            conf.network = copy.copy(conf.network)
+            try:
+                conf.network.place(conf.remote)
+            except Exception as error:
+                print(f"{conf.name}: {error}")
+                sys.exit(1)
+
+        placed.config.append(conf)
+
+    placed.hostVars = {conf.host: {**challenge.hostVars.get(conf.host, {}), "ansible_incus_remote": conf.remote, "incus_remote": conf.remote} for conf in placed.config if not conf.replicaOf}
+
+    if(args.verbose):
+        print(f"[DEBUG] Placement: {remotes}")
+
+    return placed
+
+class Results(object):
+    # Machine readable result of the run (e.g. for a scoreboard): where every instance was deployed and the
+    # listen address and port of each of its forwards, including the ports allocated to the auto ones.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.challenges = {}
+
+    def add(self, name: str, status: str, challenge: Challenge=None):
+        instances = []
+
+        for conf in (challenge.config if challenge else []):
+            forwards = []
+            if(conf.network):
+                forwards = [{"listen_address": conf.network.listenAddress, "listen_port": forward.source, "target_port": forward.destination, "protocol": forward.protocol, "auto": forward.auto} for forward in conf.network.forwards]
+
+            instances.append({"name": conf.name, "remote": conf.remote, "project": conf.project, "forwards": forwards})
+
+        with self.lock:
+            self.challenges[name] = {"name": name, "path": challenge.path if challenge else None, "status": status, "instances": instances}
+
+    def write(self, path: str):
+        with self.lock:
+            content = {"finished": time.time(), "challenges": [self.challenges[name] for name in sorted(self.challenges)]}
+
+        # Written next to the file and renamed so a reader never sees half of it.
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(content, f, indent=2)
+
+        os.replace(temporary, path)
+
+results = Results()
+
+def deployChallenge(args, challengePath: str):
+    name = os.path.basename(os.path.normpath(challengePath))
+
+    with tracer.span("challenge", challenge=name), ledger.run(name, "apply" if args.apply else "deploy"):
+        try:
+            deployChallengePhases(args, challengePath)
+        except BaseException as error:
+            if(not isinstance(error, SystemExit) or error.code not in [0, None]):
+                results.add(name, "failed")
+            raise
+
+def deployChallengePhases(args, challengePath: str):
+    start = datetime.datetime.now()
+
+    with tracer.span("config"):
+        challenge = loadConfig(args, challengePath)
+
+    with tracer.span("placement"):
+        challenge = placeChallenge(args, challenge)
+
+    with tracer.span("resolve"):
+        for conf in challenge.config:
+            if(not session.remoteExists(conf.remote)):
+                print(f"Remote was not found: {conf.remote}")
+                sys.exit(1)
+
+            if(not session.projectExists(conf.remote, conf.project)):
+                print(f"Project was not found: {conf.project}")
+                sys.exit(1)
+
+        challenge = allocatePorts(args, challenge)
+
+        conflicts = checkForwards(challenge)
+        if(conflicts):
+            for conflict in conflicts:
+                print(f"Forward port conflict: {conflict}")
+            sys.exit(1)
+
+    if(args.apply):
+        with tracer.span("apply"):
+            applyChallenge(args, challenge)
+    else:
+        pipeline = Pipeline(args, challenge)
+
+        if(not pipeline.run()):
+            if(not args.keepInstancesOnFailure and not args.resume):
+                # Instances which existed before the run (e.g. kept by a failed deployment) are left alone.
+                cleanup(args=args, config=[conf for conf in challenge.config if conf.name in pipeline.launched])
+            else:
+                print("Instances were kept, use --resume to continue from the stages which did not complete.")
+
+            sys.exit(1)
+
+    print(f"Elasped time: {(datetime.datetime.now() - start).total_seconds()}")
+
+    if(not args.plan):
+        results.add(os.path.basename(os.path.normpath(challengePath)), "applied" if args.apply else "deployed", challenge)
+
+    if(args.test):
+        cleanup(args=args, config=challenge.config)
+
+def destroyChallenge(args, challengePath: str):
+    name = os.path.basename(os.path.normpath(challengePath))
+
+    with tracer.span("challenge", challenge=name), ledger.run(name, "destroy"):
+        challenge = placeChallenge(args, loadConfig(args, challengePath))
+        cleanup(args=args, config=challenge.config)
+
+def deployBatch(args, challengePaths: list) -> bool:
+    output = sys.stdout = PrefixedOutput(sys.stdout)
+    results = {}
+
+    def worker(challengePath: str):
+        output.prefix = os.path.basename(os.path.normpath(challengePath))
+        start = datetime.datetime.now()
+
+        try:
+            deployChallenge(args=args, challengePath=challengePath)
+            return (True, None, datetime.datetime.now() - start)
+        except SystemExit as error:
+            return (error.code in [0, None], f"Exited with status {error.code}", datetime.datetime.now() - start)
+        except Exception as error:
+            print(traceback.format_exc())
+            return (False, f"{type(error).__name__}: {error}", datetime.datetime.now() - start)
+        finally:
+            output.prefix = None
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(worker, challengePath): challengePath for challengePath in challengePaths}
+
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    print("")
+    print("Summary:")
+    for challengePath in challengePaths:
+        success, error, elapsed = results[challengePath]
+        print(f"\t{'OK    ' if success else 'FAILED'} {challengePath} ({elapsed.total_seconds():.1f}s){f': {error}' if error else ''}")
+
+    failed = [challengePath for challengePath, result in results.items() if not result[0]]
+    print(f"{len(challengePaths) - len(failed)}/{len(challengePaths)} challenge(s) deployed.")
+
+    return len(failed) == 0
+
+def selectInstances(args, instances: list) -> list:
+    labels = []
+    for label in args.label or []:
+        key, _, value = label.partition("=")
+        labels.append((key if key.startswith("user.") else f"user.{key}", value))
+
+    selected = []
+    for instance in instances:
+        if(args.challengePath and not any(fnmatch.fnmatchcase(instance["name"], pattern) for pattern in args.challengePath)):
+            continue
+
+        if(any((instance.get("config") or {}).get(key) != value for key, value in labels)):
+            continue
+
+        selected.append(instance)
+
+    return selected
+
+def instanceForwardAddresses(instance: dict, nic: str) -> tuple:
+    # Network and addresses of the NIC from a recursive instance listing, without fetching the instance again.
+    device = (instance.get("expanded_devices") or {}).get(nic) or {}
+    addresses = [device[key] for key in ["ipv4.address", "ipv6.address"] if device.get(key)]
+
+    for address in (((instance.get("state") or {}).get("network") or {}).get(nic) or {}).get("addresses") or []:
+        if(address["family"] in ["inet", "inet6"] and address["scope"] == "global" and not address["address"] in addresses):
+            addresses.append(address["address"])
+
+    return (device.get("network"), addresses)
+
+def purgeInstances(args) -> bool:
+    args.force = True
+
+    if(not args.remote or not args.project):
+        print("Missing --remote and/or --project arguments.")
+        sys.exit(1)
+
+    if(not session.remoteExists(args.remote)):
+        print(f"Remote was not found: {args.remote}")
+        sys.exit(1)
+
+    if(not session.projectExists(args.remote, args.project)):
+        print(f"Project was not found: {args.project}")
+        sys.exit(1)
+
+    if(not args.challengePath and not args.label and not args.purgeAll):
+        print("--purge expects instance names (globs allowed), --label or --purge-all.")
+        sys.exit(1)
+
+    project = session.project(args.remote, args.project)
+
+    # A single listing with the configuration, devices and addresses of every instance of the project.
+    instances = selectInstances(args, incusQuery(args.remote, "/1.0/instances?recursion=2", project=args.project) or [])
+    names = [instance["name"] for instance in instances]
+
+    if(not names):
+        print("No instance to purge.")
+        return True
+
+    if(args.verbose):
+        print(f"[DEBUG] Instances to purge: {', '.join(names)}")
+
+    acls = associatedACLs(project=project, args=args, instance=names)
+
+    for instance in instances:
+        network, addresses = instanceForwardAddresses(instance, args.nic)
+        if(network and addresses):
+            session.forwards(project, network).remove(addresses)
+
+        # Forwards of a stopped instance without a pinned address are only known to the ledger.
+        removeRecordedForwards(project, args, instance=instance["name"], commit=False)
+
+    session.commitForwards(args)
+
+    deleted = []
+    failed = {}
+
+    parent = tracer.current()
+
+    def worker(name: str):
+        with tracer.span("destroy", parent=parent, instance=name):
+            forceDelete(args.remote, args.project, name)
+            session.invalidate(project, instance=name)
+            ledger.forgetInstance(args.remote, args.project, name)
+            portAllocator.release(args.remote, args.project, name)
+            addressManager.release(args.remote, args.project, name)
+
+        if(args.verbose):
+            print(f"[DEBUG] Instance was deleted: {name}")
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(worker, name): name for name in names}
+
+        for future in as_completed(futures):
+            try:
+                future.result()
+                deleted.append(futures[future])
+            except Exception as error:
+                failed[futures[future]] = error
+
+    releaseNetworkACLs(project=project, args=args, acls=acls, instances=deleted)
+
+    for name, error in failed.items():
+        print(f"Failed to purge {name}: {error}")
+
+    print(f"{len(deleted)}/{len(names)} instance(s) purged.")
+
+    return len(failed) == 0
+
+class EventStream(object):
+    # Progress of a daemon request sent back to its client, one JSON object per line.
+    def __init__(self, connection: socket.socket):
+        self.file = connection.makefile("w", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.buffer = ""
+        self.closed = False
+
+    def send(self, event: str, **data):
+        with self.lock:
+            if(self.closed):
+                return
+
+            try:
+                self.file.write(json.dumps({"event": event, **data}) + "\n")
+                self.file.flush()
+            except OSError:
+                # The client went away, its deployments carry on.
+                self.closed = True
+
+    def write(self, data: str):
+        lines = (self.buffer + data).splitlines(keepends=True)
+        self.buffer = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+
+        for line in lines:
+            self.send("output", line=line)
+
+        return len(data)
+
+    def flush(self):
+        pass
+
+class Daemon(object):
+    # Serve deploy, apply, destroy and status requests on a Unix socket. Remotes and projects stay resolved and
+    # parsed challenges are kept between requests, the rest of the incus state is looked up again whenever the
+    # daemon was idle. Challenges of every client run up to --jobs at a time, the others are queued.
+    commands = {"deploy": deployChallenge, "apply": deployChallenge, "destroy": destroyChallenge}
+
+    def __init__(self, args):
+        self.args = args
+        self.started = time.time()
+        self.slots = threading.Semaphore(args.jobs)
+        self.lock = threading.Lock()
+        self.queued = {}
+        self.running = {}
+        self.requests = 0
+
+    def status(self) -> dict:
+        with self.lock:
+            return {"pid": os.getpid(), "uptime": time.time() - self.started, "jobs": self.args.jobs, "requests": self.requests, "running": dict(self.running), "queued": dict(self.queued), "challenges": len(configCache), "session": str(session)}
+
+    def run(self, args, command: str, challengePath: str, events: EventStream) -> tuple:
+        name = os.path.basename(os.path.normpath(challengePath))
+
+        with self.lock:
+            if(name in self.running or name in self.queued):
+                return (False, "Another request is already deploying or destroying this challenge.", 0.0)
+
+            self.queued[name] = command
+
+        with self.slots:
+            with self.lock:
+                self.queued.pop(name)
+
+                if(not self.running):
+                    session.forget()
+                    scheduler.forget()
+                    portAllocator.forget()
+                    addressManager.forget()
+                    with tracer.lock:
+                        tracer.spans = []
+
+                self.running[name] = command
+
+            sys.stdout.context = (name, events)
+            start = time.monotonic()
+
+            try:
+                self.commands[command](args, challengePath)
+                return (True, None, time.monotonic() - start)
+            except SystemExit as error:
+                return (error.code in [0, None], f"Exited with status {error.code}", time.monotonic() - start)
+            except Exception as error:
+                print(traceback.format_exc())
+                return (False, f"{type(error).__name__}: {error}", time.monotonic() - start)
+            finally:
+                sys.stdout.context = (None, None)
+
+                with self.lock:
+                    self.running.pop(name)
+
+    def handle(self, rfile, connection: socket.socket):
+        events = EventStream(connection)
+
+        try:
+            request = json.loads(rfile.readline())
+            command = request["command"]
+            challengePaths = request.get("challengePaths") or []
+        except (ValueError, KeyError, TypeError):
+            events.send("exit", status=1, error="Invalid request.")
+            return
+
+        if(command == "status"):
+            events.send("status", **self.status())
+            events.send("exit", status=0)
+            return
+
+        if(not command in self.commands or not challengePaths):
+            events.send("exit", status=1, error=f"Invalid request: {command}")
+            return
+
+        with self.lock:
+            self.requests += 1
+
+        args = argparse.Namespace(**vars(self.args))
+        for key, value in (request.get("options") or {}).items():
+            if(key in DAEMON_REQUEST_OPTIONS):
+                setattr(args, key, value)
+
+        args.command = command
+        args.apply = command == "apply"
+        args.plan = args.plan and args.apply
+
+        def worker(challengePath: str):
+            success, error, elapsed = self.run(args, command, challengePath, events)
+            events.send("done", challenge=challengePath, success=success, error=error, seconds=elapsed)
+            return success
+
+        # No more than --jobs of them can run at a time, the others wait for a worker instead of a slot.
+        with ThreadPoolExecutor(max_workers=min(len(challengePaths), self.args.jobs)) as executor:
+            results = list(executor.map(worker, challengePaths))
+
+        events.send("exit", status=0 if all(results) else 1)
+
+    def serve(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.args.socket)), exist_ok=True)
+
+        if(os.path.exists(self.args.socket)):
+            if(daemonRequest(self.args, "status", quiet=True) is not None):
+                print(f"A daemon is already listening on: {self.args.socket}")
+                sys.exit(1)
+
+            os.remove(self.args.socket)
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                daemon.handle(self.rfile, self.connection)
+
+        sys.stdout = PrefixedOutput(sys.stdout)
+        # The socket is created owner only, another user can not connect between the bind and the chmod.
+        umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(self.args.socket, Handler)
+        finally:
+            os.umask(umask)
+
+        server.daemon_threads = True
+        os.chmod(self.args.socket, 0o600)
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+        print(f"Listening on: {self.args.socket}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(self.args.socket)
+            warmPool.wait()
+
+def daemonRequest(args, command: str, challengePaths: list=[], *, quiet: bool=False) -> int:
+    # Exit status of the request, None when no daemon listens on --socket.
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        connection.connect(args.socket)
+    except OSError:
+        connection.close()
+        return None
+
+    with connection:
+        if(not quiet and command != "status"):
+            print(f"Sent to the daemon listening on {args.socket}, use --no-daemon to run in this process.")
+
+        options = {key: getattr(args, key) for key in DAEMON_REQUEST_OPTIONS}
+        connection.sendall((json.dumps({"command": command, "challengePaths": [os.path.abspath(path) for path in challengePaths], "options": options}) + "\n").encode())
+
+        results = []
+        for line in connection.makefile("r", encoding="utf-8"):
+            event = json.loads(line)
+
+            if(quiet and event["event"] != "exit"):
+                continue
+
+            if(event["event"] == "output"):
+                print(event["line"], end="")
+            elif(event["event"] == "status"):
+                print(f"Daemon (pid {event['pid']}) listening on {args.socket} for {event['uptime']:.0f}s")
+                print(f"\t{event['requests']} request(s), {len(event['running'])}/{event['jobs']} running, {len(event['queued'])} queued, {event['challenges']} parsed challenge(s)")
+                print(f"\tIncus: {event['session']}")
+                for name, running in sorted(event["running"].items()):
+                    print(f"\tRUNNING {running:<8} {name}")
+                for name, queued in sorted(event["queued"].items()):
+                    print(f"\tQUEUED  {queued:<8} {name}")
+            elif(event["event"] == "done"):
+                results.append(event)
+            elif(event["event"] == "exit"):
+                if(event.get("error")):
+                    print(event["error"])
+
+                if(len(results) > 1):
+                    print("")
+                    print("Summary:")
+                    for result in results:
+                        error = f": {result['error']}" if result["error"] else ""
+                        print(f"\t{'OK    ' if result['success'] else 'FAILED'} {result['challenge']} ({result['seconds']:.1f}s){error}")
+
+                return event["status"]
+
+    print("Lost the connection to the daemon.")
+    return 1
+
+class Reconciler(object):
+    # Compare what the ledger recorded with incus, one direct lookup per resource (forwards are read once per
+    # listen address), so drift made outside of the script (e.g. an instance deleted by hand) is reported.
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.cache = {}
+
+    def get(self, remote: str, project: str, path: str) -> dict:
+        key = (remote, project, path)
+
+        with self.lock:
+            if(key in self.cache):
+                return self.cache[key]
+
+        try:
+            result = incusQuery(remote, path, project=project)
+        except IncusException as error:
+            if(not "not found" in str(error).lower()):
+                raise
+
+            result = None
+
+        with self.lock:
+            self.cache[key] = result
+
+        return result
+
+    def check(self, resource: dict) -> str:
+        remote, project, name = resource["remote"], resource["project"], resource["name"]
+        quote = urllib.parse.quote
+
+        if(resource["kind"] == "instance"):
+            return None if self.get(remote, project, f"/1.0/instances/{quote(name)}") else "missing"
+        elif(resource["kind"] == "network"):
+            return None if self.get(remote, project, f"/1.0/networks/{quote(name)}") else "missing"
+        elif(resource["kind"] == "acl"):
+            return None if self.get(remote, project, f"/1.0/network-acls/{quote(name)}") else "missing"
+        elif(resource["kind"] == "image"):
+            return None if self.get(remote, project, f"/1.0/images/aliases/{quote(name)}") else "missing"
+        elif(resource["kind"] == "forward"):
+            forward = self.get(remote, project, f"/1.0/networks/{quote(resource['parent'])}/forwards/{quote(resource['data']['listen_address'])}")
+            ports = [port for port in (forward or {}).get("ports") or [] if ForwardManager.name(resource["data"]["listen_address"], port) == name]
+
+            if(not ports):
+                return "missing"
+
+            return None if any(ForwardManager.same(port, resource["data"]) for port in ports) else f"forwarded to {ports[0]['target_address']}:{ports[0].get('target_port') or ports[0]['listen_port']}"
+        elif(resource["kind"] == "address"):
+            instance = self.get(remote, project, f"/1.0/instances/{quote(resource['instance'])}")
+            if(not instance):
+                return "missing"
+
+            device = (instance.get("expanded_devices") or instance.get("devices") or {}).get(resource["data"].get("nic", "eth0")) or {}
+            current = device.get(resource["data"].get("key", "ipv4.address"))
+
+            return None if current == name else f"{resource['data'].get('key', 'ipv4.address')} is {current}"
+
+        return None
+
+    def untracked(self, challengePaths: list) -> list:
+        # Instances of the given challenges which exist but were not deployed with the ledger.
+        untracked = []
+
+        for challengePath in challengePaths:
+            for conf in loadConfig(self.args, challengePath).config:
+                for remote in conf.remotes:
+                    if(not ledger.find("instance", remote, conf.project, conf.name) and self.get(remote, conf.project, f"/1.0/instances/{urllib.parse.quote(conf.name)}")):
+                        untracked.append((remote, conf))
+
+        return untracked
+
+    def run(self, challengePaths: list) -> bool:
+        challenges = [os.path.basename(os.path.normpath(challengePath)) for challengePath in challengePaths] or None
+        resources = ledger.resources(remote=self.args.remote, project=self.args.project, challenges=challenges)
+        drift = {}
+
+        with ThreadPoolExecutor(max_workers=self.args.jobs) as executor:
+            futures = {executor.submit(self.check, resource): resource for resource in resources}
+
+            for future in as_completed(futures):
+                problem = future.result()
+                if(problem):
+                    drift[futures[future]["id"]] = problem
+
+        for resource in resources:
+            network = f" (network {resource['parent']})" if resource["parent"] else ""
+            description = f"{resource['kind']:<8} {resource['remote']}:{resource['project']} {resource['name']}{network} [{resource['challenge'] or '-'}]"
+            problem = drift.get(resource["id"])
+
+            if(problem == "missing"):
+                print(f"{'MISSING':<9} {description}")
+
+                if(self.args.forget):
+                    ledger.forget(resource["kind"], resource["remote"], resource["project"], resource["name"], parent=resource["parent"])
+            elif(problem):
+                print(f"{'CHANGED':<9} {description}: {problem}")
+            elif(self.args.verbose):
+                print(f"{'OK':<9} {description}")
+
+        untracked = self.untracked(challengePaths)
+        for remote, conf in untracked:
+            print(f"{'UNTRACKED':<9} {'instance':<8} {remote}:{conf.project} {conf.name}")
+
+        missing = len([problem for problem in drift.values() if problem == "missing"])
+        print(f"{len(resources)} recorded resource(s) checked: {missing} missing, {len(drift) - missing} changed, {len(untracked)} untracked instance(s).")
+
+        if(self.args.forget and missing):
+            print(f"{missing} missing resource(s) were removed from the ledger.")
+
+        return len(drift) == 0 and len(untracked) == 0
+
+def inventoryHosts(content: str) -> set:
+    # Host names of a YAML inventory or of an INI one, in any group.
+    hosts = set()
+
+    try:
+        inventory = yaml.safe_load(content)
+    except yaml.YAMLError:
+        inventory = None
+
+    if(isinstance(inventory, dict)):
+        groups = list(inventory.values())
+        while(groups):
+            group = groups.pop()
+            if(not isinstance(group, dict)):
+                continue
+
+            if(not isinstance(group.get("hosts") or {}, dict) or not isinstance(group.get("children") or {}, dict)):
+                raise Exception("Inventory groups must map their hosts and children by name.")
+
+            hosts.update((group.get("hosts") or {}).keys())
+            groups += list((group.get("children") or {}).values())
+
+        return hosts
+
+    section = None
+    for line in content.splitlines():
+        line = line.strip()
+        if(not line or line[0] in "#;"):
+            continue
+
+        if(line.startswith("[")):
+            if(not line.endswith("]")):
+                raise Exception(f"Invalid inventory section: {line}")
+
+            section = line[1:-1]
+            continue
+
+        if(section is None or not ":" in section):
+            hosts.add(line.split()[0])
+
+    return hosts
+
+def challengeFacts(challenge: Challenge, hosts: set) -> dict:
+    # What validate checks across challenges, kept in its cache for the challenges which did not change.
+    instances = []
+
+    for conf in challenge.config:
+        network = None
+        if(conf.network):
+            listenAddresses = conf.network.listenAddresses or {None: conf.network.listenAddress}
+            network = {
+                "name": conf.network.name,
+                "action": conf.network.action,
+                "config": conf.network.config or {},
+                "listenAddresses": {remote or "*": address for remote, address in listenAddresses.items() if address},
+                "ipv4": None if not conf.network.ipv4 or pyincus.utils.isFalse(conf.network.ipv4) else str(conf.network.ipv4),
+                "ipv6": None if not conf.network.ipv6 or pyincus.utils.isFalse(conf.network.ipv6) else str(conf.network.ipv6),
+                "forwards": [[forward.protocol, expandPorts(forward.source)] for forward in conf.network.forwards if not forward.auto],
+            }
+
+        instances.append({
+            "name": conf.name,
+            "remotes": conf.remotes,
+            "project": conf.project,
+            "copy": [conf.copy.remote, conf.copy.project or conf.project, conf.copy.name] if conf.copy else None,
+            "imageRemote": conf.launch.image.remote if conf.launch else None,
+            "network": network,
+        })
+
+    return {"instances": instances, "missingHosts": sorted(conf.host for conf in challenge.config if not conf.replicaOf and not conf.host in hosts)}
+
+def validateChallenge(challengePath: str) -> dict:
+    errors = []
+    facts = None
+    challenge = None
+    hosts = None
+    contents = {}
+
+    for fileName in [CONFIGURATION_FILE_NAME, INVENTORY_FILE_NAME, CHALLENGE_FILE_NAME]:
+        path = os.path.join(challengePath, fileName)
+        if(not os.path.isfile(path)):
+            errors.append(f"Missing file: {path}")
+            continue
+
+        with open(path) as f:
+            contents[fileName] = f.read()
+
+    if(errors):
+        return {"errors": errors, "facts": None}
+
+    try:
+        challenge = parseConfig(challengePath, yaml.safe_load(contents[CONFIGURATION_FILE_NAME]))
+    except Exception as error:
+        errors.append(f"{CONFIGURATION_FILE_NAME}: {type(error).__name__}: {error}")
+
+    try:
+        hosts = inventoryHosts(contents[INVENTORY_FILE_NAME])
+    except Exception as error:
+        errors.append(f"{INVENTORY_FILE_NAME}: {error}")
+
+    try:
+        plays = yaml.safe_load(contents[CHALLENGE_FILE_NAME])
+        if(not isinstance(plays, list) or not all(isinstance(play, dict) and ("hosts" in play or "import_playbook" in play or "ansible.builtin.import_playbook" in play) for play in plays)):
+            raise Exception("must be a list of plays, each with hosts.")
+    except Exception as error:
+        errors.append(f"{CHALLENGE_FILE_NAME}: {error}")
+
+    if(challenge and hosts is not None):
+        facts = challengeFacts(challenge, hosts)
+
+    return {"errors": errors, "facts": facts}
+
+def crossCheckChallenges(facts: dict) -> list:
+    # Conflicts between instances of different challenges (or of the same one) that no single config.yml can show.
+    conflicts = []
+    names = {}
+    ports = {}
+    addresses = {}
+    networks = {}
+
+    for challengePath, challenge in facts.items():
+        for instance in challenge["instances"]:
+            owner = f"{challengePath}/{instance['name']}"
+
+            for remote in instance["remotes"]:
+                names.setdefault((remote, instance["project"], instance["name"]), []).append(challengePath)
+
+                network = instance["network"]
+                if(not network):
+                    continue
+
+                listenAddress = network["listenAddresses"].get(remote, network["listenAddresses"].get("*"))
+                if(listenAddress):
+                    for protocol, sourcePorts in network["forwards"]:
+                        for port in sourcePorts:
+                            ports.setdefault((remote, listenAddress, protocol, port), []).append(owner)
+
+                for family in ["ipv4", "ipv6"]:
+                    if(network[family]):
+                        addresses.setdefault((remote, instance["project"], network["name"], str(ip_address(network[family]))), []).append(owner)
+
+                if(network["action"] in ["create", "update"]):
+                    subnets = tuple(network["config"].get(key) for key in ["ipv4.address", "ipv6.address"])
+                    networks.setdefault((remote, instance["project"], network["name"]), {}).setdefault(subnets, []).append(owner)
+
+    for (remote, project, name), challengePaths in names.items():
+        if(len(challengePaths) > 1):
+            conflicts.append(f"Instance {remote}:{project}/{name} is defined by: {', '.join(sorted(challengePaths))}")
+
+    for (remote, listenAddress, protocol, port), owners in ports.items():
+        if(len(set(owners)) > 1):
+            conflicts.append(f"Listen port {protocol}/{port} on {remote} {listenAddress} is forwarded by: {', '.join(sorted(set(owners)))}")
+
+    for (remote, project, network, address), owners in addresses.items():
+        if(len(set(owners)) > 1):
+            conflicts.append(f"Address {address} on {remote}:{project}/{network} is given to: {', '.join(sorted(set(owners)))}")
+
+    subnets = {}
+    for (remote, project, network), definitions in networks.items():
+        if(len(definitions) > 1):
+            conflicts.append(f"Network {remote}:{project}/{network} is defined with different addresses by: {', '.join(sorted(owner for owners in definitions.values() for owner in owners))}")
+
+        for definition in definitions:
+            for subnet in definition:
+                if(subnet and not subnet in ["none", "auto"]):
+                    try:
+                        subnets.setdefault(remote, []).append((f"{project}/{network}", ip_interface(subnet).network))
+                    except ValueError:
+                        conflicts.append(f"Network {remote}:{project}/{network} has an invalid address: {subnet}")
+
+    for remote, definitions in subnets.items():
+        for i, (network, subnet) in enumerate(definitions):
+            for otherNetwork, otherSubnet in definitions[i + 1:]:
+                if(network != otherNetwork and subnet.version == otherSubnet.version and subnet.overlaps(otherSubnet)):
+                    conflicts.append(f"Networks {remote}:{network} ({subnet}) and {remote}:{otherNetwork} ({otherSubnet}) overlap.")
+
+    for (remote, project, network, address), owners in addresses.items():
+        for definition in networks.get((remote, project, network), {}):
+            for subnet in definition:
+                try:
+                    outside = subnet and not subnet in ["none", "auto"] and ip_address(address).version == ip_interface(subnet).version and not ip_address(address) in ip_interface(subnet).network
+                except ValueError:
+                    continue
+
+                if(outside):
+                    conflicts.append(f"Address {address} of {', '.join(sorted(set(owners)))} is outside of network {remote}:{project}/{network} ({subnet}).")
+
+    return conflicts
+
+def checkRemotes(args, facts: dict) -> list:
+    # Existence of the remotes, projects and copy sources, with one request per remote instead of one per instance.
+    errors = []
+    remotes = set(json.loads(runIncus(["remote", "list", "--format", "json"])).keys())
+    projects = {}
+    sources = {}
+
+    for challengePath, challenge in facts.items():
+        for instance in challenge["instances"]:
+            owner = f"{challengePath}/{instance['name']}"
+            used = [*instance["remotes"], *([instance["copy"][0]] if instance["copy"] else []), *([instance["imageRemote"]] if instance["imageRemote"] else [])]
+
+            for remote in used:
+                if(not remote in remotes):
+                    errors.append(f"Remote of {owner} was not found: {remote}")
+
+            for remote in instance["remotes"]:
+                if(remote in remotes):
+                    projects.setdefault(remote, {}).setdefault(instance["project"], []).append(owner)
+
+            if(instance["copy"] and instance["copy"][0] in remotes):
+                remote, project, name = instance["copy"]
+                projects.setdefault(remote, {}).setdefault(project, []).append(owner)
+                sources.setdefault(remote, {}).setdefault((project, name), []).append(owner)
+
+    def fetch(remote: str):
+        existingProjects = {url.rsplit("/", 1)[-1] for url in incusQuery(remote, "/1.0/projects")}
+        existingInstances = set()
+        if(remote in sources):
+            for url in incusQuery(remote, "/1.0/instances?all-projects=true"):
+                parsed = urllib.parse.urlparse(url)
+                existingInstances.add((urllib.parse.parse_qs(parsed.query).get("project", ["default"])[0], parsed.path.rsplit("/", 1)[-1]))
+
+        return (existingProjects, existingInstances)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {remote: executor.submit(fetch, remote) for remote in projects}
+
+    for remote, future in futures.items():
+        try:
+            existingProjects, existingInstances = future.result()
+        except IncusException as error:
+            errors.append(f"Remote {remote} could not be queried: {error}")
+            continue
+
+        for project, owners in projects[remote].items():
+            if(not project in existingProjects):
+                errors.append(f"Project {remote}:{project} of {', '.join(sorted(set(owners)))} was not found.")
+
+        for (project, name), owners in sources.get(remote, {}).items():
+            if(project in existingProjects and not (project, name) in existingInstances):
+                errors.append(f"Copy source {remote}:{project}/{name} of {', '.join(sorted(set(owners)))} was not found.")
+
+    return errors
+
+def validateChallenges(args, challengePaths: list) -> bool:
+    # Every challenge is parsed on its own thread, those whose files (and deploy.py) did not change since the last
+    # validate reuse its result. The cross checks always run on every challenge given.
+    cache = {}
+    if(not args.refresh and os.path.isfile(VALIDATE_CACHE_PATH)):
+        try:
+            with open(VALIDATE_CACHE_PATH) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    with open(__file__, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()
+
+    def validate(challengePath: str) -> tuple:
+        digest = hashlib.sha256(version.encode())
+        for fileName in [CONFIGURATION_FILE_NAME, INVENTORY_FILE_NAME, CHALLENGE_FILE_NAME]:
+            path = os.path.join(challengePath, fileName)
+            digest.update(fileName.encode())
+            if(os.path.isfile(path)):
+                with open(path, "rb") as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+
+        key = os.path.abspath(challengePath)
+        if(key in cache and cache[key]["hash"] == digest.hexdigest()):
+            return (cache[key], True)
+
+        return ({"hash": digest.hexdigest(), **validateChallenge(challengePath)}, False)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        validated = list(executor.map(validate, challengePaths))
+
+    failed = []
+    facts = {}
+
+    for challengePath, (result, unchanged) in zip(challengePaths, validated):
+        cache[os.path.abspath(challengePath)] = result
+
+        if(result["errors"]):
+            print(f"FAILED {challengePath}{' (unchanged)' if unchanged else ''}")
+            for error in result["errors"]:
+                print(f"\t{error}")
+
+            failed.append(challengePath)
+            continue
+
+        print(f"OK     {challengePath}{' (unchanged)' if unchanged else ''}")
+        for name in result["facts"]["missingHosts"]:
+            print(f"\tWarning: {name} is not a host of {INVENTORY_FILE_NAME}.")
+
+        facts[challengePath] = result["facts"]
+
+    conflicts = crossCheckChallenges(facts)
+
+    if(args.online):
+        try:
+            conflicts += checkRemotes(args, facts)
+        except IncusException as error:
+            conflicts.append(f"Remotes could not be listed: {error}")
+
+    for conflict in conflicts:
+        print(f"CONFLICT {conflict}")
+
+    try:
+        os.makedirs(os.path.dirname(VALIDATE_CACHE_PATH), exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(VALIDATE_CACHE_PATH), delete=False) as f:
+            json.dump(cache, f)
+
+        os.replace(f.name, VALIDATE_CACHE_PATH)
+    except OSError as error:
+        if(args.verbose):
+            print(f"[DEBUG] The validate cache could not be written: {error}")
+
+    print(f"{len(challengePaths) - len(failed)}/{len(challengePaths)} challenge(s) valid, {len(conflicts)} conflict(s).")
+
+    return len(failed) == 0 and len(conflicts) == 0
+
+def openLedger(args):
+    try:
+        ledger.open(args.ledger)
+    except (OSError, sqlite3.Error) as error:
+        print(f"Failed to open the ledger {args.ledger}: {error}")
+        sys.exit(1)
+
+    if(args.verbose):
+        print(f"[DEBUG] Ledger: {args.ledger}")
+
+def commandArguments(argv: list, valueOptions: set=set()) -> list:
+    # The command used to be selected with a flag (e.g. --purge) and deploying was the default, those command
+    # lines still work. Only the options are looked at, not the value of an option nor what follows `--`.
+    if(argv and argv[0] in list(COMMAND_DEPENDENCIES) + ["-h", "--help"]):
+        return argv
+
+    options = {}
+    isValue = False
+    for index, argument in enumerate(argv):
+        if(argument == "--"):
+            break
+
+        if(not isValue):
+            options.setdefault(argument, index)
+
+        isValue = not isValue and argument in valueOptions
+
+    for flag, command in [("--purge", "purge"), ("--cache-list", "cache"), ("--status", "status"), ("--daemon", "daemon"), ("--destroy", "destroy"), ("-a", "apply"), ("--apply", "apply")]:
+        if(flag in options):
+            return [command] + argv[:options[flag]] + argv[options[flag] + 1:]
+
+    if("--plan" in options):
+        return ["apply"] + argv
+
+    return ["deploy"] + argv
+
+if __name__ == '__main__':
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-v", "--verbose", help="Verbose", action="store_true")
+
+    challenges = argparse.ArgumentParser(add_help=False)
+    challenges.add_argument("challengePath", type=str, nargs="*")
+    batch = challenges.add_argument_group('batch')
+    batch.add_argument("--all", help=f"Every challenge found in '{CHALLENGES_DIRECTORY}'.", action="store_true")
+    batch.add_argument("-j", "--jobs", help="Number of challenges deployed concurrently when more than one is given. Default 4.", default=4, type=int)
+
+    listening = argparse.ArgumentParser(add_help=False)
+    listening.add_argument("--socket", help=f"Unix socket of the daemon. Default '{DAEMON_SOCKET}'.", default=DAEMON_SOCKET, type=str)
+
+    client = argparse.ArgumentParser(add_help=False, parents=[listening])
+    client.add_argument("--no-daemon", dest='noDaemon', help="Run in this process even when a daemon is running.", action="store_true")
+
+    waiting = argparse.ArgumentParser(add_help=False)
+    waiting.add_argument("--wait-timeout", dest='waitTimeout', help="Maximum time in seconds to wait for an instance to get its IP addresses or to boot. Default 300.", default=300, type=float)
+
+    metrics = argparse.ArgumentParser(add_help=False)
+    group = metrics.add_argument_group('metrics')
+    group.add_argument("--metrics", help="Write the timing span of every phase (with incus calls and poll counts) to this file as JSON lines.", type=str)
+    group.add_argument("--metrics-prometheus", dest='metricsPrometheus', help="Write the phase totals to this file in the Prometheus text format (e.g. for the node exporter textfile collector).", type=str)
+    group.add_argument("--trace", help="Write the spans to this file as an OpenTelemetry (OTLP/JSON) trace.", type=str)
+
+    target = argparse.ArgumentParser(add_help=False)
+    target.add_argument("--remote", help="Specify remote.", type=str)
+    target.add_argument("--project", help="Specify project.", type=str)
+
+    placing = argparse.ArgumentParser(add_help=False)
+    group = placing.add_argument_group('placement')
+    group.add_argument("--placement", help=f"Policy placing the instances whose remote is a list of candidates, overrides the one of the config.yml. Within {PLACEMENT_POLICIES}.", choices=PLACEMENT_POLICIES, type=str)
+    group.add_argument("--placement-remotes", dest='placementRemotes', help="Comma separated remotes every instance is placed on, instead of the remote(s) of its config.yml.", type=lambda value: [remote for remote in value.split(",") if remote])
+
+    forwarding = argparse.ArgumentParser(add_help=False)
+    forwarding.add_argument("--result", help="Write where every instance was deployed and the listen address and port of each of its forwards (auto ones included) to this file as JSON.", type=str)
+    group = forwarding.add_argument_group('listen ports')
+    group.add_argument("--port-range", dest='portRange', help=f"Ports allocated to the forwards whose source is auto, unless their network has a port_range. Default '{AUTO_PORT_RANGE}'.", default=AUTO_PORT_RANGE, type=parsePortRange)
+    group.add_argument("--unique-ports", dest='uniquePorts', help="Allocate auto listen ports which are unique across every remote and listen address instead of per listen address.", action="store_true")
+
+    recording = argparse.ArgumentParser(add_help=False)
+    recording.add_argument("--ledger", help=f"SQLite file recording what was created per challenge and run. Default '{LEDGER_PATH}'.", default=LEDGER_PATH, type=str)
+
+    parser = argparse.ArgumentParser(epilog="Without a command, deploy is assumed (e.g. deploy.py challenge).")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    deployParser = commands.add_parser("deploy", parents=[common, challenges, waiting, client, metrics, recording, placing, forwarding], help="Deploy challenges.")
+    deployParser.add_argument("-f", "--force", help="Force deletion if instance exists", action="store_true")
+    deployParser.add_argument("-k", "--keep-instances-on-failure", dest='keepInstancesOnFailure', help="Keep instance(s) if the script fails.", action="store_true")
+    deployParser.add_argument("-r", "--resume", help="Continue a deployment which failed with instances kept: stages each instance completed are skipped and the playbook starts again at the task which failed.", action="store_true")
+    deployParser.add_argument("-t", "--test", help="Once completed, destroy everything (only the instance is destroyed at the moment).", action="store_true")
+    deployParser.add_argument("--parallel", help="Number of instances of a challenge deployed concurrently. Default the number of CPUs + 4, up to 32.", default=PARALLEL_INSTANCES, type=int)
+    cache = deployParser.add_argument_group('image cache')
+    cache.add_argument("--cache", help="Launch instances from the cached image of their provisioned state when the challenge did not change, publish that image otherwise.", action="store_true")
+    cache.add_argument("--cache-max-size", dest='cacheMaxSize', help="Evict the least recently used cached images once they use more than this size (e.g. 20GiB).", type=parseSize)
+    pool = deployParser.add_argument_group('warm pool')
+    pool.add_argument("--pool", help="Claim instances from a pool of pre-launched instances and keep this many ready per image/copy source. Default 0 (disabled).", default=0, type=int)
+    pool.add_argument("--pool-max-age", dest='poolMaxAge', help="Recycle pooled instances older than this many seconds. Default 86400.", default=86400, type=float)
+    pool.add_argument("--pool-fill", dest='poolFill', help="Fill the pools of the given challenges up to --pool instances and exit.", action="store_true")
+
+    applyParser = commands.add_parser("apply", parents=[common, challenges, waiting, client, metrics, recording, placing, forwarding], help="Apply the changes between the configuration file and the existing instance(s) without redeploying.")
+    applyParser.add_argument("--plan", help="Print the changes apply would make without making them.", action="store_true")
+    applyParser.add_argument("--reprovision", help="Run the playbook again once the changes are applied.", action="store_true")
+
+    commands.add_parser("destroy", parents=[common, challenges, client, metrics, recording, placing], help="Destroy the instances of the given challenges, their forward ports and ACLs.")
+
+    purgeParser = commands.add_parser("purge", parents=[common, target, metrics, recording], help="Completely remove the instances matching the given names (globs allowed) and/or --label, their forward ports and ACLs.")
+    purgeParser.add_argument("challengePath", metavar="name", type=str, nargs="*")
+    purgeParser.add_argument("--label", help="Only remove instances with this user config (KEY=VALUE, e.g. event=ctf2024 for user.event). Can be repeated.", action="append")
+    purgeParser.add_argument("--purge-all", dest='purgeAll', help="Remove every instance of --project.", action="store_true")
+    purgeParser.add_argument("--nic", help="Specify NIC (Network Interface Card). Default 'eth0'.", default="eth0", type=str)
+    purgeParser.add_argument("-j", "--jobs", help="Number of instances deleted concurrently. Default 4.", default=4, type=int)
+
+    commands.add_parser("cache", parents=[common, target], help="List the cached images of --remote (default 'local') and --project (default 'default').")
+
+    commands.add_parser("status", parents=[listening], help="Print what the daemon is doing.")
+
+    validateParser = commands.add_parser("validate", parents=[common, challenges], help="Check the files of the given challenges, and the challenges against each other, without deploying them.")
+    validateParser.add_argument("--online", help="Also check that the remotes, projects and copy sources exist, with one request per remote.", action="store_true")
+    validateParser.add_argument("--refresh", help="Validate every challenge again, even those which did not change since the last validate.", action="store_true")
+
+    reconcileParser = commands.add_parser("reconcile", parents=[common, challenges, target, recording], help="Check that what the ledger recorded (for the given challenges, default all) still exists in incus as recorded.")
+    reconcileParser.add_argument("--forget", help="Remove the missing resources from the ledger.", action="store_true")
+
+    daemonParser = commands.add_parser("daemon", parents=[common, listening, recording], help="Serve deploy, apply, destroy and status requests on --socket, up to --jobs challenges at a time. While it runs, deploy.py sends its deployments to it.")
+    daemonParser.add_argument("-j", "--jobs", help="Number of challenges deployed concurrently. Default 4.", default=4, type=int)
+
+    # A legacy flag given as the value of one of these options is not a command.
+    valueOptions = set([option for subparser in commands.choices.values() for action in subparser._actions if action.nargs != 0 for option in action.option_strings])
+    args = parser.parse_args(commandArguments(sys.argv[1:], valueOptions))
+
+    # Options of the other commands are set to their default so every function sees the same arguments.
+    for subparser in commands.choices.values():
+        for action in subparser._actions:
+            if(action.dest != "help" and not hasattr(args, action.dest)):
+                setattr(args, action.dest, action.default)
+
+    args.apply = args.command == "apply"
+
+    if(args.metrics or args.metricsPrometheus or args.trace):
+        atexit.register(tracer.export, args)
+
+    if(args.result):
+        atexit.register(results.write, args.result)
+
+    if(args.command == "status"):
+        status = daemonRequest(args, "status")
+        if(status is None):
+            print(f"No daemon is listening on: {args.socket}")
+            sys.exit(1)
+
+        sys.exit(status)
+
+    if(args.jobs < 1):
+        print("--jobs must be at least 1.")
+        sys.exit(1)
+
+    if(args.resume and args.force):
+        print("--resume and --force cannot be used together.")
+        sys.exit(1)
+
+    if(args.command == "cache"):
+        listImageCache(args)
+        sys.exit(0)
+
+    if(args.command == "purge"):
+        loadDependencies(args.command)
+        openLedger(args)
+
+        with tracer.span("purge"):
+            success = purgeInstances(args)
+
+        sys.exit(0 if success else 1)
+
+    if(args.command == "daemon"):
+        loadDependencies(args.command)
+        openLedger(args)
+        Daemon(args).serve()
+        sys.exit(0)
+
+    if(args.all):
+        challengePaths = listChallenges()
+    else:
+        challengePaths = []
+        for path in args.challengePath:
+            challengePath = findChallengePath(path)
+            if(not challengePath):
+                print(os.path.join(CHALLENGES_DIRECTORY, path))
+                print("challengePath must be the folder name of the challenge of the path to the challenge.")
+                print("")
+                print("Examples:")
+                print(f"\tpython3 {__file__} deploy test-challenge-deployment")
+                print(f"\tpython3 {__file__} deploy ./containers/test-challenge-deployment/")
+                print(f"\tpython3 {__file__} deploy --all --jobs 8")
+                sys.exit(1)
+
+            if(not challengePath in challengePaths):
+                challengePaths.append(challengePath)
+
+    if(args.command == "reconcile"):
+        loadDependencies(args.command)
+        openLedger(args)
+        sys.exit(0 if Reconciler(args).run(challengePaths) else 1)
+
+    if(len(challengePaths) == 0):
+        print("No challenge to deploy.")
+        sys.exit(1)
+
+    if(args.command == "validate"):
+        loadDependencies(args.command)
+        sys.exit(0 if validateChallenges(args, challengePaths) else 1)
+
+    if(args.poolFill):
+        if(args.pool < 1):
+            print("--pool-fill requires --pool.")
+            sys.exit(1)
+
+        loadDependencies(args.command)
+        sys.exit(0 if fillWarmPools(args, challengePaths) else 1)
+
+    # Spans and results of a deployment made by the daemon stay in the daemon, --metrics, --trace and --result need it done here.
+    if(not args.noDaemon and not (args.metrics or args.metricsPrometheus or args.trace or args.result)):
+        status = daemonRequest(args, args.command, challengePaths)
+        if(status is not None):
+            sys.exit(status)
+
+    loadDependencies(args.command)
+    openLedger(args)
+
+    if(args.command == "destroy"):
+        failed = []
+        for challengePath in challengePaths:
+            try:
+                destroyChallenge(args=args, challengePath=challengePath)
+            except SystemExit as error:
+                if(not error.code in [0, None]):
+                    failed.append(challengePath)
+
+        print(f"Incus: {session}")
+        sys.exit(1 if failed else 0)
+
+    if(len(challengePaths) == 1 and not args.all):
+        if(args.verbose):
+            print(f"[DEBUG] challengePath: {challengePaths[0]}")
+
+        deployChallenge(args=args, challengePath=challengePaths[0])
+        warmPool.wait()
+        print(f"Incus: {session}")
+    elif(not deployBatch(args=args, challengePaths=challengePaths)):
+        warmPool.wait()
+        print(f"Incus: {session}")
+        sys.exit(1)
+    else:
+        warmPool.wait()
+        print(f"Incus: {session}")
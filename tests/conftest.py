@@ -0,0 +1,61 @@
+import os
+import sys
+import argparse
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeincus
+
+fakeincus.install()
+
+import deploy
+
+NETWORK = "testnetwork"
+LISTEN_ADDRESS = "45.45.148.200"
+
+@pytest.fixture
+def backend(tmp_path):
+    # Every test gets an empty fake incus (remotes a and b besides local) and its own ledger.
+    backend = fakeincus.install(remotes=["local", "a", "b"])
+    project = backend.project()
+    project.networks._networks[NETWORK] = fakeincus.Network(project, NETWORK, "bridge", "", {"ipv4.address": "10.20.0.1/29", "ipv6.address": "none"})
+
+    deploy.session = deploy.Session()
+    deploy.tracer = deploy.Tracer()
+    deploy.ledger = deploy.Ledger()
+    deploy.addressManager = deploy.AddressManager()
+    deploy.portAllocator = deploy.PortAllocator()
+    deploy.scheduler = deploy.Scheduler()
+    deploy.imageCache = deploy.ImageCache()
+    deploy.warmPool = deploy.WarmPool()
+    deploy.results = deploy.Results()
+    deploy.configCache.clear()
+    deploy.EventMonitor.monitors.clear()
+
+    deploy.ledger.open(str(tmp_path / "ledger.sqlite"))
+
+    yield backend
+
+    deploy.ledger.connection.close()
+
+@pytest.fixture
+def args():
+    return argparse.Namespace(verbose=False, plan=False, uniquePorts=False, portRange="30000-30003", jobs=2, remote=None, project=None, forget=False, refresh=False, online=False)
+
+def options(**kwargs) -> argparse.Namespace:
+    # Defaults of deploy.py's deploy command, for the tests calling a challenge's deployment directly.
+    values = {"verbose": False, "force": False, "keepInstancesOnFailure": False, "resume": False, "apply": False, "plan": False, "reprovision": False, "test": False, "waitTimeout": 5, "all": False, "jobs": 2, "cache": False, "cacheMaxSize": None, "cacheList": False, "metrics": None, "metricsPrometheus": None, "trace": None, "pool": 0, "poolMaxAge": 86400, "placement": None, "placementRemotes": None, "portRange": "30000-30003", "uniquePorts": False, "result": None, "poolFill": False, "purge": False, "label": None, "purgeAll": False, "remote": None, "project": None, "nic": "eth0", "parallel": 2, "challengePath": []}
+    values.update(kwargs)
+    return argparse.Namespace(**values)
+
+def writeChallenge(directory, config: str, inventory: str="all:\n  hosts:\n    web:\n", challenge: str="- hosts: all\n  tasks: []\n") -> str:
+    os.makedirs(directory, exist_ok=True)
+
+    for fileName, content in [(deploy.CONFIGURATION_FILE_NAME, config), (deploy.INVENTORY_FILE_NAME, inventory), (deploy.CHALLENGE_FILE_NAME, challenge)]:
+        with open(os.path.join(directory, fileName), "w") as f:
+            f.write(content)
+
+    return str(directory)
@@ -0,0 +1,42 @@
+import deploy
+import fakeincus
+
+from conftest import NETWORK
+
+def acls(backend) -> deploy.ACLRegistry:
+    fake = backend.project()
+    for name in ["web-acl", "shared-acl", "network-acl"]:
+        fake.acls.create(name=name)
+
+    fake.instances.add(fakeincus.Instance(fake, "web", devices={"eth0": {"type": "nic", "network": NETWORK, "security.acls": "web-acl,shared-acl"}}))
+    fake.instances.add(fakeincus.Instance(fake, "web-1", devices={"eth0": {"type": "nic", "network": NETWORK, "security.acls": "shared-acl"}}))
+    fake.networks._networks[NETWORK]._config["security.acls"] = "network-acl"
+
+    return deploy.session.acls(deploy.session.project("local", "default"))
+
+def test_owned(backend):
+    # web does not own what web-1 uses, even though its name is a prefix of it.
+    registry = acls(backend)
+
+    assert registry.owned(["web"]) == ["web-acl"]
+    assert sorted(registry.owned(["web", "web-1"])) == ["shared-acl", "web-acl"]
+    assert registry.owned(["web-1"]) == []
+    assert backend.counts["query.GET"] == 1
+
+def test_release(backend):
+    # Only the ACLs nothing uses anymore are deleted, the index follows without listing them again.
+    registry = acls(backend)
+    fake = backend.project()
+    registry.load()
+    fake.instances.remove(fake.instances._instances["web"])
+
+    assert registry.release(["web-acl", "shared-acl"], ["web"]) == ["web-acl"]
+    assert sorted(fake.acls._acls) == ["network-acl", "shared-acl"]
+    assert registry.owned(["web-1"]) == ["shared-acl"]
+
+def test_attach(backend):
+    registry = acls(backend)
+    registry.attach(["network-acl"], instance="web-1")
+
+    assert registry.owned(["web-1"]) == []
+    assert registry.owned(["web"]) == ["web-acl"]
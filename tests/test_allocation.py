@@ -0,0 +1,113 @@
+import pytest
+
+import fakeincus
+import deploy
+
+from conftest import NETWORK, LISTEN_ADDRESS
+
+def forward(source="auto", destination=22, protocol="tcp"):
+    return deploy.Config.Network.Forward(source=source, destination=destination, protocol=protocol)
+
+def allocate(args, instance: str, destination: int=22, **kwargs) -> int:
+    project = deploy.session.project("local", "default")
+    return deploy.portAllocator.allocate(args, project, instance=instance, network=NETWORK, listenAddress=LISTEN_ADDRESS, forward=forward(destination=destination), portRange=args.portRange, **kwargs)
+
+def test_ports_in_order(backend, args):
+    assert [allocate(args, f"web-{i}") for i in range(3)] == [30000, 30001, 30002]
+    assert deploy.ledger.reservedBy("port", f"local {LISTEN_ADDRESS}", "tcp/30001") == "local/default/web-1"
+
+def test_ports_skip_existing_forwards(backend, args):
+    network = backend.project().networks._networks[NETWORK]
+    existing = network.forwards[LISTEN_ADDRESS] = fakeincus.NetworkForward(network, LISTEN_ADDRESS)
+    existing.ports = [{"listen_port": "30000-30001", "protocol": "tcp", "target_address": "10.20.0.2", "target_port": "22"}]
+
+    assert allocate(args, "web") == 30002
+
+def test_port_kept_on_redeploy(backend, args):
+    first = allocate(args, "web")
+    allocate(args, "db")
+
+    # A fresh allocator (another run) gives the instance its port back.
+    deploy.portAllocator = deploy.PortAllocator()
+    assert allocate(args, "web") == first
+
+    # Once released, the port goes to the next instance asking.
+    deploy.portAllocator.release("local", "default", "web")
+    assert allocate(args, "ctf") == first
+
+def test_plan_does_not_reserve(backend, args):
+    assert allocate(args, "web", reserve=False) == 30000
+    assert allocate(args, "db") == 30000
+
+def test_ports_exhausted(backend, args):
+    for i in range(4):
+        allocate(args, f"web-{i}")
+
+    with pytest.raises(Exception, match="No free listen port left in 30000-30003"):
+        allocate(args, "web-4")
+
+def test_unique_ports(backend, args):
+    args.uniquePorts = True
+    project = deploy.session.project("local", "default")
+
+    first = allocate(args, "web")
+    other = deploy.portAllocator.allocate(args, project, instance="db", network=NETWORK, listenAddress="45.45.148.201", forward=forward(), portRange=args.portRange)
+
+    assert first != other
+
+def test_manual_port_conflict(backend, args):
+    project = deploy.session.project("local", "default")
+    reserve = lambda instance: deploy.portAllocator.reserve(args, project, instance=instance, network=NETWORK, listenAddress=LISTEN_ADDRESS, forward=forward(source="8080-8081", destination="80-81"))
+
+    assert reserve("web") == []
+    assert reserve("db") == [f"{LISTEN_ADDRESS}:8080/tcp is reserved by local/default/web", f"{LISTEN_ADDRESS}:8081/tcp is reserved by local/default/web"]
+
+def test_allocate_ports_exits_on_conflict(backend, args, capsys):
+    config = lambda name: deploy.Config(name=name, remote="local", project="default", network={"name": NETWORK, "listen_address": LISTEN_ADDRESS, "forwards": [{"source": 8080, "destination": 80}]})
+
+    deploy.allocatePorts(args, deploy.Challenge("web", config=[config("web")]))
+
+    with pytest.raises(SystemExit):
+        deploy.allocatePorts(args, deploy.Challenge("db", config=[config("db")]))
+
+    assert f"Forward port conflict: {LISTEN_ADDRESS}:8080/tcp is reserved by local/default/web" in capsys.readouterr().out
+
+def address(args, instance: str) -> str:
+    project = deploy.session.project("local", "default")
+    return deploy.addressManager.allocate(args, project, instance=instance, network=deploy.session.network(project, NETWORK), family="ipv4")
+
+def test_addresses_skip_used(backend, args):
+    # 10.20.0.1 is the address of the network, .2 is leased to an instance and .3 is pinned on another.
+    project = backend.project()
+    leased = project.instances._instances["leased"] = fakeincus.Instance(project, "leased", devices={"eth0": {"type": "nic", "network": NETWORK}})
+    leased.address = "10.20.0.2"
+    project.instances._instances["pinned"] = fakeincus.Instance(project, "pinned", devices={"eth0": {"type": "nic", "network": NETWORK, "ipv4.address": "10.20.0.3"}})
+
+    assert [address(args, f"web-{i}") for i in range(3)] == ["10.20.0.4", "10.20.0.5", "10.20.0.6"]
+
+def test_address_kept_and_exhausted(backend, args):
+    first = address(args, "web")
+    for i in range(4):
+        address(args, f"db-{i}")
+
+    deploy.addressManager = deploy.AddressManager()
+    assert address(args, "web") == first
+
+    with pytest.raises(Exception, match="No free ipv4 address left in 10.20.0.0/29"):
+        address(args, "ctf")
+
+    deploy.addressManager.release("local", "default", "web")
+    assert address(args, "ctf") == first
+
+def test_address_conflict(backend, args):
+    project = deploy.session.project("local", "default")
+    network = deploy.session.network(project, NETWORK)
+    config = lambda name: deploy.Config(name=name, remote="local", project="default", network={"name": NETWORK, "ipv4": "10.20.0.5"})
+
+    assert deploy.staticAddresses(project, args, conf=config("web"), network=network) == {"ipv4.address": "10.20.0.5"}
+
+    with pytest.raises(Exception, match="Address conflict: 10.20.0.5 is reserved by local/default/web"):
+        deploy.staticAddresses(project, args, conf=config("db"), network=network)
+
+    # A static address is not handed out to another instance.
+    assert address(args, "ctf") != "10.20.0.5"
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+import deploy
+import fakeincus
+
+from conftest import NETWORK, options, writeChallenge
+
+def config(ansible: str="") -> str:
+    return "config:\n" + "".join(f"""
+  - name: web-{index}
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+    network:
+      name: {NETWORK}
+""" for index in [1, 2]) + ansible
+
+INVENTORY = "all:\n  hosts:\n    web-1:\n    web-2:\n"
+
+def files(directory: str) -> dict:
+    contents = {}
+    for root, directories, names in os.walk(directory):
+        contents.update({os.path.relpath(os.path.join(root, name), directory): None for name in directories})
+
+        for name in names:
+            with open(os.path.join(root, name), "rb") as f:
+                contents[os.path.relpath(os.path.join(root, name), directory)] = f.read()
+
+    return contents
+
+def test_challenge_unchanged(backend, tmp_path):
+    # Artifacts, facts and the environment of the runner are kept out of the challenge directory.
+    path = writeChallenge(tmp_path / "web", config(), inventory=INVENTORY)
+    before = files(path)
+
+    deploy.deployChallenge(options(), path)
+
+    assert len(backend.runs) == 1
+    assert files(path) == before
+
+@pytest.mark.parametrize("ansible, handled", [("", []), ("ansible:\n  abort_on_failure: false\n", ["Install", "Configure"])])
+def test_abort(backend, tmp_path, monkeypatch, capsys, ansible, handled):
+    # The run is canceled at the first failure, unless abort_on_failure is false.
+    def run(**kwargs):
+        backend.runs.append(kwargs)
+        events = [{"event": "runner_on_failed", "event_data": {"task": "Install", "host": "web-1", "res": {"msg": "failed"}}}]
+        events += [{"event": "runner_on_ok", "event_data": {"task": task, "host": "web-2"}} for task in ["Install", "Configure"]]
+        return fakeincus.streamEvents(kwargs, events, rc=2)
+
+    monkeypatch.setattr(deploy.ansible_runner.load(), "run", run)
+    path = writeChallenge(tmp_path / "web", config(ansible), inventory=INVENTORY)
+
+    with pytest.raises(SystemExit):
+        deploy.deployChallenge(options(), path)
+
+    out = capsys.readouterr().out
+    assert [task for index, task in enumerate(["Install", "Configure"]) if f"web-2 [{index + 1}] ok: {task}" in out] == handled
+    assert ("task failed, the playbook is aborted: Install" in out) == (ansible == "")
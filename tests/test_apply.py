@@ -0,0 +1,75 @@
+import pytest
+
+import deploy
+
+from conftest import NETWORK, LISTEN_ADDRESS, options, writeChallenge
+
+def config(launch: str="", network: str="") -> str:
+    return f"""
+config:
+  - name: web
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+      config: {{{launch}}}
+    network:
+      name: {NETWORK}
+      listen_address: {LISTEN_ADDRESS}
+      forwards:
+        - {{source: 30000, destination: 80}}
+{network}"""
+
+@pytest.fixture
+def deployed(backend, tmp_path):
+    path = writeChallenge(tmp_path / "web", config())
+    deploy.deployChallenge(options(), path)
+    backend.reset()
+
+    return path
+
+def applyConfig(path: str, content: str, **kwargs):
+    writeChallenge(path, content)
+    deploy.configCache.clear()
+    deploy.session.forget()
+    deploy.deployChallenge(options(apply=True, **kwargs), path)
+
+def forwarded(backend) -> list:
+    return [port["target_address"] for port in backend.project().networks._networks[NETWORK].forwards[LISTEN_ADDRESS].ports]
+
+@pytest.mark.parametrize("launch, restart", [
+    ("limits.memory: 1GiB", False),
+    ("security.privileged: 'true'", True),
+    ("boot.autostart: 'true'", True),
+])
+def test_config(backend, deployed, launch, restart):
+    applyConfig(deployed, config(launch=launch))
+
+    key, value = [part.strip(" '") for part in launch.split(":")]
+    assert backend.project().instances._instances["web"]._config[key] == value
+    assert backend.counts.get("instance.restart", 0) == (1 if restart else 0)
+
+def test_pin_lease(backend, deployed):
+    # Pinning the address the instance already has does not restart it.
+    address = backend.project().instances._instances["web"].address
+    applyConfig(deployed, config(network="      static_ip: true"))
+
+    assert backend.project().instances._instances["web"]._devices["eth0"]["ipv4.address"] == address
+    assert not "instance.restart" in backend.counts
+    assert forwarded(backend) == [address]
+
+def test_new_address(backend, deployed):
+    # A new address restarts the instance and the forwards follow it.
+    applyConfig(deployed, config(network="      ipv4: 10.20.0.6"))
+
+    assert backend.counts["instance.restart"] == 1
+    assert backend.project().instances._instances["web"].address == "10.20.0.6"
+    assert forwarded(backend) == ["10.20.0.6"]
+
+def test_plan(backend, deployed, capsys):
+    # --plan prints what would change and writes nothing.
+    applyConfig(deployed, config(launch="security.privileged: 'true'"), plan=True)
+
+    assert "~ config security.privileged: None -> true" in capsys.readouterr().out
+    assert not "security.privileged" in backend.project().instances._instances["web"]._config
+    assert not "instance.restart" in backend.counts
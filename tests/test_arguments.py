@@ -0,0 +1,23 @@
+import pytest
+
+import deploy
+
+VALUE_OPTIONS = {"--ledger", "--remote", "-j", "--jobs"}
+
+@pytest.mark.parametrize("argv, expected", [
+    (["ch"], ["deploy", "ch"]),
+    (["deploy", "ch", "--apply"], ["deploy", "ch", "--apply"]),
+    (["ch", "-a", "-v"], ["apply", "ch", "-v"]),
+    (["ch", "--destroy"], ["destroy", "ch"]),
+    (["--purge", "--remote", "a", "web-*"], ["purge", "--remote", "a", "web-*"]),
+    (["ch", "--plan"], ["apply", "ch", "--plan"]),
+    # The value of an option is not a flag, even when it looks like one.
+    (["ch", "--ledger", "--destroy"], ["deploy", "ch", "--ledger", "--destroy"]),
+    (["ch", "--ledger", "-a", "--destroy"], ["destroy", "ch", "--ledger", "-a"]),
+    (["ch", "-j", "--plan"], ["deploy", "ch", "-j", "--plan"]),
+    # Nothing after `--` is an option.
+    (["--", "--purge"], ["deploy", "--", "--purge"]),
+    (["ch", "-d"], ["deploy", "ch", "-d"]),
+])
+def test_legacy_flags(argv, expected):
+    assert deploy.commandArguments(argv, VALUE_OPTIONS) == expected
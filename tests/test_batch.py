@@ -0,0 +1,49 @@
+import sys
+import time
+import threading
+
+import deploy
+
+def test_batch(args, capsys, monkeypatch):
+    # At most --jobs challenges run at a time, a failing one does not stop the others and is in the summary.
+    monkeypatch.setattr(sys, "stdout", sys.stdout)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def deployChallenge(args, challengePath: str):
+        with lock:
+            running.append(challengePath)
+            peak.append(len(running))
+
+        try:
+            time.sleep(0.05)
+            print(f"deploying {challengePath}")
+
+            if(challengePath == "exits"):
+                sys.exit(2)
+            elif(challengePath == "raises"):
+                raise Exception("Network 'web' already exists.")
+        finally:
+            with lock:
+                running.remove(challengePath)
+
+    monkeypatch.setattr(deploy, "deployChallenge", deployChallenge)
+    challengePaths = ["web", "exits", "db", "raises", "pwn"]
+
+    assert not deploy.deployBatch(args, challengePaths)
+    assert max(peak) == args.jobs
+
+    output = capsys.readouterr().out
+    assert "[web] deploying web\n" in output
+    assert "\tFAILED exits (" in output and "): Exited with status 2" in output
+    assert "): Exception: Network 'web' already exists." in output
+    assert "3/5 challenge(s) deployed." in output
+    assert [line.split()[1] for line in output.splitlines() if line.startswith("\tOK") or line.startswith("\tFAILED")] == challengePaths
+
+def test_batch_ok(args, capsys, monkeypatch):
+    monkeypatch.setattr(sys, "stdout", sys.stdout)
+    monkeypatch.setattr(deploy, "deployChallenge", lambda args, challengePath: None)
+
+    assert deploy.deployBatch(args, ["web", "db"])
+    assert "2/2 challenge(s) deployed." in capsys.readouterr().out
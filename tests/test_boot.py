@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import deploy
+
+def launch(backend, **kwargs):
+    backend.project().instances.launch("ubuntu/22.04", "web", **kwargs)
+    project = deploy.session.project("local", "default")
+    return (project, deploy.session.instance(project, "web"))
+
+def test_agent(backend):
+    # The agent is ready once incus reports the processes of the instance, well before a fixed sleep would end.
+    backend.bootDelay = 0.3
+    project, instance = launch(backend, vm=True)
+    start = time.monotonic()
+
+    deploy.waitForBoot(project, instance=instance, timeout=5)
+
+    assert 0.3 <= time.monotonic() - start < 1.5
+    assert not "instance.exec" in backend.counts
+
+def test_command(backend):
+    # The readiness command is retried until it succeeds.
+    backend.bootDelay = 0.3
+    project, instance = launch(backend)
+
+    deploy.waitForBoot(project, instance=instance, command="systemctl is-system-running", timeout=5)
+
+    assert backend.counts["instance.exec"] >= 1
+
+def test_stopped(backend):
+    project, instance = launch(backend)
+    backend.project().instances._instances["web"].stop()
+
+    deploy.waitForBoot(project, instance=instance, timeout=5)
+
+    assert backend.counts["instance.start"] == 1
+
+def test_timeout(backend):
+    backend.bootDelay = 10
+    project, instance = launch(backend)
+
+    with pytest.raises(TimeoutError, match="agent of web"):
+        deploy.waitForBoot(project, instance=instance, timeout=0.5)
@@ -0,0 +1,42 @@
+import deploy
+
+from conftest import NETWORK, options, writeChallenge
+
+CONFIG = f"""
+config:
+  - name: web
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+    network:
+      name: {NETWORK}
+"""
+
+def test_second_deploy(backend, tmp_path):
+    # The second deployment of an unchanged challenge launches from the image published by the first one and
+    # does not run the playbook.
+    path = writeChallenge(tmp_path / "web", CONFIG)
+
+    deploy.deployChallenge(options(cache=True), path)
+    assert len(backend.runs) == 1
+
+    backend.reset()
+    deploy.session.forget()
+    deploy.deployChallenge(options(cache=True, force=True), path)
+
+    assert backend.runs == []
+    assert not "publish" in backend.counts
+    assert backend.project().instances._instances["web"].image.startswith(deploy.IMAGE_CACHE_PREFIX)
+
+def test_changed_challenge(backend, tmp_path):
+    # Any file of the challenge but config.yml changes the key, the playbook runs again.
+    path = writeChallenge(tmp_path / "web", CONFIG)
+    deploy.deployChallenge(options(cache=True), path)
+
+    writeChallenge(path, CONFIG, challenge="- hosts: all\n  tasks:\n    - debug: {msg: changed}\n")
+    backend.reset()
+    deploy.session.forget()
+    deploy.deployChallenge(options(cache=True, force=True), path)
+
+    assert len(backend.runs) == 1
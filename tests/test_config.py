@@ -0,0 +1,27 @@
+import deploy
+
+from conftest import writeChallenge
+
+CONFIG = """
+config:
+  name: web
+  remote: local
+  project: default
+  network:
+    name: testnetwork
+    listen_address: 45.45.148.200
+    forwards:
+      - {source: 8080, destination: 80}
+"""
+
+def test_load_config_copies(tmp_path, args):
+    # A daemon hands the cached challenge to concurrent requests, each must get its own objects.
+    challengePath = writeChallenge(tmp_path / "web", CONFIG)
+
+    first = deploy.loadConfig(args, challengePath)
+    first.config[0].network.forwards[0].source = 9090
+    first.config[0].remote = "other"
+
+    second = deploy.loadConfig(args, challengePath)
+    assert second is not first
+    assert (second.config[0].remote, second.config[0].network.forwards[0].source) == ("local", 8080)
@@ -0,0 +1,62 @@
+import os
+import socketserver
+import threading
+
+import pytest
+
+import deploy
+
+from conftest import options, writeChallenge
+
+@pytest.fixture
+def daemon(backend, tmp_path, monkeypatch):
+    # A daemon serving on a socket of the test, without the signal handler and the output of serve().
+    args = options(jobs=2, socket=str(tmp_path / "daemon.sock"))
+    daemon = deploy.Daemon(args)
+    threads = []
+    running = {"current": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def deployChallenge(args, challengePath):
+        with lock:
+            threads.append(threading.get_ident())
+            running["current"] += 1
+            running["peak"] = max(running["peak"], running["current"])
+
+        try:
+            print(f"Deploying {os.path.basename(challengePath)}")
+        finally:
+            with lock:
+                running["current"] -= 1
+
+    monkeypatch.setitem(deploy.Daemon.commands, "deploy", deployChallenge)
+    monkeypatch.setattr(deploy.sys, "stdout", deploy.PrefixedOutput(deploy.sys.stdout))
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            daemon.handle(self.rfile, self.connection)
+
+    server = socketserver.ThreadingUnixStreamServer(args.socket, Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield (args, threads, running)
+
+    server.shutdown()
+    server.server_close()
+
+def test_request(daemon, tmp_path, capsys):
+    # Challenges of a request run on no more than --jobs workers, the client says it sent them to the daemon.
+    args, threads, running = daemon
+    paths = [writeChallenge(tmp_path / f"web-{index}", "config: []\n") for index in range(5)]
+
+    assert deploy.daemonRequest(args, "deploy", paths) == 0
+
+    out = capsys.readouterr().out
+    assert f"Sent to the daemon listening on {args.socket}" in out
+    assert "OK     " in out and out.count("Deploying web-") == 5
+    assert len(set(threads)) <= 2 and running["peak"] <= 2
+
+def test_no_daemon(tmp_path, capsys):
+    assert deploy.daemonRequest(options(socket=str(tmp_path / "missing.sock")), "deploy", ["web"]) is None
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,52 @@
+import pytest
+
+import deploy
+import fakeincus
+
+from conftest import NETWORK, LISTEN_ADDRESS, options, writeChallenge
+
+def config(network: str="", restart: str="") -> str:
+    return f"""
+config:
+  - name: web
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+    network:
+      name: {NETWORK}
+      listen_address: {LISTEN_ADDRESS}
+      forwards:
+        - {{source: 30000, destination: 80}}
+{network}
+{restart}"""
+
+def instance(backend) -> fakeincus.Instance:
+    return backend.project().instances._instances["web"]
+
+@pytest.mark.parametrize("network", ["      ipv4: 10.20.0.5", "      static_ip: true"])
+def test_static_address(backend, tmp_path, network):
+    # The address given is set before the first boot, static_ip pins the lease of the running instance.
+    deploy.deployChallenge(options(), writeChallenge(tmp_path / "web", config(network=network)))
+
+    address = instance(backend).address
+    assert instance(backend)._devices["eth0"]["ipv4.address"] == address
+    assert address == "10.20.0.5" or not "ipv4" in network
+    assert not "instance.restart" in backend.counts
+    assert [port["target_address"] for port in backend.project().networks._networks[NETWORK].forwards[LISTEN_ADDRESS].ports] == [address]
+
+def test_restart(backend, tmp_path):
+    deploy.deployChallenge(options(), writeChallenge(tmp_path / "web", config(restart="    restart: true")))
+
+    assert backend.counts["instance.restart"] == 1
+
+def test_restart_fact(backend, tmp_path, monkeypatch):
+    # The playbook asks for a restart with the incus_restart fact.
+    def run(**kwargs):
+        backend.runs.append(kwargs)
+        return fakeincus.streamEvents(kwargs, [{"event": "runner_on_ok", "event_data": {"task": "Restart", "host": "web", "res": {"ansible_facts": {"incus_restart": True}}}}])
+
+    monkeypatch.setattr(deploy.ansible_runner.load(), "run", run)
+    deploy.deployChallenge(options(), writeChallenge(tmp_path / "web", config()))
+
+    assert backend.counts["instance.restart"] == 1
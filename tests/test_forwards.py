@@ -0,0 +1,68 @@
+import pytest
+
+import deploy
+import fakeincus
+
+from conftest import NETWORK, LISTEN_ADDRESS
+
+def port(listenPort: int, target: str) -> dict:
+    return {"protocol": "tcp", "listen_port": str(listenPort), "target_address": target, "target_port": "80"}
+
+def forward(source: int) -> deploy.Config.Network.Forward:
+    return deploy.Config.Network.Forward(source=source, destination=80, protocol="tcp")
+
+@pytest.fixture
+def manager(backend):
+    network = backend.project().networks._networks[NETWORK]
+    network.forwards[LISTEN_ADDRESS] = fakeincus.NetworkForward(network, LISTEN_ADDRESS)
+    network.forwards[LISTEN_ADDRESS].ports = [port(30000, "10.20.0.2")]
+
+    return deploy.session.forwards(deploy.session.project("local", "default"), NETWORK)
+
+def test_concurrent_write(backend, manager, monkeypatch):
+    # Another run writes the forward between the read and the write of this one, with the ports it read before
+    # this one's were added. They are merged and written again instead of being lost.
+    fake = backend.project().networks._networks[NETWORK].forwards[LISTEN_ADDRESS]
+    query = deploy.incusQuery
+    writes = []
+
+    def concurrent(remote, path, **kwargs):
+        result = query(remote, path, **kwargs)
+
+        if(kwargs.get("method") == "PATCH" and not writes):
+            writes.append(path)
+            fake.ports = [port(30000, "10.20.0.2"), port(30002, "10.20.0.4")]
+
+        return result
+
+    monkeypatch.setattr(deploy, "incusQuery", concurrent)
+    manager.add(LISTEN_ADDRESS, [forward(30001)], targetAddress="10.20.0.3")
+
+    assert manager.commit() == 1
+    assert sorted(port["listen_port"] for port in fake.ports) == ["30000", "30001", "30002"]
+    assert backend.counts["query.PATCH"] == 2
+
+def test_conflict(backend, manager):
+    manager.add(LISTEN_ADDRESS, [forward(30001)], targetAddress="10.20.0.3")
+    backend.project().networks._networks[NETWORK].forwards[LISTEN_ADDRESS].ports.append(port(30001, "10.20.0.4"))
+
+    with pytest.raises(Exception, match="already forwarded to 10.20.0.4"):
+        manager.commit()
+
+def test_created_concurrently(backend, manager, monkeypatch):
+    # The forward did not exist when it was read, someone else created it before this one.
+    network = backend.project().networks._networks[NETWORK]
+    query = deploy.incusQuery
+
+    def concurrent(remote, path, **kwargs):
+        if(kwargs.get("method") == "POST" and not "45.45.148.201" in network.forwards):
+            network.forwards["45.45.148.201"] = fakeincus.NetworkForward(network, "45.45.148.201")
+            network.forwards["45.45.148.201"].ports = [port(30002, "10.20.0.4")]
+
+        return query(remote, path, **kwargs)
+
+    monkeypatch.setattr(deploy, "incusQuery", concurrent)
+    manager.add("45.45.148.201", [forward(30001)], targetAddress="10.20.0.3")
+
+    assert manager.commit() == 1
+    assert sorted(port["listen_port"] for port in network.forwards["45.45.148.201"].ports) == ["30001", "30002"]
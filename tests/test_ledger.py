@@ -0,0 +1,37 @@
+import deploy
+
+def test_reserve_conflict(backend):
+    assert deploy.ledger.reserve("port", "local 1.2.3.4", "tcp/30000", "local", "default", "web", "tcp/80")
+    # The owner reserving again keeps it, another instance does not get it.
+    assert deploy.ledger.reserve("port", "local 1.2.3.4", "tcp/30000", "local", "default", "web", "tcp/80")
+    assert not deploy.ledger.reserve("port", "local 1.2.3.4", "tcp/30000", "local", "default", "db", "tcp/80")
+    assert deploy.ledger.reservedBy("port", "local 1.2.3.4", "tcp/30000") == "local/default/web"
+
+def test_release(backend):
+    deploy.ledger.reserve("port", "local 1.2.3.4", "tcp/30000", "local", "default", "web", "tcp/80")
+    deploy.ledger.reserve("port", "local 1.2.3.4", "tcp/30001", "local", "default", "web", "tcp/22")
+
+    assert deploy.ledger.releaseReservations("port", "local", "default", "web", keep=["tcp/22"]) == [("local 1.2.3.4", "tcp/30000")]
+    assert deploy.ledger.reserved("port", "local 1.2.3.4") == {"tcp/30001"}
+    assert deploy.ledger.reservation("port", "local 1.2.3.4", "local", "default", "web", "tcp/80")[1] is not None
+
+    # A released value can be reserved by another instance.
+    assert deploy.ledger.reserve("port", "local 1.2.3.4", "tcp/30000", "local", "default", "db", "tcp/80")
+    assert deploy.ledger.reservedBy("port", "local 1.2.3.4", "tcp/30000") == "local/default/db"
+
+def test_record_find_forget(backend):
+    deploy.ledger.record("instance", "local", "default", "web", data={"image": "ubuntu/22.04"})
+    deploy.ledger.record("instance", "local", "default", "web", data={"image": "debian/12"})
+
+    assert len(deploy.ledger.resources("instance")) == 1
+    assert deploy.ledger.find("instance", "local", "default", "web")["data"] == {"image": "debian/12"}
+
+    deploy.ledger.forget("instance", "local", "default", "web")
+    assert deploy.ledger.find("instance", "local", "default", "web") is None
+
+def test_closed_ledger_records_nothing():
+    ledger = deploy.Ledger()
+
+    assert ledger.reserve("port", "*", "tcp/30000", "local", "default", "web", "tcp/80")
+    assert ledger.reserved("port", "*") == set()
+    assert ledger.find("instance", "local", "default", "web") is None
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+import deploy
+
+from conftest import options, writeChallenge
+
+def instances(count: int) -> str:
+    return "config:\n" + "".join(f"""
+  - name: web-{index}
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+    network:
+      name: testnetwork
+""" for index in range(1, count + 1))
+
+def inventory(count: int) -> str:
+    return "all:\n  hosts:\n" + "".join(f"    web-{index}:\n" for index in range(1, count + 1))
+
+@pytest.fixture
+def launches(monkeypatch):
+    # Instances being launched at the same time, the peak is kept.
+    lock = threading.Lock()
+    launches = {"current": 0, "peak": 0}
+    launch = deploy.deploy
+
+    def tracked(**kwargs):
+        with lock:
+            launches["current"] += 1
+            launches["peak"] = max(launches["peak"], launches["current"])
+
+        try:
+            return launch(**kwargs)
+        finally:
+            with lock:
+                launches["current"] -= 1
+
+    monkeypatch.setattr(deploy, "deploy", tracked)
+    return launches
+
+@pytest.mark.parametrize("parallel", [1, 2])
+def test_shared_playbook(backend, tmp_path, launches, parallel):
+    # Fewer workers than instances, the shared playbook still runs once for all of them.
+    path = writeChallenge(tmp_path / "web", instances(4), inventory=inventory(4))
+    backend.latency = 0.01
+
+    deploy.deployChallenge(options(parallel=parallel), path)
+
+    assert launches["peak"] == parallel
+    assert len(backend.runs) == 1 and backend.runs[0]["limit"] is None
+    assert sorted(backend.project().instances._instances) == ["web-1", "web-2", "web-3", "web-4"]
+
+def test_abort(backend, tmp_path, monkeypatch, capsys):
+    # An instance failing before the playbook aborts the others, nothing is provisioned and the launched
+    # instances are removed.
+    path = writeChallenge(tmp_path / "web", instances(3), inventory=inventory(3))
+    launch = deploy.deploy
+
+    def failing(**kwargs):
+        if(kwargs["name"] == "web-2"):
+            raise Exception("Launch failed.")
+
+        return launch(**kwargs)
+
+    monkeypatch.setattr(deploy, "deploy", failing)
+
+    with pytest.raises(SystemExit):
+        deploy.deployChallenge(options(parallel=1), path)
+
+    out = capsys.readouterr().out
+    assert "Instance failed: web-2" in out and "Instance was interrupted: web-3" in out
+    assert backend.runs == []
+    assert backend.project().instances._instances == {}
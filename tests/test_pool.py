@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import deploy
+import fakeincus
+
+from conftest import NETWORK, options, writeChallenge
+
+PROFILE = {"nameSource": "ubuntu/22.04", "remoteSource": "images", "projectSource": None, "isVM": False, "isClone": False}
+
+def pooled(backend) -> list:
+    return sorted(name for name in backend.project().instances._instances if name.startswith(deploy.POOL_PREFIX))
+
+def fill(backend, count: int, **kwargs) -> tuple:
+    project = deploy.session.project("local", "default")
+    deploy.warmPool.fill(project, options(pool=count, **kwargs), **PROFILE)
+    backend.reset()
+
+    return (project, deploy.warmPool.key(project, **PROFILE))
+
+def test_claim(backend):
+    # The oldest pooled instance is claimed first, the pool is listed once for every claim of the run.
+    project = deploy.session.project("local", "default")
+    key = deploy.warmPool.key(project, **PROFILE)
+    fake = backend.project()
+    for name, age in [("ctf-pool-newer", 5), ("ctf-pool-older", 10)]:
+        fake.instances.add(fakeincus.Instance(fake, name, config={deploy.POOL_CONFIG: key, f"{deploy.POOL_CONFIG}.created": str(int(time.time()) - age)}))
+
+    args = options(pool=2)
+    first = deploy.warmPool.claim(project, args, name="web-1", key=key)
+
+    assert pooled(backend) == ["ctf-pool-newer"]
+    assert first.name == "web-1" and first._status == "Running" and not deploy.POOL_CONFIG in first._config
+    assert deploy.warmPool.claim(project, args, name="web-2", key=key).name == "web-2"
+    assert deploy.warmPool.claim(project, args, name="web-3", key=key) is None
+    assert backend.counts["query.GET"] == 1
+
+def test_claimed_by_another_run(backend):
+    # An instance another run claimed since the pool was indexed is skipped.
+    project, key = fill(backend, 2)
+    taken = pooled(backend)
+    backend.project().instances._instances.pop(taken[0])
+
+    instance = deploy.warmPool.claim(project, options(pool=2), name="web", key=key)
+
+    assert instance.name == "web"
+    assert pooled(backend) == []
+
+def test_stale(backend):
+    # Stale instances are never claimed, the refill replaces them.
+    project, key = fill(backend, 1)
+    args = options(pool=1, poolMaxAge=-1)
+
+    assert deploy.warmPool.claim(project, args, name="web", key=key) is None
+
+    stale = pooled(backend)
+    deploy.warmPool.fill(project, args, **PROFILE)
+
+    assert len(pooled(backend)) == 1 and pooled(backend) != stale
+
+def test_refill_once(backend):
+    # Deployments claiming from the same pool queue a single refill until it starts.
+    project = deploy.session.project("local", "default")
+    started = threading.Event()
+    release = threading.Event()
+    deploy.warmPool.executor = ThreadPoolExecutor(max_workers=1)
+    deploy.warmPool.executor.submit(lambda: started.set() or release.wait(5))
+    started.wait(5)
+
+    for _ in range(3):
+        deploy.warmPool.refill(project, options(pool=2), **PROFILE)
+
+    release.set()
+
+    assert len(deploy.warmPool.futures) == 1
+    assert deploy.warmPool.wait()
+    assert len(pooled(backend)) == 2
+
+def test_deploy(backend, tmp_path):
+    # Every instance of the challenge is claimed from the pool and the pool is refilled.
+    fill(backend, 3)
+    path = writeChallenge(tmp_path / "web", "config:\n" + "".join(f"""
+  - name: web-{index}
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+    network:
+      name: {NETWORK}
+""" for index in range(1, 4)), inventory="all:\n  hosts:\n" + "".join(f"    web-{index}:\n" for index in range(1, 4)))
+
+    deploy.deployChallenge(options(pool=3), path)
+    assert deploy.warmPool.wait()
+
+    assert sorted(name for name in backend.project().instances._instances if not name.startswith(deploy.POOL_PREFIX)) == ["web-1", "web-2", "web-3"]
+    assert backend.counts["instances.launch"] == 3
+    assert len(pooled(backend)) == 3
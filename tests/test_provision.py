@@ -0,0 +1,42 @@
+import os
+
+import deploy
+import fakeincus
+
+from conftest import options, writeChallenge
+
+def test_environment(tmp_path, monkeypatch):
+    # Facts are cached per challenge, those of the hosts launched again are dropped.
+    monkeypatch.setattr(deploy, "FACT_CACHE_DIRECTORY", str(tmp_path / "facts"))
+    path = writeChallenge(tmp_path / "web", "config: []\n")
+
+    envvars = deploy.ansibleEnvironment(path, deploy.Challenge.Ansible())
+    directory = envvars["ANSIBLE_CACHE_PLUGIN_CONNECTION"]
+    for host in ["web-1", "web-2"]:
+        open(os.path.join(directory, host), "w").close()
+
+    assert (envvars["ANSIBLE_PIPELINING"], envvars["ANSIBLE_GATHERING"], envvars["ANSIBLE_CACHE_PLUGIN"]) == ("True", "smart", "jsonfile")
+    assert deploy.ansibleEnvironment(path, deploy.Challenge.Ansible(), forget=["web-1"])["ANSIBLE_CACHE_PLUGIN_CONNECTION"] == directory
+    assert os.listdir(directory) == ["web-2"]
+
+def test_options(tmp_path, monkeypatch):
+    monkeypatch.setattr(deploy, "FACT_CACHE_DIRECTORY", str(tmp_path / "facts"))
+    envvars = deploy.ansibleEnvironment(str(tmp_path), deploy.Challenge.Ansible(pipelining=False, fact_cache=False, gather_facts=False, env={"ANSIBLE_TIMEOUT": 30}))
+
+    assert envvars == {"ANSIBLE_PIPELINING": "False", "ANSIBLE_GATHERING": "explicit", "ANSIBLE_TIMEOUT": "30"}
+
+def test_task_timings(backend, tmp_path, monkeypatch, capsys):
+    # Every host is provisioned by one run with a fork per host, the slowest tasks are printed first.
+    def run(**kwargs):
+        backend.runs.append(kwargs)
+        events = [{"event": "runner_on_ok", "event_data": {"task": task, "host": host, "duration": duration}} for task, duration in [("Install", 1.5), ("Configure", 4.0)] for host in ["web-1", "web-2", "web-3"]]
+        return fakeincus.streamEvents(kwargs, events)
+
+    monkeypatch.setattr(deploy, "FACT_CACHE_DIRECTORY", str(tmp_path / "facts"))
+    monkeypatch.setattr(deploy.ansible_runner.load(), "run", run)
+
+    assert deploy.provision(options(), writeChallenge(tmp_path / "web", "config: []\n"), hosts=3)
+    assert backend.runs[0]["forks"] == 3
+
+    out = capsys.readouterr().out
+    assert out.index("4.0s Configure (3 host(s))") < out.index("1.5s Install (3 host(s))")
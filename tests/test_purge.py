@@ -0,0 +1,53 @@
+import argparse
+
+import pytest
+
+import deploy
+import fakeincus
+
+from conftest import NETWORK, LISTEN_ADDRESS
+
+def purgeArgs(names: list=[], **kwargs) -> argparse.Namespace:
+    return argparse.Namespace(**{"verbose": False, "force": False, "remote": "local", "project": "default", "challengePath": names, "label": None, "purgeAll": False, "nic": "eth0", "jobs": 2, **kwargs})
+
+@pytest.mark.parametrize("names, labels, selected", [
+    (["web-*"], None, ["web-1", "web-2"]),
+    (["web-1", "db"], None, ["web-1", "db"]),
+    ([], ["event=ctf"], ["web-1", "db"]),
+    (["web-*"], ["event=ctf", "user.team=red"], ["web-1"]),
+    (["web"], None, []),
+])
+def test_select(names, labels, selected):
+    instances = [{"name": "web-1", "config": {"user.event": "ctf", "user.team": "red"}}, {"name": "web-2", "config": {}}, {"name": "db", "config": {"user.event": "ctf"}}]
+
+    assert [instance["name"] for instance in deploy.selectInstances(purgeArgs(names, label=labels), instances)] == selected
+
+def test_purge(backend, capsys):
+    # The matching instances are removed with their forward ports and the ACLs only they used, nothing else is.
+    fake = backend.project()
+    network = fake.networks._networks[NETWORK]
+    fake.acls.create(name="web-acl")
+    fake.acls.create(name="shared-acl")
+
+    for name, acls in [("web-1", "web-acl,shared-acl"), ("web-2", "web-acl"), ("db", "shared-acl")]:
+        fake.instances.launch("ubuntu/22.04", name, network=NETWORK)
+        fake.instances._instances[name]._devices["eth0"]["security.acls"] = acls
+
+    forward = network.forwards[LISTEN_ADDRESS] = fakeincus.NetworkForward(network, LISTEN_ADDRESS)
+    forward.ports = [{"protocol": "tcp", "listen_port": str(30000 + index), "target_address": fake.instances._instances[name].currentState()["network"]["eth0"]["addresses"][0]["address"], "target_port": "80"} for index, name in enumerate(["web-1", "web-2", "db"])]
+    db = forward.ports[2]["target_address"]
+
+    assert deploy.purgeInstances(purgeArgs(["web-*"]))
+    assert "2/2 instance(s) purged." in capsys.readouterr().out
+    assert list(fake.instances._instances) == ["db"]
+    assert [port["target_address"] for port in forward.ports] == [db]
+    assert sorted(fake.acls._acls) == ["shared-acl"]
+    assert backend.counts["query.PATCH"] == 1
+
+def test_nothing(backend, capsys):
+    assert deploy.purgeInstances(purgeArgs(["web-*"]))
+    assert "No instance to purge." in capsys.readouterr().out
+
+def test_selection_required(backend):
+    with pytest.raises(SystemExit):
+        deploy.purgeInstances(purgeArgs())
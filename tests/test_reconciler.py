@@ -0,0 +1,24 @@
+import deploy
+
+def test_missing_resources(backend, args, capsys):
+    deploy.ledger.record("network", "local", "default", "incusbr0")
+    deploy.ledger.record("network", "local", "default", "gone")
+    deploy.ledger.record("instance", "local", "default", "web")
+
+    reconciler = deploy.Reconciler(args)
+    assert [reconciler.check(resource) for resource in deploy.ledger.resources()] == [None, "missing", "missing"]
+
+    args.forget = True
+    assert not deploy.Reconciler(args).run([])
+
+    output = capsys.readouterr().out
+    assert "MISSING   network  local:default gone" in output
+    assert "3 recorded resource(s) checked: 2 missing, 0 changed, 0 untracked instance(s)." in output
+    assert [resource["name"] for resource in deploy.ledger.resources()] == ["incusbr0"]
+
+def test_changed_address(backend, args):
+    project = backend.project()
+    project.instances._instances["web"] = deploy.pyincus.models.instances.Instance(project, "web", devices={"eth0": {"type": "nic", "network": "incusbr0", "ipv4.address": "10.1.0.9"}})
+    deploy.ledger.record("address", "local", "default", "10.1.0.8", instance="web", data={"nic": "eth0", "key": "ipv4.address"})
+
+    assert deploy.Reconciler(args).check(deploy.ledger.find("address", "local", "default", "10.1.0.8")) == "ipv4.address is 10.1.0.9"
@@ -0,0 +1,67 @@
+import sys
+
+import pytest
+
+import deploy
+
+from conftest import writeChallenge
+
+def conf(**kwargs) -> dict:
+    return {"name": "web", "remote": "local", "project": "default", "launch": {"image": {"remote": "images", "name": "ubuntu/22.04"}}, **kwargs}
+
+def test_templates():
+    replicas = deploy.expandReplicas(conf(replicas={"names": ["red", "blue"], "name": "team-{replica}"}, network={"name": "testnetwork", "ipv4": "10.20.1.{index}", "listen_address": "45.45.148.200", "forwards": [{"source": "300{index:02d}", "destination": 80}, {"source": "auto", "destination": 22}]}))
+
+    assert [replica.name for replica in replicas] == ["team-red", "team-blue"]
+    assert [replica.network.ipv4 for replica in replicas] == ["10.20.1.1", "10.20.1.2"]
+    assert [[forward.source for forward in replica.network.forwards] for replica in replicas] == [[30001, None], [30002, None]]
+    assert [(replica.host, replica.replicaOf, replica.replicaMethod) for replica in replicas] == [("web", None, "copy"), ("web", "team-red", "copy")]
+
+def test_count():
+    assert [replica.name for replica in deploy.expandReplicas(conf(replicas={"count": 3}))] == ["web-1", "web-2", "web-3"]
+    assert [replica.name for replica in deploy.expandReplicas(conf())] == ["web"]
+
+@pytest.mark.parametrize("replicas, error", [
+    ({}, "Replicas must have one of them: count or names"),
+    ({"count": 0}, "Replicas count must be a positive number."),
+    ({"names": ["red", "red"]}, "Replicas names must be a list of distinct names."),
+    ({"count": 2, "method": "clone"}, "Replicas method must be within these values"),
+    ({"count": 2, "name": "{team}"}, "Unknown replicas template field: 'team'"),
+])
+def test_errors(replicas, error):
+    with pytest.raises(Exception, match=error):
+        deploy.expandReplicas(conf(replicas=replicas or {"count": None}))
+
+def test_deploy(backend, tmp_path, monkeypatch, capsys):
+    # The first replica is provisioned once, the others are copies of it.
+    writeChallenge(tmp_path / "containers" / "web", """
+config:
+  - name: web
+    remote: local
+    project: default
+    launch:
+      image: {remote: images, name: ubuntu/22.04}
+    replicas:
+      count: 3
+    network:
+      name: testnetwork
+      listen_address: 45.45.148.200
+      forwards:
+        - {source: auto, destination: 22}
+""")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(sys, "argv", ["deploy.py", "deploy", "web", "--ledger", str(tmp_path / "deploy.sqlite")])
+
+    with open(deploy.__file__) as f:
+        code = compile(f.read(), deploy.__file__, "exec")
+
+    try:
+        exec(code, {"__name__": "__main__", "__file__": deploy.__file__})
+    except SystemExit as error:
+        assert error.code in [0, None], capsys.readouterr().out
+
+    assert len(backend.runs) == 1 and backend.runs[0]["suppress_env_files"]
+    assert (backend.counts["instances.launch"], backend.counts["instances.copy"]) == (1, 2)
+    assert sorted(backend.project().instances._instances) == ["web-1", "web-2", "web-3"]
+    assert len(set(port["listen_port"] for port in backend.project().networks._networks["testnetwork"].forwards["45.45.148.200"].ports)) == 3
@@ -0,0 +1,67 @@
+import pytest
+
+import deploy
+import fakeincus
+
+from conftest import NETWORK, options, writeChallenge
+
+CONFIG = "config:\n" + "".join(f"""
+  - name: web-{index}
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+    network:
+      name: {NETWORK}
+""" for index in [1, 2])
+
+INVENTORY = "all:\n  hosts:\n    web-1:\n    web-2:\n"
+
+@pytest.fixture
+def failed(backend, tmp_path, monkeypatch):
+    # A first run whose playbook fails at the same task on every host, the instances are kept.
+    def run(**kwargs):
+        backend.runs.append(kwargs)
+        events = [{"event": "runner_on_ok", "event_data": {"task": "Install", "host": host}} for host in ["web-1", "web-2"]]
+        events += [{"event": "runner_on_failed", "event_data": {"task": "Configure", "host": host, "res": {"msg": "failed"}}} for host in ["web-1", "web-2"]]
+        return fakeincus.streamEvents(kwargs, events, rc=2)
+
+    path = writeChallenge(tmp_path / "web", CONFIG, inventory=INVENTORY)
+    runner = deploy.ansible_runner.load()
+    monkeypatch.setattr(runner, "run", run)
+
+    with pytest.raises(SystemExit):
+        deploy.deployChallenge(options(keepInstancesOnFailure=True), path)
+
+    monkeypatch.setattr(runner, "run", fakeincus.ansibleRun)
+    backend.reset()
+    deploy.session.forget()
+
+    return path
+
+def test_checkpoints(backend, failed):
+    for name in ["web-1", "web-2"]:
+        checkpoints = deploy.ledger.checkpoints("local", "default", name)
+
+        assert checkpoints["launch"]["status"] == "done" and checkpoints["ip"]["status"] == "done"
+        assert checkpoints["provision"]["status"] == "failed" and checkpoints["provision"]["data"]["task"] == "Configure"
+        assert not "finalize" in checkpoints
+
+def test_resume(backend, failed):
+    # The completed stages are skipped and the playbook starts again at the task which failed.
+    deploy.deployChallenge(options(resume=True), failed)
+
+    assert not "instances.launch" in backend.counts and not "instance.state" in backend.counts
+    assert len(backend.runs) == 1 and backend.runs[0]["cmdline"] == "--start-at-task Configure"
+    assert all(deploy.ledger.checkpoints("local", "default", name)["finalize"]["status"] == "done" for name in ["web-1", "web-2"])
+
+def test_gone(backend, failed, capsys):
+    # An instance deleted since is deployed again from the start.
+    fake = backend.project()
+    fake.instances.remove(fake.instances._instances["web-2"])
+
+    deploy.deployChallenge(options(resume=True), failed)
+
+    assert "web-2: instance is gone, it is deployed again." in capsys.readouterr().out
+    assert backend.counts["instances.launch"] == 1
+    assert sorted(fake.instances._instances) == ["web-1", "web-2"]
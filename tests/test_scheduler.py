@@ -0,0 +1,33 @@
+import deploy
+
+def placement(**kwargs):
+    return deploy.Challenge.Placement(**kwargs)
+
+def config(name: str):
+    return deploy.Config(name=name, remote=["a", "b"], project="default")
+
+def test_policies(backend):
+    # a has 2 threads and b 8, both empty.
+    backend.remotes["a"].threads = 2
+
+    assert deploy.scheduler.choose(["a", "b"], "least-loaded", placement(), [config("web")]) == "b"
+
+    deploy.scheduler = deploy.Scheduler()
+    assert deploy.scheduler.choose(["a", "b"], "bin-pack", placement(), [config("web")]) == "a"
+
+    deploy.scheduler = deploy.Scheduler()
+    assert [deploy.scheduler.choose(["a", "b"], "spread", placement(), [config(f"web-{i}")]) for i in range(4)] == ["b", "a", "b", "a"]
+
+def test_placed_instances_count(backend):
+    # What a run places is added to the load it read, the second group goes to the other remote.
+    assert deploy.scheduler.choose(["a", "b"], "least-loaded", placement(), [config("web"), config("db")]) == "a"
+    assert deploy.scheduler.choose(["a", "b"], "least-loaded", placement(), [config("ctf")]) == "b"
+    assert deploy.scheduler.exists("a", "default", "db")
+
+def test_no_room(backend):
+    backend.remotes["a"].threads = 1
+    backend.remotes["b"].threads = 1
+
+    assert deploy.scheduler.choose(["a", "b"], "least-loaded", placement(max_instances_per_cpu=2), [config("web"), config("db")]) == "a"
+    assert deploy.scheduler.choose(["a", "b"], "least-loaded", placement(max_instances_per_cpu=2), [config("ctf"), config("pwn")]) == "b"
+    assert deploy.scheduler.choose(["a", "b"], "least-loaded", placement(max_instances_per_cpu=2), [config("web-2")]) is None
@@ -0,0 +1,38 @@
+import deploy
+
+from conftest import NETWORK
+
+def test_lookups(backend):
+    # Every lookup is a single round trip for the whole run, until it is invalidated.
+    backend.project().instances.launch("ubuntu/22.04", "web", network=NETWORK)
+    project = deploy.session.project("local", "default")
+
+    instances = [deploy.session.instance(project, "web") for _ in range(8)]
+
+    assert all(instance is instances[0] for instance in instances)
+    assert deploy.session.network(project, NETWORK) is deploy.session.network(project, NETWORK)
+    assert deploy.session.project("local", "default") is project
+    assert (backend.counts["instances.get"], deploy.session.hits) == (1, 9)
+
+    deploy.session.invalidate(project, instance="web")
+    deploy.session.instance(project, "web")
+
+    assert backend.counts["instances.get"] == 2
+
+def test_subnets(backend):
+    project = deploy.session.project("local", "default")
+    subnet4, subnet6 = deploy.session.networkSubnets(project, NETWORK)
+
+    assert (str(subnet4), subnet6) == ("10.20.0.0/29", None)
+
+def test_forget(backend):
+    # Remotes and projects stay resolved, anything else is looked up again.
+    backend.project().instances.launch("ubuntu/22.04", "web")
+    project = deploy.session.project("local", "default")
+    deploy.session.instance(project, "web")
+
+    deploy.session.forget()
+
+    assert deploy.session.project("local", "default") is project
+    deploy.session.instance(project, "web")
+    assert backend.counts["instances.get"] == 2
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import deploy
+
+from conftest import NETWORK, options, writeChallenge
+
+@pytest.fixture
+def traced(backend, tmp_path):
+    # Spans of a deployment of two instances.
+    path = writeChallenge(tmp_path / "web", "config:\n" + "".join(f"""
+  - name: web-{index}
+    remote: local
+    project: default
+    launch:
+      image: {{remote: images, name: ubuntu/22.04}}
+    network:
+      name: {NETWORK}
+""" for index in [1, 2]), inventory="all:\n  hosts:\n    web-1:\n    web-2:\n")
+
+    deploy.deployChallenge(options(), path)
+    return deploy.tracer
+
+def test_spans(traced):
+    # Stages are nested under their instance, the instances and the playbook under the challenge, and the incus
+    # calls and polls of a span are counted by the spans it is nested in too.
+    spans = {span["span_id"]: span for span in traced.spans}
+    challenge = next(span for span in spans.values() if span["name"] == "challenge")
+    launches = [span for span in spans.values() if span["name"] == "launch"]
+
+    assert challenge["attributes"]["challenge"] == "web" and challenge["status"] == "ok"
+    assert sorted(spans[span["parent_id"]]["attributes"]["instance"] for span in launches) == ["web-1", "web-2"]
+    assert all(spans[spans[span["parent_id"]]["parent_id"]] is challenge for span in launches)
+    waits = [span for span in spans.values() if span["name"] == "ip"]
+    assert len(waits) == 2 and all(span["polls"] > 0 for span in waits) and sum(span["incus_calls"] for span in waits) > 0
+    assert challenge["incus_calls"] >= sum(span["incus_calls"] for span in waits)
+    assert spans[next(span for span in spans.values() if span["name"] == "ansible")["parent_id"]]["name"] == "provision"
+
+def test_export(traced, tmp_path):
+    args = options(metrics=str(tmp_path / "spans.jsonl"), metricsPrometheus=str(tmp_path / "metrics.prom"), trace=str(tmp_path / "trace.json"))
+    traced.export(args)
+
+    with open(args.metrics) as f:
+        assert [json.loads(line)["name"] for line in f].count("launch") == 2
+
+    with open(args.metricsPrometheus) as f:
+        metrics = f.read()
+    assert '# TYPE ctf_deploy_phase_seconds_total counter' in metrics
+    assert 'ctf_deploy_phase_runs_total{phase="launch",challenge="web",instance="web-1"} 1' in metrics
+
+    with open(args.trace) as f:
+        spans = json.load(f)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len(spans) == len(traced.spans) and len(set(span["traceId"] for span in spans)) == 1
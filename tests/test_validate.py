@@ -0,0 +1,66 @@
+import os
+
+import deploy
+
+from conftest import writeChallenge
+
+CONFIG = """
+config:
+  name: {name}
+  remote: local
+  project: default
+  launch:
+    image: {{remote: images, name: ubuntu/22.04}}
+  network:
+    name: testnetwork
+    ipv4: {address}
+    listen_address: 45.45.148.200
+    forwards:
+      - {{source: {port}, destination: 80}}
+"""
+
+def test_inventory_hosts():
+    assert deploy.inventoryHosts("all:\n  hosts:\n    web:\n  children:\n    db:\n      hosts:\n        db1:\n") == {"web", "db1"}
+    assert deploy.inventoryHosts("web ansible_host=1.2.3.4\n[db]\ndb1\n[db:vars]\nuser=root\n") == {"web", "db1"}
+
+def test_cross_check(tmp_path):
+    facts = {}
+    for challenge, name, address, port in [("one", "web", "10.20.0.5", 8080), ("two", "db", "10.20.0.5", 8080), ("three", "web", "10.20.0.6", 8081)]:
+        challengePath = writeChallenge(tmp_path / challenge, CONFIG.format(name=name, address=address, port=port))
+        facts[challenge] = deploy.validateChallenge(challengePath)["facts"]
+
+    assert sorted(deploy.crossCheckChallenges(facts)) == [
+        "Address 10.20.0.5 on local:default/testnetwork is given to: one/web, two/db",
+        "Instance local:default/web is defined by: one, three",
+        "Listen port tcp/8080 on local 45.45.148.200 is forwarded by: one/web, two/db",
+    ]
+
+def test_cache(tmp_path, args, capsys, monkeypatch):
+    monkeypatch.setattr(deploy, "VALIDATE_CACHE_PATH", str(tmp_path / "cache" / "validate.json"))
+    web = writeChallenge(tmp_path / "web", CONFIG.format(name="web", address="10.20.0.5", port=8080))
+    db = writeChallenge(tmp_path / "db", CONFIG.format(name="db", address="10.20.0.6", port=8081), inventory="[all]\nweb\n")
+
+    assert deploy.validateChallenges(args, [web, db])
+    output = capsys.readouterr().out
+    assert f"OK     {web}\n" in output
+    assert "Warning: db is not a host of inventory." in output
+
+    # Only the edited challenge is validated again, its cached facts still take part in the cross checks.
+    writeChallenge(db, CONFIG.format(name="db", address="10.20.0.5", port=8081), inventory="[all]\ndb\n")
+    assert not deploy.validateChallenges(args, [web, db])
+    output = capsys.readouterr().out
+    assert f"OK     {web} (unchanged)" in output
+    assert f"OK     {db}\n" in output
+    assert "CONFLICT Address 10.20.0.5" in output
+
+    args.refresh = True
+    deploy.validateChallenges(args, [web, db])
+    assert not "(unchanged)" in capsys.readouterr().out
+
+def test_invalid_challenge(tmp_path, args, capsys, monkeypatch):
+    monkeypatch.setattr(deploy, "VALIDATE_CACHE_PATH", str(tmp_path / "validate.json"))
+    challengePath = writeChallenge(tmp_path / "web", "config:\n  name: web\n", challenge="hosts: all\n")
+    os.remove(os.path.join(challengePath, deploy.INVENTORY_FILE_NAME))
+
+    assert not deploy.validateChallenges(args, [challengePath])
+    assert f"Missing file: {os.path.join(challengePath, deploy.INVENTORY_FILE_NAME)}" in capsys.readouterr().out
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import deploy
+
+from conftest import NETWORK
+
+def test_shared_leases(backend):
+    # Instances waiting for their addresses on the same network share the polls of its leases, their state is
+    # never polled.
+    backend.dhcpDelay = 0.5
+    fake = backend.project()
+    for index in range(4):
+        fake.instances.launch("ubuntu/22.04", f"web-{index}", network=NETWORK)
+
+    project = deploy.session.project("local", "default")
+    instances = [deploy.session.instance(project, f"web-{index}") for index in range(4)]
+    backend.reset()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda instance: deploy.waitForIPAddresses(project, instance=instance, timeout=5), instances))
+
+    assert backend.counts.get("query.GET", 0) <= 5
+    assert not "instance.state" in backend.counts
+    assert len(set(instance.address for instance in fake.instances._instances.values())) == 4
+
+def test_unmanaged_network(backend):
+    # Without leases, the state of the instance is checked instead.
+    fake = backend.project()
+    fake.instances.launch("ubuntu/22.04", "web", network="incusbr0")
+    project = deploy.session.project("local", "default")
+    instance = deploy.session.instance(project, "web")
+
+    deploy.session.leases(project, "incusbr0").network = "missing"
+    deploy.waitForIPAddresses(project, instance=instance, timeout=5)
+
+    assert backend.counts["instance.state"] >= 1